@@ -0,0 +1,274 @@
+"""
+Benchmark pipeline tạo audio (process_script_to_audio_and_timings) với engine TTS giả lập, không cần mạng.
+
+Chạy từ thư mục server:
+    python -m benchmarks.audio_pipeline
+    python -m benchmarks.audio_pipeline --sizes 10,100 --engines edge_tts --effects on --json bench.json
+
+Mỗi kịch bản chạy trong một tiến trình riêng để peak RSS không bị ảnh hưởng bởi kịch bản trước.
+Các giai đoạn được đo bằng cách bọc hàm tương ứng trong audio_service:
+    synthesize      fetch_sentence_audio (cache + engine giả lập, chạy song song)
+    decode_effects  _decode_chunk (giải mã MP3, hiệu ứng theo câu, DSP)
+    encode          StreamingAudioAssembler / Mp3FrameWriter (add_chunk + close)
+    export          transcode_outputs (các định dạng phụ khi ghép MP3 trực tiếp)
+    finalize        _finish_timings
+"""
+import argparse
+import asyncio
+import contextlib
+import functools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+SIZES = [10, 100, 1000]
+ENGINES = ["gtts", "edge_tts"]
+LANGUAGES = {"gtts": "vietnamese", "edge_tts": "vi-vn"}
+# (speed, pitch, volume)
+EFFECTS = {
+    "off": (1.0, 1.0, 0.0),
+    "on": (1.2, 1.1, 3.0),
+}
+STAGES = ["synthesize", "decode_effects", "encode", "export", "finalize"]
+
+
+def _current_rss():
+    """RSS hiện tại (byte) của tiến trình"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return _peak_rss(resource.RUSAGE_SELF)
+
+
+def _peak_rss(who):
+    # ru_maxrss tính theo KB trên Linux và byte trên macOS
+    peak = resource.getrusage(who).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _children_cpu():
+    times = os.times()
+    return times.children_user + times.children_system
+
+
+class StageRecorder:
+    """Cộng dồn số lần gọi, thời gian, CPU và RSS cao nhất quan sát được cho từng giai đoạn"""
+
+    def __init__(self):
+        self.stats = {
+            stage: {"calls": 0, "first_start": None, "last_end": None, "busy_s": 0.0, "cpu_s": 0.0, "peak_rss": 0}
+            for stage in STAGES
+        }
+
+    def _record(self, stage, started, ended, cpu):
+        item = self.stats[stage]
+        item["calls"] += 1
+        item["first_start"] = started if item["first_start"] is None else min(item["first_start"], started)
+        item["last_end"] = ended if item["last_end"] is None else max(item["last_end"], ended)
+        item["busy_s"] += ended - started
+        if cpu is not None:
+            item["cpu_s"] += cpu
+        item["peak_rss"] = max(item["peak_rss"], _current_rss())
+
+    def wrap(self, stage, func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    # CPU của coroutine không tách được khỏi các coroutine khác trên cùng event loop
+                    self._record(stage, started, time.perf_counter(), None)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            cpu_started = time.thread_time() + _children_cpu()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                # Tiến trình ffmpeg con đã được wait trong lời gọi nên CPU của nó nằm trong children
+                cpu = time.thread_time() + _children_cpu() - cpu_started
+                self._record(stage, started, time.perf_counter(), cpu)
+        return wrapper
+
+    def report(self):
+        result = {}
+        for stage, item in self.stats.items():
+            if not item["calls"]:
+                continue
+            result[stage] = {
+                "calls": item["calls"],
+                # wall_s: từ lần gọi đầu tới lần kết thúc cuối; busy_s: tổng thời gian các lần gọi
+                "wall_s": round(item["last_end"] - item["first_start"], 4),
+                "busy_s": round(item["busy_s"], 4),
+                "cpu_s": round(item["cpu_s"], 4) if stage != "synthesize" else None,
+                "peak_rss_mb": round(item["peak_rss"] / 2**20, 1),
+            }
+        return result
+
+
+@contextlib.contextmanager
+def _instrument(recorder):
+    from services.audio import audio_service
+    from services.audio.mp3_frames import Mp3FrameWriter
+
+    patches = [
+        (audio_service, "fetch_sentence_audio", "synthesize"),
+        (audio_service, "_decode_chunk", "decode_effects"),
+        (audio_service.StreamingAudioAssembler, "add_chunk", "encode"),
+        (audio_service.StreamingAudioAssembler, "close", "encode"),
+        (Mp3FrameWriter, "add_chunk", "encode"),
+        (Mp3FrameWriter, "close", "encode"),
+        (audio_service, "transcode_outputs", "export"),
+        (audio_service, "_finish_timings", "finalize"),
+    ]
+    originals = [(owner, name, getattr(owner, name)) for owner, name, _ in patches]
+    for owner, name, stage in patches:
+        setattr(owner, name, recorder.wrap(stage, getattr(owner, name)))
+    try:
+        yield
+    finally:
+        for owner, name, original in originals:
+            setattr(owner, name, original)
+
+
+def run_scenario(size, engine, effects, latency_ms=0, max_workers=None, effects_mode=None):
+    """Chạy một kịch bản trong tiến trình hiện tại và trả về kết quả đo"""
+    from benchmarks.fake_tts import fake_engines, make_script
+    from services.audio import audio_service
+    from services.audio.tts_cache import tts_cache
+
+    # Đo pipeline thật sự, không để cache TTS trên đĩa làm sai lệch kết quả
+    tts_cache.enabled = False
+    speed, pitch, volume = EFFECTS[effects]
+    script = make_script(size)
+    recorder = StageRecorder()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        output_file = os.path.join(temp_dir, "bench.mp3")
+        kwargs = {"max_workers": max_workers}
+        if effects_mode:
+            kwargs["effects_mode"] = effects_mode
+
+        cpu_started = time.process_time() + _children_cpu()
+        started = time.perf_counter()
+        with fake_engines(latency_ms), _instrument(recorder), open(os.devnull, "w") as devnull:
+            with contextlib.redirect_stdout(devnull):
+                output, timings_string, failed = asyncio.run(audio_service.process_script_to_audio_and_timings(
+                    script,
+                    LANGUAGES[engine],
+                    engine=engine,
+                    speed=speed,
+                    pitch=pitch,
+                    volume=volume,
+                    output_file=output_file,
+                    **kwargs
+                ))
+        wall = time.perf_counter() - started
+        cpu = time.process_time() + _children_cpu() - cpu_started
+
+        if not output:
+            raise RuntimeError(f"Kịch bản {engine}/{size}/{effects} không tạo được audio: {failed}")
+        timings = json.loads(timings_string)
+        output_bytes = sum(
+            os.path.getsize(path) for path in audio_service.get_output_paths(output).values()
+        )
+
+    return {
+        "engine": engine,
+        "sentences": size,
+        "effects": effects,
+        "audio_seconds": timings[-1]["end_time"],
+        "failed": len(failed),
+        "output_bytes": output_bytes,
+        "wall_s": round(wall, 4),
+        "cpu_s": round(cpu, 4),
+        "peak_rss_mb": round(_peak_rss(resource.RUSAGE_SELF) / 2**20, 1),
+        "peak_rss_children_mb": round(_peak_rss(resource.RUSAGE_CHILDREN) / 2**20, 1),
+        "stages": recorder.report(),
+    }
+
+
+def _run_isolated(args):
+    # Tiến trình spawn mới cho mỗi kịch bản để ru_maxrss chỉ phản ánh kịch bản đó
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        return pool.apply(run_scenario, args)
+
+
+def _environment():
+    try:
+        ffmpeg_version = subprocess.run(
+            ["ffmpeg", "-version"], capture_output=True, text=True, check=True
+        ).stdout.splitlines()[0]
+    except (OSError, subprocess.CalledProcessError):
+        ffmpeg_version = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "ffmpeg": ffmpeg_version,
+    }
+
+
+def _print_table(results):
+    header = f"{'engine':<9} {'câu':>5} {'hiệu ứng':<8} {'audio(s)':>9} {'wall(s)':>8} {'cpu(s)':>8} {'rss(MB)':>8} {'ffmpeg rss':>10}"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        print(
+            f"{result['engine']:<9} {result['sentences']:>5} {result['effects']:<8} "
+            f"{result['audio_seconds']:>9.1f} {result['wall_s']:>8.2f} {result['cpu_s']:>8.2f} "
+            f"{result['peak_rss_mb']:>8.1f} {result['peak_rss_children_mb']:>10.1f}"
+        )
+        for stage, item in result["stages"].items():
+            cpu = f"{item['cpu_s']:.2f}s" if item["cpu_s"] is not None else "-"
+            print(
+                f"    {stage:<15} calls={item['calls']:<5} wall={item['wall_s']:.2f}s "
+                f"busy={item['busy_s']:.2f}s cpu={cpu} rss={item['peak_rss_mb']:.1f}MB"
+            )
+
+
+def _parse_list(value):
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark pipeline tạo audio với engine TTS giả lập")
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)), help="Số câu mỗi script, ví dụ 10,100,1000")
+    parser.add_argument("--engines", default=",".join(ENGINES), help="gtts, edge_tts")
+    parser.add_argument("--effects", default=",".join(EFFECTS), help="off, on")
+    parser.add_argument("--effects-mode", choices=["track", "chunk"], help="Mặc định theo AUDIO_EFFECTS_MODE")
+    parser.add_argument("--latency-ms", type=int, default=0, help="Độ trễ giả lập mỗi câu của engine")
+    parser.add_argument("--workers", type=int, help="Số câu tổng hợp đồng thời (mặc định theo TTS_MAX_WORKERS)")
+    parser.add_argument("--json", help="Ghi kết quả ra file JSON để so sánh giữa các phiên bản")
+    args = parser.parse_args(argv)
+
+    results = []
+    for engine in _parse_list(args.engines):
+        for effects in _parse_list(args.effects):
+            for size in map(int, _parse_list(args.sizes)):
+                print(f"Đang chạy {engine} / {size} câu / hiệu ứng {effects}...", file=sys.stderr)
+                results.append(_run_isolated(
+                    (size, engine, effects, args.latency_ms, args.workers, args.effects_mode)
+                ))
+
+    _print_table(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"environment": _environment(), "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"Đã ghi kết quả vào {args.json}")
+
+
+if __name__ == "__main__":
+    main()
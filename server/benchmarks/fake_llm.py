@@ -0,0 +1,88 @@
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Server HTTP giả lập Gemini (generateContent) và Cloudflare Workers AI (ai/run) chạy cục bộ,
+# có độ trễ, đuôi chậm và tỉ lệ lỗi cấu hình được. Trỏ GEMINI_BASE_URL / CLOUDFLARE_API_BASE_URL vào server.url.
+
+STUB_CAPTION = {"title": "Stub title", "description": "Stub description", "hashtags": ["#stub"]}
+
+
+class StubLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, name, latency_ms=0, slow_ms=0, slow_rate=0.0, error_rate=0.0, seed=0):
+        super().__init__(("127.0.0.1", 0), _StubHandler)
+        self.name = name
+        self.latency_ms = latency_ms
+        self.slow_ms = slow_ms
+        self.slow_rate = slow_rate
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def next_response(self):
+        """(độ trễ giây, có lỗi hay không) cho request tiếp theo"""
+        with self._lock:
+            self.requests += 1
+            slow = self._random.random() < self.slow_rate
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        return (self.slow_ms if slow else self.latency_ms) / 1000, failed
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        delay, failed = self.server.next_response()
+        if delay:
+            time.sleep(delay)
+        if failed:
+            self._send(500, {"error": {"code": 500, "message": f"{self.server.name} stub error", "status": "INTERNAL"}})
+        elif ":generateContent" in self.path:
+            config = body.get("generationConfig") or body.get("generation_config") or {}
+            structured = (config.get("responseMimeType") or config.get("response_mime_type")) == "application/json"
+            text = json.dumps(STUB_CAPTION) if structured else f"{self.server.name} stub response"
+            self._send(200, {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}]})
+        elif "/ai/run/" in self.path:
+            self._send(200, {"success": True, "result": {"response": f"{self.server.name} stub response"}})
+        else:
+            self._send(404, {"error": "not found"})
+
+    def _send(self, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # Client đã hủy request (hedging lấy kết quả khác, hết thời gian tối đa)
+            pass
+
+
+@contextmanager
+def stub_server(name, **behaviour):
+    """Chạy StubLLMServer trong luồng nền; behaviour: latency_ms, slow_ms, slow_rate, error_rate, seed"""
+    server = StubLLMServer(name, **behaviour)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
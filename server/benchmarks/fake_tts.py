@@ -0,0 +1,88 @@
+import asyncio
+import random
+import time
+from contextlib import contextmanager
+
+from services.audio import audio_service
+from services.audio.mp3_frames import parse_frame_header
+
+# Engine TTS giả lập chạy offline: trả về MP3 hợp lệ (frame im lặng) có độ dài giống giọng đọc thật
+
+SAMPLE_RATE = 24000
+SECONDS_PER_WORD = 0.32
+
+# Header MPEG-2 Layer III, 24 kHz, mono; edge-tts dùng 48 kbps, gTTS dùng 32 kbps
+_EDGE_HEADER = bytes([0xFF, 0xF3, 0x64, 0xC4])
+_GTTS_HEADER = bytes([0xFF, 0xF3, 0x44, 0xC4])
+
+_WORDS = (
+    "khoa học nghiên cứu tế bào năng lượng ánh sáng mặt trời phân tử nước không khí trái đất "
+    "vũ trụ hành tinh ngôi sao thiên hà nguyên tử điện tử hạt nhân phản ứng hóa học sinh vật "
+    "tiến hóa di truyền gen protein enzyme quang hợp hô hấp khí hậu đại dương núi lửa động đất"
+).split()
+
+
+def _frame(header):
+    length = parse_frame_header(header + bytes(4), 0)["frame_length"]
+    return header + bytes(length - len(header))
+
+
+_EDGE_FRAME = _frame(_EDGE_HEADER)
+_GTTS_FRAME = _frame(_GTTS_HEADER)
+# MPEG-2 Layer III: 576 sample mỗi frame
+_FRAME_SECONDS = 576 / SAMPLE_RATE
+
+
+def make_script(sentence_count, seed=0):
+    """Tạo script cố định (cùng seed cho cùng kết quả) gồm sentence_count câu 6-20 từ"""
+    rng = random.Random(seed * 100003 + sentence_count)
+    sentences = []
+    for _ in range(sentence_count):
+        words = [rng.choice(_WORDS) for _ in range(rng.randint(6, 20))]
+        sentences.append(" ".join(words).capitalize() + ".")
+    return " ".join(sentences)
+
+
+def speech_duration(sentence, speed=1.0):
+    return len(sentence.split()) * SECONDS_PER_WORD / speed
+
+
+def synthesize_mp3(sentence, frame, speed=1.0):
+    """MP3 im lặng có độ dài tương ứng số từ của câu"""
+    frame_count = max(1, round(speech_duration(sentence, speed) / _FRAME_SECONDS))
+    return frame * frame_count
+
+
+def word_boundaries(sentence, speed=1.0):
+    """Timings từng từ chia đều theo độ dài câu, giống sự kiện WordBoundary của edge-tts"""
+    words = sentence.split()
+    step = speech_duration(sentence, speed) / len(words)
+    return [
+        {"start_time": i * step, "end_time": (i + 1) * step, "content": word}
+        for i, word in enumerate(words)
+    ]
+
+
+@contextmanager
+def fake_engines(latency_ms=0):
+    """Thay hàm gọi gTTS/edge-tts bằng engine giả lập; latency_ms mô phỏng độ trễ mạng mỗi câu"""
+    original_gtts = audio_service._fetch_gtts_bytes
+    original_edge = audio_service._fetch_edge_tts_bytes
+
+    def fake_gtts(index, sentence, language_code):
+        if latency_ms:
+            time.sleep(latency_ms / 1000)
+        return synthesize_mp3(sentence, _GTTS_FRAME)
+
+    async def fake_edge(index, sentence, voice, speed=1.0, pitch=1.0):
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+        return synthesize_mp3(sentence, _EDGE_FRAME, speed), word_boundaries(sentence, speed)
+
+    audio_service._fetch_gtts_bytes = fake_gtts
+    audio_service._fetch_edge_tts_bytes = fake_edge
+    try:
+        yield
+    finally:
+        audio_service._fetch_gtts_bytes = original_gtts
+        audio_service._fetch_edge_tts_bytes = original_edge
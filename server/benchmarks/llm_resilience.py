@@ -0,0 +1,140 @@
+"""
+Kiểm tra lớp chịu lỗi Gemini → Llama (ngắt mạch, hedging, thời gian tối đa) với server LLM giả lập cục bộ, không cần mạng.
+
+Chạy từ thư mục server:
+    python -m benchmarks.llm_resilience
+    python -m benchmarks.llm_resilience --scenarios slow_tail,slow_tail_hedged --requests 200 --json llm.json
+
+Mỗi kịch bản chạy trong một tiến trình riêng vì cấu hình (config/llm.py) được đọc từ biến môi trường khi import.
+Các lời gọi đi qua create_title_with_gemini_async giống controller, cache kết quả LLM được tắt.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+
+from benchmarks.audio_pipeline import _parse_list
+from benchmarks.fake_llm import stub_server
+
+LLAMA = {"latency_ms": 400}
+
+# (hành vi server Gemini giả lập, biến môi trường bổ sung)
+SCENARIOS = {
+    "healthy": ({"latency_ms": 150}, {}),
+    "slow_tail": ({"latency_ms": 150, "slow_ms": 3000, "slow_rate": 0.1}, {}),
+    "slow_tail_hedged": (
+        {"latency_ms": 150, "slow_ms": 3000, "slow_rate": 0.1},
+        {"LLM_HEDGE_ENABLED": "true", "LLM_HEDGE_MIN_SAMPLES": "10", "LLM_HEDGE_MIN_DELAY": "0.2"},
+    ),
+    "gemini_down": ({"latency_ms": 500, "error_rate": 1.0}, {}),
+    "gemini_hang": ({"latency_ms": 5000}, {"LLM_GEMINI_DEADLINE": "1"}),
+}
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, round(q * len(values)) - 1))]
+
+
+def run_scenario(name, requests, concurrency):
+    """Chạy một kịch bản trong tiến trình hiện tại"""
+    gemini_behaviour, extra_env = SCENARIOS[name]
+    with stub_server("gemini", seed=1, **gemini_behaviour) as gemini, stub_server("llama", seed=2, **LLAMA) as llama:
+        os.environ.update({
+            "GOOGLE_API_KEY": "stub",
+            "CLOUDFLARE_ACCOUNT_ID": "stub",
+            "CLOUDFLARE_AUTH_TOKEN": "stub",
+            "GEMINI_BASE_URL": gemini.url,
+            "CLOUDFLARE_API_BASE_URL": llama.url,
+            "LLM_CACHE_ENABLED": "false",
+            **extra_env,
+        })
+        from services.content.script_service import create_title_with_gemini_async
+        from services.llm.gateway import llm_gateway
+        from config.llm import GEMINI_MODEL
+
+        latencies = []
+        answers = {"gemini": 0, "llama": 0, "default": 0}
+
+        async def one(index, semaphore):
+            async with semaphore:
+                started = time.perf_counter()
+                title = await create_title_with_gemini_async(f"topic {index}", 1, "vietnamese")
+                latencies.append(time.perf_counter() - started)
+                answers[next((provider for provider in ("gemini", "llama") if title.startswith(provider)), "default")] += 1
+
+        async def main():
+            semaphore = asyncio.Semaphore(concurrency)
+            await asyncio.gather(*[one(index, semaphore) for index in range(requests)])
+
+        started = time.perf_counter()
+        asyncio.run(main())
+        wall = time.perf_counter() - started
+        stats = llm_gateway.stats()
+
+        return {
+            "scenario": name,
+            "requests": requests,
+            "concurrency": concurrency,
+            "wall_s": round(wall, 3),
+            "p50_s": round(statistics.median(latencies), 3),
+            "p95_s": round(_percentile(latencies, 0.95), 3),
+            "max_s": round(max(latencies), 3),
+            "answers": answers,
+            "gemini_requests": gemini.requests,
+            "llama_requests": llama.requests,
+            "breaker": llm_gateway.breaker(GEMINI_MODEL).stats(),
+            "fallback": stats["fallback"],
+        }
+
+
+def _run_isolated(args):
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        return pool.apply(run_scenario, args)
+
+
+def _print_table(results):
+    header = (
+        f"{'kịch bản':<18} {'p50(s)':>7} {'p95(s)':>7} {'max(s)':>7} {'gemini':>7} {'llama':>6} "
+        f"{'mặc định':>9} {'req gemini':>11} {'hedge':>6} {'ngắt mạch':>10}"
+    )
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        answers = result["answers"]
+        print(
+            f"{result['scenario']:<18} {result['p50_s']:>7.3f} {result['p95_s']:>7.3f} {result['max_s']:>7.3f} "
+            f"{answers['gemini']:>7} {answers['llama']:>6} {answers['default']:>9} {result['gemini_requests']:>11} "
+            f"{result['fallback']['hedges']:>6} {result['breaker']['opened']:>10}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Kiểm tra ngắt mạch, hedging và thời gian tối đa của lời gọi LLM")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=", ".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=100, help="Số lời gọi mỗi kịch bản")
+    parser.add_argument("--concurrency", type=int, default=4, help="Số lời gọi chạy đồng thời")
+    parser.add_argument("--json", help="Ghi kết quả ra file JSON")
+    args = parser.parse_args(argv)
+
+    results = []
+    for name in _parse_list(args.scenarios):
+        if name not in SCENARIOS:
+            parser.error(f"Kịch bản không hợp lệ: {name}")
+        print(f"Đang chạy {name}...", file=sys.stderr)
+        results.append(_run_isolated((name, args.requests, args.concurrency)))
+
+    _print_table(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"Đã ghi kết quả vào {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+So sánh các engine nhận dạng giọng nói (STT_BACKEND) trên cùng một file âm thanh, báo cáo real-time factor.
+
+Chạy từ thư mục server:
+    python -m benchmarks.stt_backends
+    python -m benchmarks.stt_backends --backends whisper,faster_whisper --model small --audio lecture.mp3 --reference lecture.txt
+
+Mặc định đoạn văn SPEECH_TEXT (~30s giọng đọc tiếng Anh) được đọc bằng engine TTS (--tts-engine, cần mạng với
+gtts/edge_tts) ngay khi chạy, nên Whisper nhận dạng giọng nói thật thay vì bỏ qua tín hiệu không phải lời nói.
+Mỗi engine chạy trong một tiến trình riêng để thời gian nạp model và peak RSS không ảnh hưởng lẫn nhau.
+RTF = thời gian nhận dạng / độ dài âm thanh (nhỏ hơn 1 là nhanh hơn thời gian thực);
+WER = tỉ lệ lỗi từ so với văn bản gốc (SPEECH_TEXT hoặc file --reference), để so sánh cả chất lượng nhận dạng.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import re
+import statistics
+import sys
+import tempfile
+import time
+import wave
+
+import numpy as np
+
+from benchmarks.audio_pipeline import _environment, _parse_list, _peak_rss
+
+BACKENDS = ["whisper", "faster_whisper"]
+SAMPLE_RATE = 16000
+# Ngôn ngữ tiếng Anh theo cách đặt tên của từng engine TTS
+SPEECH_LANGUAGES = {"gtts": "english", "edge_tts": "en-us", "local": "english"}
+SPEECH_TEXT = (
+    "Photosynthesis is the process plants use to turn sunlight into chemical energy. "
+    "Inside the leaves, chlorophyll absorbs light and splits water into oxygen and hydrogen. "
+    "The plant then combines that hydrogen with carbon dioxide from the air to build sugar. "
+    "Oxygen leaves through tiny pores on the underside of each leaf. "
+    "Almost every living thing on Earth depends on this reaction for food. "
+    "Scientists still study it closely, hoping to copy it in artificial solar cells."
+)
+
+
+def synthesize_speech(engine, output_file):
+    """Đọc SPEECH_TEXT bằng engine TTS của ứng dụng, trả về đường dẫn file MP3"""
+    from services.audio.audio_service import process_script_to_audio_and_timings
+
+    output_file, _, failed = asyncio.run(process_script_to_audio_and_timings(
+        SPEECH_TEXT, SPEECH_LANGUAGES[engine], engine=engine, output_file=output_file
+    ))
+    if not output_file or failed:
+        raise RuntimeError(f"Không tạo được giọng đọc mẫu bằng {engine}")
+    return output_file
+
+
+def _words(text):
+    return re.findall(r"[\w']+", text.lower())
+
+
+def word_error_rate(reference, hypothesis):
+    """Số từ thay thế/xóa/chèn (khoảng cách Levenshtein theo từ) chia cho số từ của văn bản gốc"""
+    reference, hypothesis = _words(reference), _words(hypothesis)
+    previous = list(range(len(hypothesis) + 1))
+    for i, word in enumerate(reference, 1):
+        current = [i]
+        for j, other in enumerate(hypothesis, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (word != other)))
+        previous = current
+    return previous[-1] / max(1, len(reference))
+
+
+def _load_audio(path):
+    """WAV 16 kHz mono được đọc trực tiếp, định dạng khác được giải mã bằng ffmpeg như khi chạy thật"""
+    try:
+        with wave.open(path, "rb") as f:
+            if f.getframerate() == SAMPLE_RATE and f.getnchannels() == 1 and f.getsampwidth() == 2:
+                data = np.frombuffer(f.readframes(f.getnframes()), dtype=np.int16)
+                return data.astype(np.float32) / 32768.0
+    except wave.Error:
+        pass
+    from services.audio.speech_to_text_service import decode_for_whisper
+    return decode_for_whisper(path).reshape(-1)
+
+
+def run_backend(backend_name, model_name, audio_path, language=None, repeat=3, device=None, reference=None):
+    """Nạp model và nhận dạng audio_path repeat lần trong tiến trình hiện tại; reference: văn bản gốc để tính WER"""
+    from services.audio.stt_backends import get_backend
+
+    backend = get_backend(backend_name)
+    audio = _load_audio(audio_path)
+    duration = len(audio) / SAMPLE_RATE
+
+    started = time.perf_counter()
+    model = backend.load(model_name, device)
+    load_s = time.perf_counter() - started
+
+    runs = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = backend.transcribe(model, audio, language=language)
+        runs.append(time.perf_counter() - started)
+
+    return {
+        "backend": backend_name,
+        "model": model_name,
+        "audio_seconds": round(duration, 2),
+        "load_s": round(load_s, 3),
+        "transcribe_s": [round(run, 3) for run in runs],
+        "rtf_best": round(min(runs) / duration, 4),
+        "rtf_median": round(statistics.median(runs) / duration, 4),
+        "segments": len(result["segments"]),
+        "text": result["text"].strip(),
+        "wer": round(word_error_rate(reference, result["text"]), 4) if reference else None,
+        "peak_rss_mb": round(_peak_rss(resource.RUSAGE_SELF) / 2**20, 1),
+    }
+
+
+def _run_isolated(args):
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        return pool.apply(run_backend, args)
+
+
+def _print_table(results):
+    header = (
+        f"{'engine':<15} {'model':<10} {'audio(s)':>9} {'nạp(s)':>8} {'RTF tốt nhất':>13} {'RTF trung vị':>13} "
+        f"{'WER':>7} {'rss(MB)':>8}"
+    )
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        print(
+            f"{result['backend']:<15} {result['model']:<10} {result['audio_seconds']:>9.1f} {result['load_s']:>8.2f} "
+            f"{result['rtf_best']:>13.3f} {result['rtf_median']:>13.3f} "
+            f"{'-' if result['wer'] is None else format(result['wer'], '.3f'):>7} {result['peak_rss_mb']:>8.1f}"
+        )
+        print(f"    {result['segments']} đoạn: {result['text'][:100]}")
+
+
+def main(argv=None):
+    from config.audio import WHISPER_MODEL, WHISPER_DEVICE
+
+    parser = argparse.ArgumentParser(description="So sánh tốc độ các engine nhận dạng giọng nói")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="whisper, faster_whisper")
+    parser.add_argument("--model", default=WHISPER_MODEL, help="Kích thước model (tiny, base, small...)")
+    parser.add_argument("--audio", help="File âm thanh cần nhận dạng; để trống để đọc SPEECH_TEXT bằng --tts-engine")
+    parser.add_argument("--reference", help="File văn bản gốc của --audio để tính WER")
+    parser.add_argument("--tts-engine", default="edge_tts", choices=sorted(SPEECH_LANGUAGES), help="Engine đọc SPEECH_TEXT")
+    parser.add_argument("--language", default="en", help="Mã ngôn ngữ Whisper; để trống để tự nhận diện")
+    parser.add_argument("--repeat", type=int, default=3, help="Số lần nhận dạng mỗi engine (sau khi nạp model)")
+    parser.add_argument("--json", help="Ghi kết quả ra file JSON để so sánh giữa các phiên bản")
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="stt_bench_") as temp_dir:
+        if args.audio:
+            audio = args.audio
+            reference = None
+            if args.reference:
+                with open(args.reference, encoding="utf-8") as f:
+                    reference = f.read()
+        else:
+            print(f"Đang tạo giọng đọc mẫu bằng {args.tts_engine}...", file=sys.stderr)
+            audio = synthesize_speech(args.tts_engine, os.path.join(temp_dir, "speech_sample.mp3"))
+            reference = SPEECH_TEXT
+
+        for backend in _parse_list(args.backends):
+            print(f"Đang chạy {backend} / {args.model}...", file=sys.stderr)
+            try:
+                results.append(_run_isolated(
+                    (backend, args.model, audio, args.language or None, args.repeat, WHISPER_DEVICE, reference)
+                ))
+            except ImportError as e:
+                # Engine chưa được cài: bỏ qua thay vì dừng cả benchmark
+                print(f"Bỏ qua {backend}: {e}", file=sys.stderr)
+
+    _print_table(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"environment": _environment(), "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"Đã ghi kết quả vào {args.json}")
+
+
+if __name__ == "__main__":
+    main()
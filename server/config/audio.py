@@ -0,0 +1,127 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Thư mục server: đường dẫn tương đối trong cấu hình được tính từ đây, không phụ thuộc thư mục chạy lệnh
+SERVER_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Số câu được tổng hợp đồng thời tối đa cho mỗi engine TTS
+TTS_MAX_WORKERS = {
+    "gtts": int(os.getenv("GTTS_MAX_WORKERS", "4")),
+    "edge_tts": int(os.getenv("EDGE_TTS_MAX_WORKERS", "8")),
+    # Với engine local đây là số tiến trình Piper chạy đồng thời, mỗi tiến trình xử lý một lô câu
+    "local": int(os.getenv("LOCAL_TTS_MAX_WORKERS", "2")),
+}
+
+# Engine TTS cục bộ (Piper, giọng ONNX chạy trên CPU)
+LOCAL_TTS_BINARY = os.getenv("LOCAL_TTS_BINARY", "piper")
+LOCAL_TTS_VOICES_DIR = os.path.join(SERVER_ROOT, os.getenv("LOCAL_TTS_VOICES_DIR", "piper_voices"))
+# Số câu được tổng hợp trong một lần gọi Piper
+LOCAL_TTS_BATCH_SIZE = int(os.getenv("LOCAL_TTS_BATCH_SIZE", "16"))
+LOCAL_TTS_TIMEOUT = int(os.getenv("LOCAL_TTS_TIMEOUT", "300"))
+
+# Độ dài (ký tự) của mỗi chunk gửi tới engine TTS: câu dài hơn TTS_CHUNK_MAX_CHARS được chia theo mệnh đề.
+# TTS_CHUNK_MIN_CHARS > 0 bật gộp các câu ngắn hơn mức này: ít lời gọi TTS hơn, nhưng chunk gộp được cache
+# như một đơn vị (sửa một câu phải tổng hợp lại cả chunk) và không có khoảng nghỉ AUDIO_SENTENCE_PAUSE_MS
+# giữa các câu trong chunk. Mặc định 0: không gộp, cache và khoảng nghỉ theo từng câu.
+TTS_CHUNK_MIN_CHARS = int(os.getenv("TTS_CHUNK_MIN_CHARS", "0"))
+TTS_CHUNK_MAX_CHARS = int(os.getenv("TTS_CHUNK_MAX_CHARS", "300"))
+
+# Cache âm thanh TTS theo câu trên đĩa
+TTS_CACHE_ENABLED = os.getenv("TTS_CACHE_ENABLED", "true").lower() == "true"
+TTS_CACHE_DIR = os.path.join(SERVER_ROOT, os.getenv("TTS_CACHE_DIR", "tts_cache"))
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Chế độ áp dụng hiệu ứng: "track" (một lần ffmpeg cho cả track) hoặc "chunk" (từng câu)
+AUDIO_EFFECTS_MODE = os.getenv("AUDIO_EFFECTS_MODE", "track")
+
+# Xử lý tín hiệu trên NumPy: cắt khoảng lặng đầu/cuối câu, khoảng nghỉ cố định giữa các câu, chuẩn hóa độ to
+AUDIO_TRIM_SILENCE = os.getenv("AUDIO_TRIM_SILENCE", "false").lower() == "true"
+AUDIO_SILENCE_THRESHOLD_DB = float(os.getenv("AUDIO_SILENCE_THRESHOLD_DB", "-45"))
+AUDIO_SENTENCE_PAUSE_MS = int(os.getenv("AUDIO_SENTENCE_PAUSE_MS", "0"))
+# Độ to mục tiêu (dBFS) cho mỗi câu, để trống để tắt
+AUDIO_NORMALIZE_DBFS = float(os.getenv("AUDIO_NORMALIZE_DBFS")) if os.getenv("AUDIO_NORMALIZE_DBFS") else None
+
+# Hồ sơ mã hóa đầu ra cho giọng nói: mono, 24 kHz, bitrate thấp.
+# Khi không có hiệu ứng cục bộ, MP3 được ghép thẳng từ frame của engine TTS chỉ khi MP3 đó khớp hồ sơ mp3
+# (cùng sample rate, số kênh và AUDIO_MP3_BITRATE). Mặc định AUDIO_MP3_BITRATE để trống: giữ bitrate của nguồn
+# (edge-tts 48k, gTTS 32k) nên track được ghép không mất chất lượng; đặt giá trị khác thì mọi track bị giải mã
+# và mã hóa lại. AUDIO_MP3_ENCODE_BITRATE là bitrate khi MP3 phải mã hóa lại mà AUDIO_MP3_BITRATE để trống.
+AUDIO_OUTPUT_SAMPLE_RATE = int(os.getenv("AUDIO_OUTPUT_SAMPLE_RATE", "24000"))
+AUDIO_OUTPUT_CHANNELS = int(os.getenv("AUDIO_OUTPUT_CHANNELS", "1"))
+AUDIO_OUTPUT_PROFILES = {
+    "mp3": {
+        "extension": "mp3",
+        "format": "mp3",
+        "codec": "libmp3lame",
+        "bitrate": os.getenv("AUDIO_MP3_BITRATE", ""),
+        "encode_bitrate": os.getenv("AUDIO_MP3_ENCODE_BITRATE", "48k"),
+        "content_type": "audio/mpeg",
+    },
+    "opus": {
+        "extension": "ogg",
+        "format": "ogg",
+        "codec": "libopus",
+        "bitrate": os.getenv("AUDIO_OPUS_BITRATE", "32k"),
+        "content_type": "audio/ogg",
+    },
+    "webm": {
+        "extension": "webm",
+        "format": "webm",
+        "codec": "libopus",
+        "bitrate": os.getenv("AUDIO_OPUS_BITRATE", "32k"),
+        "content_type": "audio/webm",
+    },
+    "aac": {
+        "extension": "m4a",
+        "format": "ipod",
+        "codec": "aac",
+        "bitrate": os.getenv("AUDIO_AAC_BITRATE", "48k"),
+        "content_type": "audio/mp4",
+    },
+}
+# Cập nhật tăng dần phải giải mã và mã hóa lại track cũ khi có hiệu ứng cục bộ hoặc DSP (mỗi lần mất thêm chất lượng):
+# sau số lần này, lần cập nhật tiếp theo tạo lại toàn bộ track (các câu không đổi vẫn lấy từ cache TTS)
+AUDIO_INCREMENTAL_MAX_REENCODES = int(os.getenv("AUDIO_INCREMENTAL_MAX_REENCODES", "3"))
+# Các định dạng được xuất trong một lần tạo, định dạng đầu tiên là bản chính (audio_url)
+AUDIO_OUTPUT_FORMATS = [
+    name for name in (item.strip() for item in os.getenv("AUDIO_OUTPUT_FORMATS", "mp3").split(","))
+    if name in AUDIO_OUTPUT_PROFILES
+] or ["mp3"]
+
+# Nhận dạng giọng nói (Whisper): model mặc định, các model nạp sẵn khi khởi động, số bản sao mỗi model
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "base")
+WHISPER_PRELOAD_MODELS = [name.strip() for name in os.getenv("WHISPER_PRELOAD_MODELS", "").split(",") if name.strip()]
+WHISPER_POOL_SIZE = int(os.getenv("WHISPER_POOL_SIZE", "1"))
+# Để trống để Whisper tự chọn (cuda nếu có, ngược lại cpu)
+WHISPER_DEVICE = os.getenv("WHISPER_DEVICE") or None
+# Engine nhận dạng: "whisper" (openai-whisper, fp32) hoặc "faster_whisper" (CTranslate2, lượng tử hóa int8 trên CPU)
+STT_BACKEND = os.getenv("STT_BACKEND", "whisper")
+# Để trống để dùng mặc định của engine (whisper: greedy, faster_whisper: 5)
+STT_BEAM_SIZE = int(os.getenv("STT_BEAM_SIZE")) if os.getenv("STT_BEAM_SIZE") else None
+STT_COMPUTE_TYPE = os.getenv("STT_COMPUTE_TYPE", "int8")
+# 0 để CTranslate2 tự chọn số luồng
+STT_CPU_THREADS = int(os.getenv("STT_CPU_THREADS", "0"))
+# Bản ghi dài hơn STT_LONG_FORM_SECONDS được cắt tại khoảng lặng thành các cửa sổ <= STT_WINDOW_SECONDS
+# và nhận dạng song song trên STT_WORKERS tiến trình (0 để tắt chế độ này).
+# Mỗi tiến trình giữ một bản model riêng trong RAM nên mặc định chỉ dùng tối đa 2 tiến trình
+STT_LONG_FORM_SECONDS = float(os.getenv("STT_LONG_FORM_SECONDS", "600"))
+STT_WINDOW_SECONDS = float(os.getenv("STT_WINDOW_SECONDS", "300"))
+STT_WORKERS = int(os.getenv("STT_WORKERS") or min(2, os.cpu_count() or 1))
+# Sửa chính tả kết quả nhận dạng bằng Gemini theo lô: mỗi lần gọi tối đa STT_CORRECTION_BATCH_SEGMENTS đoạn
+# và STT_CORRECTION_BATCH_CHARS ký tự để phản hồi không vượt giới hạn token đầu ra; tối đa STT_CORRECTION_CONCURRENCY
+# lời gọi đồng thời (cả các lô và các đoạn phải sửa lại riêng lẻ)
+STT_CORRECTION_BATCH_SEGMENTS = int(os.getenv("STT_CORRECTION_BATCH_SEGMENTS", "100"))
+STT_CORRECTION_BATCH_CHARS = int(os.getenv("STT_CORRECTION_BATCH_CHARS", "6000"))
+STT_CORRECTION_CONCURRENCY = int(os.getenv("STT_CORRECTION_CONCURRENCY", "4"))
+# Job nhận dạng trực tuyến với openai-whisper: độ dài mỗi cửa sổ gửi kết quả về client
+STT_STREAM_WINDOW_SECONDS = float(os.getenv("STT_STREAM_WINDOW_SECONDS", "30"))
+# Thời gian giữ kết quả của job nhận dạng đã kết thúc trong bộ nhớ
+STT_JOB_TTL_SECONDS = int(os.getenv("STT_JOB_TTL_SECONDS", "3600"))
+# Cache kết quả nhận dạng trong MongoDB: thời gian sống và số mục tối đa (mục ít dùng nhất bị xóa trước)
+STT_CACHE_ENABLED = os.getenv("STT_CACHE_ENABLED", "true").lower() == "true"
+STT_CACHE_TTL_SECONDS = int(os.getenv("STT_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+STT_CACHE_MAX_ENTRIES = int(os.getenv("STT_CACHE_MAX_ENTRIES", "1000"))
+# Số lần ghi cache giữa hai lần dọn các mục vượt STT_CACHE_MAX_ENTRIES (số mục có thể vượt tạm thời tới mức này)
+STT_CACHE_EVICT_INTERVAL = int(os.getenv("STT_CACHE_EVICT_INTERVAL", "50"))
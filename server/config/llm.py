@@ -0,0 +1,41 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Gemini: model mặc định, số client dùng chung (mỗi client giữ pool kết nối riêng), timeout mỗi request
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+LLM_GEMINI_POOL_SIZE = int(os.getenv("LLM_GEMINI_POOL_SIZE", "4"))
+LLM_GEMINI_TIMEOUT = float(os.getenv("LLM_GEMINI_TIMEOUT", "60"))
+
+# Llama trên Cloudflare Workers AI (dự phòng khi Gemini lỗi): giữ kết nối keep-alive qua requests.Session
+CLOUDFLARE_LLAMA_MODEL = os.getenv("CLOUDFLARE_LLAMA_MODEL", "@cf/meta/llama-4-scout-17b-16e-instruct")
+LLM_HTTP_POOL_SIZE = int(os.getenv("LLM_HTTP_POOL_SIZE", "10"))
+LLM_HTTP_TIMEOUT = float(os.getenv("LLM_HTTP_TIMEOUT", "60"))
+
+# Cache kết quả LLM trong bộ nhớ (kịch bản, tiêu đề, mô tả, caption, nội dung minh họa) theo tham số đã chuẩn hóa
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", "86400"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Địa chỉ API (để trống dùng mặc định); đổi sang server giả lập khi kiểm thử, ví dụ http://127.0.0.1:8081
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL", "")
+CLOUDFLARE_API_BASE_URL = os.getenv("CLOUDFLARE_API_BASE_URL", "https://api.cloudflare.com/client/v4")
+
+# Thời gian tối đa cho mỗi lời gọi async tới từng nhà cung cấp (giây, 0: chỉ dùng timeout của kết nối)
+LLM_GEMINI_DEADLINE = float(os.getenv("LLM_GEMINI_DEADLINE", "30"))
+LLM_LLAMA_DEADLINE = float(os.getenv("LLM_LLAMA_DEADLINE", "30"))
+
+# Ngắt mạch Gemini: khi tỉ lệ lỗi của LLM_BREAKER_WINDOW lần gọi gần nhất >= LLM_BREAKER_ERROR_RATE
+# (cần ít nhất LLM_BREAKER_MIN_CALLS lần) thì chuyển thẳng sang Llama trong LLM_BREAKER_COOLDOWN_SECONDS giây
+LLM_BREAKER_WINDOW = int(os.getenv("LLM_BREAKER_WINDOW", "20"))
+LLM_BREAKER_ERROR_RATE = float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5"))
+LLM_BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", "5"))
+LLM_BREAKER_COOLDOWN_SECONDS = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", "30"))
+
+# Hedging: nếu Gemini chưa trả lời sau phân vị LLM_HEDGE_QUANTILE của độ trễ gần đây (tối thiểu LLM_HEDGE_MIN_DELAY giây)
+# thì gọi thêm Llama và lấy kết quả đến trước; cần ít nhất LLM_HEDGE_MIN_SAMPLES mẫu độ trễ
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1.0"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
@@ -1,164 +1,341 @@
-from services.audio.audio_service import process_script_to_audio_and_timings
-from services.audio.speech_to_text_service import analyze_audio
-from services.storage.storage_service import upload_to_r2, delete_from_r2
+from services.audio.audio_service import process_script_to_audio_and_timings, regenerate_audio_incrementally, iter_script_audio, get_output_paths, remove_outputs, transcode_outputs, EDGE_TTS_VOICES, LOCAL_TTS_VOICES
+from config.audio import AUDIO_OUTPUT_PROFILES, AUDIO_INCREMENTAL_MAX_REENCODES
+from services.audio.speech_to_text_service import lookup_transcription_async, transcribe_and_cache_async, decode_for_whisper
+from services.audio.transcription_jobs import transcription_jobs
+from services.storage.storage_service import upload_to_r2, delete_from_r2, download_from_r2
 from controllers.script_controller import ScriptController
 from models.models import Audio, Script, Workspace
 import os
+import shutil
 import tempfile
-from pydub import AudioSegment
 import json  # Thêm dòng này vào đầu file
+import base64
+import asyncio
+import threading
 
 from datetime import datetime
 from models.models import Audio, Script, Workspace
 
+# Dictionary ánh xạ tên ngôn ngữ sang locale edge-tts
+EDGE_TTS_LANGUAGE_MAP = {
+    "afrikaans": "af-za",
+    "arabic": "ar-sa",
+    "bengali": "bn-bd",
+    "bulgarian": "bg-bg",
+    "catalan": "ca-es",
+    "chinese": "zh-cn",
+    "croatian": "hr-hr",
+    "czech": "cs-cz",
+    "danish": "da-dk",
+    "dutch": "nl-nl",
+    "english": "en-us",
+    "estonian": "et-ee",
+    "finnish": "fi-fi",
+    "french": "fr-fr",
+    "german": "de-de",
+    "greek": "el-gr",
+    "gujarati": "gu-in",
+    "hindi": "hi-in",
+    "hungarian": "hu-hu",
+    "icelandic": "is-is",
+    "indonesian": "id-id",
+    "italian": "it-it",
+    "japanese": "ja-jp",
+    "korean": "ko-kr",
+    "latvian": "lv-lv",
+    "lithuanian": "lt-lt",
+    "malay": "ms-my",
+    "malayalam": "ml-in",
+    "norwegian": "nb-no",
+    "polish": "pl-pl",
+    "portuguese": "pt-br",
+    "romanian": "ro-ro",
+    "russian": "ru-ru",
+    "serbian": "sr-rs",
+    "slovak": "sk-sk",
+    "slovenian": "sl-si",
+    "spanish": "es-es",
+    "swahili": "sw-ke",
+    "swedish": "sv-se",
+    "tamil": "ta-in",
+    "telugu": "te-in",
+    "thai": "th-th",
+    "turkish": "tr-tr",
+    "ukrainian": "uk-ua",
+    "urdu": "ur-pk",
+    "vietnamese": "vi-vn",
+    "welsh": "cy-gb",
+}
+
 class AudioController:
     @staticmethod
-    async def generate_audio(script_id, engine="gtts", gender="female", speed=1.0, pitch=1.0, volume=0.0):
+    def _resolve_language(script, engine):
+        """Lấy ngôn ngữ của script, ánh xạ sang locale edge-tts nếu cần"""
+        language = script.language.lower()
+        if engine == "edge_tts":
+            language = EDGE_TTS_LANGUAGE_MAP.get(language, language)
+            # Kiểm tra xem locale có được hỗ trợ bởi edge-tts không
+            if language not in EDGE_TTS_VOICES:
+                raise Exception(f"Ngôn ngữ '{language}' không được edge-tts hỗ trợ")
+        elif engine == "local" and language not in LOCAL_TTS_VOICES:
+            raise Exception(f"Ngôn ngữ '{language}' chưa có giọng TTS cục bộ")
+        return language
+
+    @staticmethod
+    def _audio_urls(audio):
+        """URL của mọi định dạng đã lưu cho audio (bản ghi cũ chỉ có audio_url MP3)"""
+        urls = json.loads(audio.audio_urls) if audio.audio_urls else {}
+        return urls or {"mp3": audio.audio_url}
+
+    @staticmethod
+    async def _upload_outputs(output_file, workspace_id, title):
+        """Upload file của mọi định dạng đã xuất, trả về {định dạng: url} (định dạng đầu tiên là bản chính)"""
+        audio_urls = {}
+        for name, path in get_output_paths(output_file).items():
+            profile = AUDIO_OUTPUT_PROFILES[name]
+            file_name = f"audios/{workspace_id}/{title.replace(' ', '_')}.{profile['extension']}"
+            audio_urls[name] = await upload_to_r2(path, file_name, content_type=profile["content_type"])
+        return audio_urls
+
+    @staticmethod
+    async def _save_audio(script, output_file, timings_string, settings, reencodes=0):
+        """Upload file audio của mọi định dạng đã tạo và lưu bản ghi Audio (audio_url là định dạng chính)"""
+        audio_urls = await AudioController._upload_outputs(output_file, script.workspace_id.id, script.title)
+
+        audio = Audio(
+            workspace_id=script.workspace_id,
+            script_id=script,
+            audio_url=next(iter(audio_urls.values())),
+            audio_urls=json.dumps(audio_urls),
+            timings=timings_string,
+            status="completed",
+            settings=json.dumps(settings),
+            reencodes=reencodes
+        )
+        audio.save()
+        return audio
+
+    @staticmethod
+    async def _delete_audio_files(audio, keep=()):
+        """Xóa file của mọi định dạng của audio, trừ các URL trong keep (file mới cùng tên đã ghi đè lên)"""
+        urls = set(AudioController._audio_urls(audio).values()) | {audio.audio_url}
+        for url in urls - set(keep):
+            if url:
+                await delete_from_r2(url)
+
+    @staticmethod
+    async def _delete_replaced_audio(old_audio, new_audio):
+        """Xóa bản ghi audio cũ và file của mọi định dạng của nó sau khi audio mới đã được lưu"""
         try:
-            # Dictionary ánh xạ mã ngôn ngữ ngắn sang locale edge-tts
-            language_map = {
-                "afrikaans": "af-za",
-                "arabic": "ar-sa",
-                "bengali": "bn-bd",
-                "bulgarian": "bg-bg",
-                "catalan": "ca-es",
-                "chinese": "zh-cn",
-                "croatian": "hr-hr",
-                "czech": "cs-cz",
-                "danish": "da-dk",
-                "dutch": "nl-nl",
-                "english": "en-us",
-                "estonian": "et-ee",
-                "finnish": "fi-fi",
-                "french": "fr-fr",
-                "german": "de-de",
-                "greek": "el-gr",
-                "gujarati": "gu-in",
-                "hindi": "hi-in",
-                "hungarian": "hu-hu",
-                "icelandic": "is-is",
-                "indonesian": "id-id",
-                "italian": "it-it",
-                "japanese": "ja-jp",
-                "korean": "ko-kr",
-                "latvian": "lv-lv",
-                "lithuanian": "lt-lt",
-                "malay": "ms-my",
-                "malayalam": "ml-in",
-                "norwegian": "nb-no",
-                "polish": "pl-pl",
-                "portuguese": "pt-br",
-                "romanian": "ro-ro",
-                "russian": "ru-ru",
-                "serbian": "sr-rs",
-                "slovak": "sk-sk",
-                "slovenian": "sl-si",
-                "spanish": "es-es",
-                "swahili": "sw-ke",
-                "swedish": "sv-se",
-                "tamil": "ta-in",
-                "telugu": "te-in",
-                "thai": "th-th",
-                "turkish": "tr-tr",
-                "ukrainian": "uk-ua",
-                "urdu": "ur-pk",
-                "vietnamese": "vi-vn",
-                "welsh": "cy-gb",
-            }
+            await AudioController._delete_audio_files(old_audio, AudioController._audio_urls(new_audio).values())
+            old_audio.delete()
+        except Exception as e:
+            print(f"Không xóa được audio cũ {old_audio.id}: {e}")
 
+    @staticmethod
+    async def generate_audio(script_id, engine="gtts", gender="female", speed=1.0, pitch=1.0, volume=0.0, incremental=False):
+        try:
             # Get script
             script = Script.objects(id=script_id).first()
             if not script:
                 raise Exception("Script not found")
             
             # Map language to edge-tts locale if needed
-            language = script.language.lower()
-            if engine == "edge_tts":
-                language = language_map.get(language, language)
-                # Kiểm tra xem locale có được hỗ trợ bởi edge-tts không
-                supported_locales = [
-                    "af-za", "sq-al", "am-et", "ar-dz", "ar-bh", "ar-eg", "ar-iq", "ar-jo", "ar-kw",
-                    "ar-lb", "ar-ly", "ar-ma", "ar-om", "ar-qa", "ar-sa", "ar-sy", "ar-tn", "ar-ae",
-                    "ar-ye", "az-az", "bn-bd", "bn-in", "bs-ba", "bg-bg", "my-mm", "ca-es", "zh-hk",
-                    "zh-cn", "zh-cn-liaoning", "zh-tw", "zh-cn-shaanxi", "hr-hr", "cs-cz", "da-dk",
-                    "nl-be", "nl-nl", "en-au", "en-ca", "en-hk", "en-in", "en-ie", "en-ke", "en-nz",
-                    "en-ng", "en-ph", "en-sg", "en-za", "en-tz", "en-gb", "en-us", "et-ee", "fil-ph",
-                    "fi-fi", "fr-be", "fr-ca", "fr-fr", "fr-ch", "gl-es", "ka-ge", "de-at", "de-de",
-                    "de-ch", "el-gr", "gu-in", "he-il", "hi-in", "hu-hu", "is-is", "id-id", "ga-ie",
-                    "it-it", "ja-jp", "jv-id", "kn-in", "kk-kz", "km-kh", "ko-kr", "lo-la", "lv-lv",
-                    "lt-lt", "mk-mk", "ms-my", "ml-in", "mt-mt", "mr-in", "mn-mn", "ne-np", "nb-no",
-                    "ps-af", "fa-ir", "pl-pl", "pt-br", "pt-pt", "ro-ro", "ru-ru", "sr-rs", "si-lk",
-                    "sk-sk", "sl-si", "so-so", "es-ar", "es-bo", "es-cl", "es-co", "es-cr", "es-cu",
-                    "es-do", "es-ec", "es-sv", "es-gq", "es-gt", "es-hn", "es-mx", "es-ni", "es-pa",
-                    "es-py", "es-pe", "es-pr", "es-es", "es-us", "es-uy", "es-ve", "su-id", "sw-ke",
-                    "sw-tz", "sv-se", "ta-in", "ta-my", "ta-sg", "ta-lk", "te-in", "th-th", "tr-tr",
-                    "uk-ua", "ur-in", "ur-pk", "uz-uz", "vi-vn", "cy-gb", "zu-za"
-                ]
-                if language not in supported_locales:
-                    raise Exception(f"Ngôn ngữ '{language}' không được edge-tts hỗ trợ")
+            language = AudioController._resolve_language(script, engine)
                 
+            settings = {
+                "engine": engine,
+                "gender": gender,
+                "speed": speed,
+                "pitch": pitch,
+                "volume": volume,
+                "language": language
+            }
+
             existing_audio = Audio.objects(workspace_id=script.workspace_id, script_id=script).first()
-            if existing_audio:
-                await delete_from_r2(existing_audio.audio_url)
-                existing_audio.delete()
 
+            # Chỉ tổng hợp lại các câu đã sửa nếu audio cũ được tạo với cùng cài đặt giọng
+            old_audio_data = None
+            old_timings = None
+            old_reencodes = (existing_audio.reencodes or 0) if existing_audio else 0
+            if incremental and existing_audio and existing_audio.settings and json.loads(existing_audio.settings) == settings:
+                if old_reencodes >= AUDIO_INCREMENTAL_MAX_REENCODES:
+                    print(f"Track cũ đã bị mã hóa lại {old_reencodes} lần, tạo lại toàn bộ")
+                else:
+                    try:
+                        # Ưu tiên bản MP3 để các câu cũ được chép nguyên frame nếu có thể
+                        old_audio_urls = AudioController._audio_urls(existing_audio)
+                        old_audio_data = await download_from_r2(old_audio_urls.get("mp3", existing_audio.audio_url))
+                        old_timings = json.loads(existing_audio.timings)
+                    except Exception as e:
+                        print(f"Không tải được audio cũ, tạo lại toàn bộ: {e}")
+                        old_audio_data = None
 
             # Generate audio and timing
             temp_file = f"temp_{script.title.replace(' ', '_')}.mp3"
-            output_file, timings_string = await process_script_to_audio_and_timings(
-                script.generated_script,
-                language,
-                engine=engine,
-                gender=gender,
-                speed=speed,
-                pitch=pitch,
-                volume=volume,
-                output_file=temp_file
-            )
+            reencodes = 0
+            if old_audio_data:
+                output_file, timings_string, failed, reencoded = await regenerate_audio_incrementally(
+                    script.generated_script,
+                    old_audio_data,
+                    old_timings,
+                    language,
+                    engine=engine,
+                    gender=gender,
+                    speed=speed,
+                    pitch=pitch,
+                    volume=volume,
+                    output_file=temp_file
+                )
+                reencodes = old_reencodes + 1 if reencoded else old_reencodes
+            else:
+                output_file, timings_string, failed = await process_script_to_audio_and_timings(
+                    script.generated_script,
+                    language,
+                    engine=engine,
+                    gender=gender,
+                    speed=speed,
+                    pitch=pitch,
+                    volume=volume,
+                    output_file=temp_file
+                )
 
             if not output_file:
                 raise Exception("Failed to generate audio file")
 
             try:
-                # Upload to storage
-                file_name = f"audios/{script.workspace_id.id}/{script.title.replace(' ', '_')}.mp3"
-                audio_url = await upload_to_r2(temp_file, file_name)
-
-                # Save to database
-                audio = Audio(
-                    workspace_id=script.workspace_id,
-                    script_id=script,
-                    audio_url=audio_url,
-                    timings=timings_string,
-                    status="completed"
-                )
-                audio.save()
+                # Upload to storage và lưu vào database
+                audio = await AudioController._save_audio(script, output_file, timings_string, settings, reencodes)
+                # Audio cũ chỉ bị xóa khi audio mới đã sẵn sàng
+                if existing_audio:
+                    await AudioController._delete_replaced_audio(existing_audio, audio)
 
                 return {
                     "audio_id": str(audio.id),
-                    "audio_url": audio_url,
-                    "timings": eval(timings_string)
+                    "audio_url": audio.audio_url,
+                    "audio_urls": json.loads(audio.audio_urls),
+                    "timings": eval(timings_string),
+                    "failed_sentences": failed,
+                    "incremental": bool(old_audio_data)
                 }, 201
 
             finally:
-                # Clean up temp file
-                if os.path.exists(temp_file):
-                    os.remove(temp_file)
+                # Clean up temp files của mọi định dạng
+                remove_outputs(temp_file)
 
         except Exception as e:
             return {"error": str(e)}, 500
-        
 
+    @staticmethod
+    async def stream_audio(script_id, engine="gtts", gender="female", speed=1.0, pitch=1.0, volume=0.0):
+        """
+        Tạo audio và yield sự kiện cho từng chunk ngay khi sẵn sàng (timings theo câu, audio mã hóa base64),
+        kết thúc bằng sự kiện "done" chứa audio_id, audio_url, timings hoặc sự kiện "error".
+        """
+        temp_file = None
+        try:
+            script = Script.objects(id=script_id).first()
+            if not script:
+                raise Exception("Script not found")
+            language = AudioController._resolve_language(script, engine)
+            settings = {
+                "engine": engine,
+                "gender": gender,
+                "speed": speed,
+                "pitch": pitch,
+                "volume": volume,
+                "language": language
+            }
+
+            existing_audio = Audio.objects(workspace_id=script.workspace_id, script_id=script).first()
+
+            temp_file = f"temp_{script.title.replace(' ', '_')}.mp3"
+            events = iter_script_audio(
+                script.generated_script,
+                language,
+                engine=engine,
+                gender=gender,
+                speed=speed,
+                pitch=pitch,
+                volume=volume,
+                output_file=temp_file,
+                previews=True
+            )
+            try:
+                async for event in events:
+                    if event["type"] == "chunk":
+                        audio_data = event["audio"]
+                        yield {
+                            "type": "chunk",
+                            "index": event["index"],
+                            "timings": event["timings"],
+                            "audio": base64.b64encode(audio_data).decode("ascii") if audio_data else None
+                        }
+                    elif event["type"] == "done":
+                        audio = await AudioController._save_audio(script, event["output_file"], event["timings_string"], settings)
+                        if existing_audio:
+                            await AudioController._delete_replaced_audio(existing_audio, audio)
+                        yield {
+                            "type": "done",
+                            "audio_id": str(audio.id),
+                            "audio_url": audio.audio_url,
+                            "audio_urls": json.loads(audio.audio_urls),
+                            "timings": eval(event["timings_string"]),
+                            "failed_sentences": event["failed"]
+                        }
+                    else:
+                        yield event
+            finally:
+                await events.aclose()
+
+        except Exception as e:
+            yield {"type": "error", "error": str(e)}
+        finally:
+            # Clean up temp files của mọi định dạng
+            if temp_file:
+                remove_outputs(temp_file)
+
+    @staticmethod
+    def _converted_output(title):
+        """
+        File MP3 đích khi chuyển file ghi âm sang các định dạng xuất, trong thư mục tạm riêng của request
+        để các upload cùng tên không ghi đè hay xóa file của nhau. Trả về (thư mục tạm, file MP3).
+        Bản lưu trữ được chuyển thẳng từ file gốc (giữ chất lượng nguồn), không qua mảng 16 kHz của Whisper.
+        """
+        temp_dir = tempfile.mkdtemp(prefix="stt_")
+        return temp_dir, os.path.join(temp_dir, f"{title}_converted.mp3")
+
+    @staticmethod
+    def remove_upload(audio_file):
+        """Xóa file upload đã lưu bởi route và thư mục tạm riêng chứa nó"""
+        if os.path.exists(audio_file):
+            os.unlink(audio_file)
+        try:
+            os.rmdir(os.path.dirname(audio_file))
+        except OSError:
+            # Không phải thư mục riêng của upload (còn file khác)
+            pass
 
     @staticmethod
-    async def speech_to_text(workspace_id, audio_file, language_value, update_existing=False):
+    async def speech_to_text(workspace_id, audio_file, language_value, update_existing=False, on_segment=None):
+        """
+        Nhận dạng file âm thanh, lưu Script/Audio.
+        :param on_segment: Hàm on_segment(segment, duration) nhận từng đoạn ngay khi được nhận dạng (job nhận dạng).
+        """
         try:
-            # Phân tích file âm thanh
-            result_text, timings_string = analyze_audio(audio_file, language_value)
+            # File đã được nhận dạng trước đó (cùng nội dung, ngôn ngữ và model): dùng lại kết quả
+            cache_key, cached = await lookup_transcription_async(audio_file, language_value)
+
+            # Phân tích file âm thanh; mảng 16 kHz mono chỉ dùng cho Whisper
+            if cached is not None:
+                result_text, timings_string = cached
+            else:
+                samples = await asyncio.to_thread(decode_for_whisper, audio_file)
+                result_text, timings_string = await transcribe_and_cache_async(cache_key, samples, language_value, on_segment)
             
             # Tạo title từ tên file
             title = os.path.basename(audio_file).split('.')[0]
-            
+
             # Kiểm tra nếu update_existing=True và đã có audio tồn tại
             if update_existing:
                 # Tìm workspace object trước
@@ -174,36 +351,37 @@ class AudioController:
                     script.generated_script = result_text
                     script.save()
                     
-                    # Chuyển đổi file sang định dạng MP3
-                    temp_mp3 = os.path.join(tempfile.gettempdir(), f"{title}_converted.mp3")
-                    audio = AudioSegment.from_file(audio_file)
-                    audio.export(temp_mp3, format="mp3")
-                    
+                    temp_dir, temp_file = AudioController._converted_output(title)
                     try:
-                        # Xóa file âm thanh cũ nếu cần
-                        if existing_audio.audio_url:
-                            await delete_from_r2(existing_audio.audio_url)
-                        
+                        await asyncio.to_thread(transcode_outputs, audio_file, get_output_paths(temp_file))
+
                         # Upload file mới
-                        file_name = f"audios/{workspace_id}/{title.replace(' ', '_')}.mp3"
-                        audio_url = await upload_to_r2(temp_mp3, file_name)
+                        audio_urls = await AudioController._upload_outputs(temp_file, workspace_id, title)
+                        audio_url = next(iter(audio_urls.values()))
+
+                        # Xóa file cũ của mọi định dạng (giữ file vừa được ghi đè nếu trùng tên)
+                        await AudioController._delete_audio_files(existing_audio, audio_urls.values())
                         
                         # Cập nhật audio hiện có
                         existing_audio.audio_url = audio_url
+                        existing_audio.audio_urls = json.dumps(audio_urls)
                         existing_audio.timings = timings_string
+                        # Bản ghi âm không phải giọng TTS: bỏ cài đặt để cập nhật tăng dần không ghép giọng TTS vào
+                        existing_audio.settings = None
+                        existing_audio.reencodes = 0
                         existing_audio.save()
                         
                         return {
                             "status": "success",
                             "script_id": str(script.id),
                             "audio_url": audio_url,
+                            "audio_urls": audio_urls,
                             "text": result_text,
                             "timings": eval(timings_string)
                         }, 200
                     finally:
                         # Đảm bảo xóa file tạm sau khi hoàn thành
-                        if os.path.exists(temp_mp3):
-                            os.remove(temp_mp3)
+                        shutil.rmtree(temp_dir, ignore_errors=True)
             
             # Xử lý tạo mới nếu không update hoặc không tìm thấy audio hiện có
             # Tạo script từ văn bản đã nhận dạng
@@ -217,21 +395,20 @@ class AudioController:
             # Lấy script_id từ kết quả trả về
             script_id = script_result[0].get("script_id")
             
-            # Chuyển đổi file sang định dạng MP3
-            temp_mp3 = os.path.join(tempfile.gettempdir(), f"{title}_converted.mp3")
-            audio = AudioSegment.from_file(audio_file)
-            audio.export(temp_mp3, format="mp3")
-
+            temp_dir, temp_file = AudioController._converted_output(title)
             try:
-                # Upload to storage - QUAN TRỌNG: Upload file đã chuyển đổi
-                file_name = f"audios/{workspace_id}/{title.replace(' ', '_')}.mp3"
-                audio_url = await upload_to_r2(temp_mp3, file_name)  # Sử dụng temp_mp3 thay vì audio_file
+                await asyncio.to_thread(transcode_outputs, audio_file, get_output_paths(temp_file))
+
+                # Upload to storage - QUAN TRỌNG: Upload file đã chuyển đổi thay vì audio_file
+                audio_urls = await AudioController._upload_outputs(temp_file, workspace_id, title)
+                audio_url = next(iter(audio_urls.values()))
 
                 # Save to database
                 audio = Audio(
                     workspace_id=workspace_id,
                     script_id=script_id,
                     audio_url=audio_url,
+                    audio_urls=json.dumps(audio_urls),
                     timings=timings_string,
                     status="completed"
                 )
@@ -241,18 +418,64 @@ class AudioController:
                     "status": "success",
                     "script_id": script_id,
                     "audio_url": audio_url,
+                    "audio_urls": audio_urls,
                     "text": result_text,
                     "timings": eval(timings_string)
                 }, 200
                 
             finally:
                 # Đảm bảo xóa file tạm sau khi hoàn thành
-                if os.path.exists(temp_mp3):
-                    os.remove(temp_mp3)
+                shutil.rmtree(temp_dir, ignore_errors=True)
                 
         except Exception as e:
             return {"error": str(e)}, 500
     
+    @staticmethod
+    def start_transcription_job(workspace_id, audio_file, language_value, update_existing=False):
+        """
+        Chạy speech_to_text trong luồng nền, gửi từng đoạn nhận dạng được vào job.
+        Script/Audio được lưu khi job kết thúc (sự kiện done); file audio_file bị xóa sau đó.
+        :return: job
+        """
+        job = transcription_jobs.create()
+
+        def on_segment(segment, duration):
+            job.emit({
+                "type": "segment",
+                "start_time": round(segment["start"], 2),
+                "end_time": round(segment["end"], 2),
+                "content": segment["text"].strip(),
+                "duration": round(duration, 2),
+                "progress": round(min(1.0, segment["end"] / duration), 4) if duration else None
+            })
+
+        def run():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            job.emit({"type": "started"})
+            try:
+                result, status = loop.run_until_complete(
+                    AudioController.speech_to_text(
+                        workspace_id=workspace_id,
+                        audio_file=audio_file,
+                        language_value=language_value,
+                        update_existing=update_existing,
+                        on_segment=on_segment
+                    )
+                )
+                if status == 200:
+                    job.emit({"type": "done", **result})
+                else:
+                    job.emit({"type": "error", "status": status, **result})
+            except Exception as e:
+                job.emit({"type": "error", "status": 500, "error": str(e)})
+            finally:
+                loop.close()
+                AudioController.remove_upload(audio_file)
+
+        threading.Thread(target=run, name=f"transcription-{job.id}", daemon=True).start()
+        return job
+
     @staticmethod
     def get_audio_by_workspace_id(workspace_id_string):
         """Get audio dựa vào string ID của workspace"""
@@ -283,6 +506,7 @@ class AudioController:
                 "workspace_id": str(audio.workspace_id.id),
                 "script_id": str(audio.script_id.id),
                 "audio_url": audio.audio_url,
+                "audio_urls": AudioController._audio_urls(audio),
                 "timings": timings,
                 "status": audio.status,
                 "voice_style": audio.voice_style
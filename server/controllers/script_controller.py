@@ -1,13 +1,14 @@
 from services.language.input_handler_service import detect_language_and_input
 from services.language.translator_service import translate_to_english
 from services.content.wiki_service import get_wikipedia_summary
-from services.content.script_service import create_script_with_gemini, create_title_with_gemini, create_description_with_gemini
+from services.content.script_service import create_script_with_gemini_async, create_title_with_gemini_async, create_description_with_gemini_async
+from services.content.caption_service import create_caption_with_gemini_async, fit_caption
 from models.models import Script, Workspace, Clip
 import datetime
 
 class ScriptController:
     @staticmethod
-    async def generate_script(workspace_id, title, style, length, language, update_existing=False):
+    async def generate_script(workspace_id, title, style, length, language, update_existing=False, regenerate=False):
         try:
             # Validate workspace
             workspace = Workspace.objects(id=workspace_id).first()
@@ -15,11 +16,12 @@ class ScriptController:
                 raise Exception("Workspace not found")
 
             # Generate script content
-            generated_script = create_script_with_gemini(
+            generated_script = await create_script_with_gemini_async(
                 title, 
                 style, 
                 length,
-                language
+                language,
+                regenerate
             )
             
             # Kiểm tra nếu update_existing=True, tìm script hiện có và cập nhật
@@ -164,7 +166,7 @@ class ScriptController:
         ]
 
     @staticmethod
-    def create_title_from_script(script_id):
+    async def create_title_from_script(script_id, regenerate=False):
         try:
             # Find the script by ID
             script = Script.objects(id=script_id).first()
@@ -172,17 +174,18 @@ class ScriptController:
                 raise Exception("Script not found")
 
             # Create a title from the script content
-            title = create_title_with_gemini(
+            title = await create_title_with_gemini_async(
                 script.title, 
                 script.style, 
-                script.language
+                script.language,
+                regenerate=regenerate
             )
             return {"title": title}, 200
         except Exception as e:
             return {"error": str(e)}, 500
         
     @staticmethod
-    def create_description_from_script(script_id):
+    async def create_description_from_script(script_id, regenerate=False):
         try:
             # Find the script by ID
             script = Script.objects(id=script_id).first()
@@ -190,17 +193,37 @@ class ScriptController:
                 raise Exception("Script not found")
 
             # Create a title from the script content
-            description = create_description_with_gemini(
+            description = await create_description_with_gemini_async(
                 script.title, 
                 script.style, 
-                script.language
+                script.language,
+                regenerate=regenerate
             )
             return {"description": description}, 200
         except Exception as e:
             return {"error": str(e)}, 500
         
     @staticmethod
-    def create_caption_from_clip(clip_id):
+    async def create_caption_from_script(script_id, platform=None, regenerate=False):
+        """Tạo title, description và hashtags cho script trong một lần gọi Gemini"""
+        try:
+            script = Script.objects(id=script_id).first()
+            if not script:
+                raise Exception("Script not found")
+
+            caption = await create_caption_with_gemini_async(
+                script.title,
+                script.style,
+                script.language,
+                platform,
+                regenerate
+            )
+            return caption, 200
+        except Exception as e:
+            return {"error": str(e)}, 500
+
+    @staticmethod
+    async def create_caption_from_clip(clip_id, platform=None, regenerate=False):
         """Tạo caption từ clip_id bằng cách tìm script qua workspace"""
         try:
             # Bước 1: Tìm clip dựa trên clip_id
@@ -217,23 +240,21 @@ class ScriptController:
                 # Nếu không tìm thấy script nào, tạo caption từ thông tin clip
                 title = clip.prompt.strip()
                 description = f"Video khoa học về chủ đề: {clip.prompt}"
-                return {"title": title, "description": description}, 200
-            
-            # Bước 4: Sử dụng các phương thức hiện có để tạo title và description
-            title_result, title_status = ScriptController.create_title_from_script(str(script.id))
-            if title_status != 200:
-                title = clip.prompt.strip()  # Sử dụng prompt nếu không tạo được title
-            else:
-                title = title_result.get("title")
-                
-            desc_result, desc_status = ScriptController.create_description_from_script(str(script.id))
-            if desc_status != 200:
-                description = f"Video khoa học về chủ đề: {clip.prompt}"  # Mô tả mặc định
-            else:
-                description = desc_result.get("description")
+                return fit_caption(title, description, [], platform), 200
             
-            return {"title": title, "description": description, "script_id": str(script.id)}, 200
+            # Bước 4: Tạo title, description và hashtags trong một lần gọi (đã có dự phòng Llama)
+            caption = await create_caption_with_gemini_async(
+                script.title,
+                script.style,
+                script.language,
+                platform,
+                regenerate
+            )
+            if not caption["title"]:
+                caption["title"] = fit_caption(clip.prompt, "", [], platform)["title"]  # Sử dụng prompt nếu không tạo được title
+
+            return {**caption, "script_id": str(script.id)}, 200
             
         except Exception as e:
             print(f"Lỗi trong create_caption_from_clip: {str(e)}")
-            return {"error": str(e)}, 500
\ No newline at end of file
+            return {"error": str(e)}, 500
@@ -74,4 +74,28 @@ class Audio(Document):
     status = StringField(default="processing", choices=["processing", "completed", "error"])
     created_at = DateTimeField(default=datetime.utcnow)
     voice_style = IntField(default=1)  # 1: serious, 2: fun
-    meta = {"collection": "audios"}
\ No newline at end of file
+    settings = StringField()  # JSON string: engine, gender, speed, pitch, volume, language
+    audio_urls = StringField()  # JSON string: {định dạng: url}, ví dụ {"mp3": ..., "opus": ...}
+    reencodes = IntField(default=0)  # Số lần track cũ bị giải mã và mã hóa lại qua các lần cập nhật tăng dần
+    meta = {"collection": "audios"}
+
+# Cache kết quả nhận dạng giọng nói, khóa theo hash nội dung file + ngôn ngữ + cấu hình model
+class TranscriptionCache(Document):
+    key = StringField(required=True, unique=True)
+    language = StringField()
+    result_text = StringField()
+    segments = StringField()  # JSON string: các đoạn Whisper gốc [{start, end, text}]
+    timings = StringField()  # JSON string: timings đã sửa chính tả
+    size = IntField(default=0)
+    hits = IntField(default=0)
+    created_at = DateTimeField(default=datetime.utcnow)
+    last_used_at = DateTimeField(default=datetime.utcnow)
+    expires_at = DateTimeField()
+    meta = {
+        "collection": "transcription_cache",
+        "indexes": [
+            # MongoDB tự xóa mục khi tới expires_at
+            {"fields": ["expires_at"], "expireAfterSeconds": 0},
+            "last_used_at",
+        ],
+    }
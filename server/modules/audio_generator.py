@@ -1,9 +1,9 @@
 from gtts import gTTS
 from pydub import AudioSegment
 from mutagen.mp3 import MP3
-import re
 import io
 import ffmpeg
+from services.audio.segmenter import split_sentences
 
 # Hàm áp dụng style speed lên một chunk trong bộ nhớ
 def add_style_speech_to_chunk(chunk, style):
@@ -46,7 +46,7 @@ def add_style_speech_to_chunk(chunk, style):
 
 # Hàm tạo các chunk âm thanh trong bộ nhớ từ script và áp dụng style
 def generate_audio_chunks_in_memory(script, language, style=None):
-    sentences = [s.strip() + '.' for s in re.split(r'[.!?]+(?=\s)', script) if s.strip()]
+    sentences = split_sentences(script, language)
     chunks = []
     
     for i, sentence in enumerate(sentences, 1):
@@ -1,5 +1,9 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, Response, stream_with_context
 from controllers.audio_controller import AudioController
+from services.audio.tts_cache import tts_cache
+from services.audio.whisper_models import whisper_registry
+from services.audio.transcription_cache import transcription_cache
+from services.audio.transcription_jobs import transcription_jobs, FINAL_EVENTS
 import asyncio
 from models.models import Audio
 import os
@@ -7,9 +11,54 @@ from werkzeug.utils import secure_filename
 from docx import Document
 from flask_cors import cross_origin
 import tempfile 
+import json
 
 audio_bp = Blueprint('audio', __name__)
 
+def _parse_audio_params(data):
+    """Đọc và kiểm tra tham số tạo audio, trả về (params, None) hoặc (None, (lỗi, status))"""
+    required_fields = ["speed", "pitch", "volume"]
+
+    if not data or not all(field in data for field in required_fields):
+        return None, ({"error": "Thiếu các trường bắt buộc (speed, pitch, volume)"}, 400)
+
+    # Validate input types
+    try:
+        speed = float(data["speed"])
+        pitch = float(data["pitch"])
+        volume = float(data["volume"])
+    except (TypeError, ValueError):
+        return None, ({"error": "Giá trị speed, pitch, hoặc volume không hợp lệ"}, 400)
+
+    # Thêm engine và gender, với giá trị mặc định
+    engine = data.get("engine", "gtts")  # Mặc định là gtts nếu không cung cấp
+    gender = data.get("gender", "female")  # Mặc định là female nếu không cung cấp
+
+    # Kiểm tra giá trị engine hợp lệ
+    if engine not in ["gtts", "edge_tts", "local"]:
+        return None, ({"error": "Engine phải là 'gtts', 'edge_tts' hoặc 'local'"}, 400)
+
+    # Kiểm tra giá trị gender hợp lệ
+    if gender not in ["male", "female"]:
+        return None, ({"error": "Gender phải là 'male' hoặc 'female'"}, 400)
+
+    # Optional: Validate ranges
+    if not (0.5 <= speed <= 2.0):
+        return None, ({"error": "Tốc độ phải nằm trong khoảng 0.5 đến 2.0"}, 400)
+    if not (0.5 <= pitch <= 2.0):
+        return None, ({"error": "Âm điệu phải nằm trong khoảng 0.5 đến 2.0"}, 400)
+    if not (-12.0 <= volume <= 12.0):
+        return None, ({"error": "Âm lượng phải nằm trong khoảng -12.0 đến 12.0 dB"}, 400)
+
+    return {
+        "engine": engine,
+        "gender": gender,
+        "speed": speed,
+        "pitch": pitch,
+        "volume": volume,
+    }, None
+
+
 @audio_bp.route("/scripts/<script_id>/generate_audio", methods=["POST", "OPTIONS"])
 @cross_origin(origins=["http://localhost:5173"], methods=["POST", "OPTIONS"], allow_headers=["Content-Type"])
 def generate_audio(script_id):
@@ -19,35 +68,12 @@ def generate_audio(script_id):
 
     try:
         data = request.get_json()
-        required_fields = ["speed", "pitch", "volume"]
-
-        if not all(field in data for field in required_fields):
-            return jsonify({"error": "Thiếu các trường bắt buộc (speed, pitch, volume)"}), 400
-
-        # Validate input types
-        speed = float(data["speed"])
-        pitch = float(data["pitch"])
-        volume = float(data["volume"])
-
-        # Thêm engine và gender, với giá trị mặc định
-        engine = data.get("engine", "gtts")  # Mặc định là gtts nếu không cung cấp
-        gender = data.get("gender", "female")  # Mặc định là female nếu không cung cấp
-        
-        # Kiểm tra giá trị engine hợp lệ
-        if engine not in ["gtts", "edge_tts"]:
-            return jsonify({"error": "Engine phải là 'gtts' hoặc 'edge_tts'"}), 400
+        params, error = _parse_audio_params(data)
+        if error:
+            return jsonify(error[0]), error[1]
 
-        # Kiểm tra giá trị gender hợp lệ
-        if gender not in ["male", "female"]:
-            return jsonify({"error": "Gender phải là 'male' hoặc 'female'"}), 400
-        
-        # Optional: Validate ranges
-        if not (0.5 <= speed <= 2.0):
-            return jsonify({"error": "Tốc độ phải nằm trong khoảng 0.5 đến 2.0"}), 400
-        if not (0.5 <= pitch <= 2.0):
-            return jsonify({"error": "Âm điệu phải nằm trong khoảng 0.5 đến 2.0"}), 400
-        if not (-12.0 <= volume <= 12.0):
-            return jsonify({"error": "Âm lượng phải nằm trong khoảng -12.0 đến 12.0 dB"}), 400
+        # Chỉ tổng hợp lại các câu đã sửa so với audio hiện có
+        incremental = bool(data.get("incremental", False))
 
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
@@ -55,23 +81,64 @@ def generate_audio(script_id):
         result, status = loop.run_until_complete(
             AudioController.generate_audio(
                 script_id=script_id,
-                engine=engine,  
-                gender=gender,  
-                speed=speed,
-                pitch=pitch,
-                volume=volume
+                incremental=incremental,
+                **params
             )
         )
         loop.close()
 
         return jsonify(result), status
 
-    except ValueError:
-        return jsonify({"error": "Giá trị speed, pitch, hoặc volume không hợp lệ"}), 400
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+
+
+@audio_bp.route("/scripts/<script_id>/generate_audio/stream", methods=["POST", "OPTIONS"])
+@cross_origin(origins=["http://localhost:5173"], methods=["POST", "OPTIONS"], allow_headers=["Content-Type"])
+def stream_generate_audio(script_id):
+    """Tạo audio và gửi từng câu qua Server-Sent Events ngay khi câu đó sẵn sàng"""
+    if request.method == "OPTIONS":
+        return jsonify({}), 200
+
+    params, error = _parse_audio_params(request.get_json(silent=True))
+    if error:
+        return jsonify(error[0]), error[1]
+
+    def generate():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        events = AudioController.stream_audio(script_id=script_id, **params)
+        try:
+            while True:
+                try:
+                    event = loop.run_until_complete(events.__anext__())
+                except StopAsyncIteration:
+                    break
+                yield f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        finally:
+            # Chạy khi client ngắt kết nối: đóng generator để dừng tổng hợp và dọn file tạm
+            loop.run_until_complete(events.aclose())
+            loop.close()
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
     
 
+@audio_bp.route("/audio/cache/stats", methods=["GET"])
+def get_tts_cache_stats():
+    """Thống kê cache TTS (hit/miss, dung lượng)"""
+    return jsonify(tts_cache.stats()), 200
+
+
+@audio_bp.route("/audio/stt/metrics", methods=["GET"])
+def get_stt_metrics():
+    """Thống kê model Whisper (số lần/thời gian nạp, thời gian suy luận, số bản sao đang dùng) và cache nhận dạng"""
+    return jsonify({**whisper_registry.stats(), "cache": transcription_cache.stats()}), 200
+
+
 @audio_bp.route("/audios/<audio_id>", methods=["GET"])
 def get_audio(audio_id):
     """Get audio details by ID"""
@@ -85,6 +152,7 @@ def get_audio(audio_id):
             "workspace_id": str(audio.workspace_id.id),
             "script_id": str(audio.script_id.id),
             "audio_url": audio.audio_url,
+            "audio_urls": json.loads(audio.audio_urls) if audio.audio_urls else {"mp3": audio.audio_url},
             "timings": eval(audio.timings),
             # "voice_style": audio.voice_style,
             # "status": audio.status,
@@ -94,6 +162,48 @@ def get_audio(audio_id):
         return jsonify({"error": str(e)}), 500
     
 
+def _save_uploaded_audio():
+    """Kiểm tra form upload và lưu file tạm, trả về (params, None) hoặc (None, (lỗi, status))"""
+    # Kiểm tra workspace_id
+    if 'workspace_id' not in request.form:
+        return None, ({"error": "Missing workspace_id"}, 400)
+        
+    workspace_id = request.form['workspace_id']
+    language = request.form.get('language', 'vietnamese')  # Mặc định là tiếng Việt
+    
+    # Kiểm tra file
+    if 'audio_file' not in request.files:
+        return None, ({"error": "No audio file provided"}, 400)
+        
+    file = request.files['audio_file']
+    if file.filename == '':
+        return None, ({"error": "No file selected"}, 400)
+        
+    # Kiểm tra định dạng file
+    allowed_extensions = {'mp3', 'wav', 'ogg', 'm4a', 'flac'}
+    file_ext = file.filename.rsplit('.', 1)[1].lower() if '.' in file.filename else ''
+    
+    if file_ext not in allowed_extensions:
+        return None, ({"error": f"File type not supported. Please upload {', '.join(allowed_extensions)}"}, 400)
+    
+    # Lưu file tạm trong thư mục riêng của request: hai upload cùng tên không ghi đè/xóa file của nhau.
+    # Giữ tên file vì title được lấy từ tên file; xóa bằng AudioController.remove_upload
+    temp_dir = tempfile.mkdtemp(prefix="upload_")
+    filename = secure_filename(file.filename) or f"audio.{file_ext}"
+    filepath = os.path.join(temp_dir, filename)
+    file.save(filepath)
+    
+    # Kiểm tra xem đã có audio với workspace_id này chưa
+    existing_audio = Audio.objects(workspace_id=workspace_id).first()
+
+    return {
+        "workspace_id": workspace_id,
+        "audio_file": filepath,
+        "language_value": language,
+        "update_existing": True if existing_audio else False
+    }, None
+
+
 @audio_bp.route("/generate-audio-from-file", methods=["POST", "OPTIONS"])
 @cross_origin(origins=["http://localhost:5173"], methods=["POST", "OPTIONS"], allow_headers=["Content-Type"])
 def generate_audio_from_file():
@@ -102,60 +212,104 @@ def generate_audio_from_file():
         return jsonify({}), 200
 
     try:
-        # Kiểm tra workspace_id
-        if 'workspace_id' not in request.form:
-            return jsonify({"error": "Missing workspace_id"}), 400
-            
-        workspace_id = request.form['workspace_id']
-        language = request.form.get('language', 'vietnamese')  # Mặc định là tiếng Việt
-        
-        # Kiểm tra file
-        if 'audio_file' not in request.files:
-            return jsonify({"error": "No audio file provided"}), 400
-            
-        file = request.files['audio_file']
-        if file.filename == '':
-            return jsonify({"error": "No file selected"}), 400
-            
-        # Kiểm tra định dạng file
-        allowed_extensions = {'mp3', 'wav', 'ogg', 'm4a', 'flac'}
-        file_ext = file.filename.rsplit('.', 1)[1].lower() if '.' in file.filename else ''
-        
-        if file_ext not in allowed_extensions:
-            return jsonify({"error": f"File type not supported. Please upload {', '.join(allowed_extensions)}"}), 400
-        
-        # Lưu file tạm
-        temp_dir = tempfile.gettempdir()
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(temp_dir, filename)
-        file.save(filepath)
-        
-        # Kiểm tra xem đã có audio với workspace_id này chưa
-        existing_audio = Audio.objects(workspace_id=workspace_id).first()
+        params, error = _save_uploaded_audio()
+        if error:
+            return jsonify(error[0]), error[1]
         
         # Xử lý file âm thanh
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
         
         result, status = loop.run_until_complete(
-            AudioController.speech_to_text(
-                workspace_id=workspace_id,
-                audio_file=filepath,
-                language_value=language,
-                update_existing=True if existing_audio else False
-            )
+            AudioController.speech_to_text(**params)
         )
         
         loop.close()
         
         # Xóa file tạm
-        os.unlink(filepath)
+        AudioController.remove_upload(params["audio_file"])
         
         return jsonify(result), status
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+
+@audio_bp.route("/generate-audio-from-file/jobs", methods=["POST", "OPTIONS"])
+@cross_origin(origins=["http://localhost:5173"], methods=["POST", "OPTIONS"], allow_headers=["Content-Type"])
+def create_transcription_job():
+    """Nhận dạng file âm thanh trong nền; kết quả từng đoạn được gửi qua /transcriptions/<job_id>/events"""
+    if request.method == "OPTIONS":
+        return jsonify({}), 200
+
+    try:
+        params, error = _save_uploaded_audio()
+        if error:
+            return jsonify(error[0]), error[1]
+
+        job = AudioController.start_transcription_job(**params)
+        return jsonify({
+            "job_id": job.id,
+            "status_url": f"/transcriptions/{job.id}",
+            "events_url": f"/transcriptions/{job.id}/events"
+        }), 202
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@audio_bp.route("/transcriptions/<job_id>", methods=["GET"])
+def get_transcription_job(job_id):
+    """
+    Long-poll: trả về các sự kiện từ vị trí ?after=, chờ tối đa ?wait= giây (mặc định 25) nếu chưa có sự kiện mới.
+    Gọi lại với after=next cho tới khi status là completed hoặc error.
+    """
+    job = transcription_jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "Không tìm thấy job nhận dạng"}), 404
+
+    try:
+        after = max(0, int(request.args.get("after", 0)))
+        wait = min(max(0.0, float(request.args.get("wait", 25))), 60.0)
+    except ValueError:
+        return jsonify({"error": "Giá trị after hoặc wait không hợp lệ"}), 400
+
+    events, next_index = job.events_since(after, timeout=wait)
+    return jsonify({**job.snapshot(), "events": events, "next": next_index}), 200
+
+
+@audio_bp.route("/transcriptions/<job_id>/events", methods=["GET"])
+def stream_transcription_job(job_id):
+    """Gửi các sự kiện của job (started, segment, done, error) qua Server-Sent Events; hỗ trợ Last-Event-ID khi kết nối lại"""
+    job = transcription_jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "Không tìm thấy job nhận dạng"}), 404
+
+    try:
+        after = int(request.headers.get("Last-Event-ID", -1)) + 1
+    except ValueError:
+        after = 0
+
+    def generate():
+        index = after
+        while True:
+            events, next_index = job.events_since(index, timeout=15)
+            if not events:
+                # Giữ kết nối qua proxy khi chưa có đoạn mới
+                yield ": keep-alive\n\n"
+                continue
+            for offset, event in enumerate(events):
+                yield f"id: {index + offset}\nevent: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+                if event["type"] in FINAL_EVENTS:
+                    return
+            index = next_index
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @audio_bp.route("/get-audio/<workspace_id>", methods=["GET"])
 def get_audio_by_workspace(workspace_id):
     """Get all audio files for a specific workspace"""
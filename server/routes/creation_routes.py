@@ -3,7 +3,6 @@ import base64
 import json
 from flask import Blueprint, request, jsonify, send_from_directory
 from pydantic import BaseModel
-from google import genai
 from google.genai import types
 import requests
 from PIL import Image
@@ -16,6 +15,9 @@ from urllib.parse import urljoin
 from models.models import Clip, Resource, Script, Workspace
 from models import models
 from services.storage.storage_service import upload_to_r2, upload_blob_to_r2
+from services.llm.gateway import llm_gateway
+from services.llm.resilience import CircuitOpenError
+from services.llm.response_cache import llm_cache
 
 load_dotenv()
 
@@ -28,7 +30,6 @@ def serve_image(filename):
     return send_from_directory(IMAGE_FOLDER, filename)
 
 print("Creation blueprint registered")
-client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
 
 @creation_bp.route("/creations", methods=["POST"])
 def new_creations():
@@ -63,7 +64,13 @@ def new_creations():
     for clip in newClips:
         clip.save()
 
-    script_content = determine_illustration_content(json.dumps(data, ensure_ascii=False, indent=2))
+    # regenerate=true: xác định lại nội dung minh họa thay vì dùng kết quả đã cache cho cùng kịch bản
+    regenerate = request.args.get("regenerate", "false").lower() == "true"
+    try:
+        script_content = determine_illustration_content(json.dumps(data, ensure_ascii=False, indent=2), regenerate)
+    except CircuitOpenError as e:
+        # Model minh họa không có dự phòng: báo tạm thời không khả dụng thay vì lỗi 500
+        return jsonify({"error": str(e)}), 503
     print("Script content:", script_content)
     materials = [None for _ in range(len(data))]
     materials = asyncio.run(get_all_vid_segment(script_content, materials))
@@ -113,7 +120,10 @@ def create_image():
     print("Data:", data)
     # return jsonify({"content": "good request"}), 200
 
-    filename = asyncio.run(get_image(data["prompt"]))
+    try:
+        filename = asyncio.run(get_image(data["prompt"]))
+    except CircuitOpenError as e:
+        return jsonify({"error": str(e)}), 503
     print("Generating image with description:", data["prompt"], " with filename:", filename)
     return jsonify({"content": filename}), 200
 
@@ -155,12 +165,15 @@ def gen_on_prompt():
             
         script = models.Script.objects(workspace_id=data["workspace_id"]).first()
         
-        filename = asyncio.run(get_image(
-            data["script"], 
-            filename=filename, 
-            additional=data.get("prompt", None), 
-            style=script.style
-            ))
+        try:
+            filename = asyncio.run(get_image(
+                data["script"], 
+                filename=filename, 
+                additional=data.get("prompt", None), 
+                style=script.style
+                ))
+        except CircuitOpenError as e:
+            return jsonify({"error": str(e)}), 503
         print("Generating image with description:", data.get("prompt", "none"), " with filename:", filename)
         resource = Resource.objects(id=data["id"]).first()
         resource.resource_url = filename
@@ -178,11 +191,24 @@ class Script(BaseModel):
     type: str
     description: str
     
-def determine_illustration_content(scripts) -> list[Script]:
+ILLUSTRATION_MODEL = "models/gemini-2.0-flash-exp"
+
+def determine_illustration_content(scripts, regenerate=False) -> list[Script]:
     
     print("Determining illustration content")
-    response = client.models.generate_content(
-        model="models/gemini-2.0-flash-exp",
+    # Cùng kịch bản (sau khi chuẩn hóa) cho cùng kết quả: dùng lại từ cache, lưu dạng dict để tính được dung lượng
+    elements = llm_cache.cached_call(
+        llm_cache.make_key("illustration", ILLUSTRATION_MODEL, scripts),
+        lambda: _generate_illustration_content(scripts),
+        regenerate
+    )
+    script_content = [Script(**element) for element in elements]
+    print("The amount of element with type of image:", len([script for script in script_content if script.type == "image"]))
+    return script_content
+
+def _generate_illustration_content(scripts):
+    response = llm_gateway.generate_content(
+        model=ILLUSTRATION_MODEL,
         contents=[
             """
             From the script, determine each element in the script should best be illustrated with an image or a video. The script could be in Vietnamese so you can translate to English and infer base on the most important words in the script. 
@@ -201,8 +227,7 @@ def determine_illustration_content(scripts) -> list[Script]:
         )
     )
     
-    print("The amount of element with type of image:", len([script for script in response.parsed if script.type == "image"]))
-    return response.parsed
+    return [script.model_dump() for script in response.parsed]
 
 async def get_all_vid_segment(script_list, materials):
     tasks = []
@@ -222,7 +247,12 @@ async def get_all_image_segment(script_list, materials, style):
     for script_idx in range(len(script_list)):
         if script_list[script_idx].type == 'image':
             async def task(idx=script_idx):
-                base64_image = await get_image(script_list[idx].description, style=style)
+                try:
+                    base64_image = await get_image(script_list[idx].description, style=style)
+                except CircuitOpenError as e:
+                    # Model tạo ảnh đang bị ngắt mạch: bỏ qua ảnh này, các ảnh khác vẫn được trả về
+                    print(f"Bỏ qua ảnh {idx}: {e}")
+                    return
                 materials[idx] = base64_image
             tasks.append(task())
             
@@ -248,6 +278,7 @@ async def get_video(description) -> str:
     return None;
 
 async def get_image(description, filename=None, additional=None, style=None) -> str:
+    """Ném CircuitOpenError khi model tạo ảnh đang bị ngắt mạch"""
     print(f"Generating image with description: {description}")
     image_style = ""
     if (style is None):
@@ -262,7 +293,7 @@ async def get_image(description, filename=None, additional=None, style=None) ->
         
     print("Image style:", image_style)
             
-    response = client.models.generate_content(
+    response = llm_gateway.generate_content(
     model="models/gemini-2.0-flash-exp",
         contents=[
             f"""Return the image description in great details, 
@@ -280,11 +311,13 @@ async def get_image(description, filename=None, additional=None, style=None) ->
     ]
     print("Prompt content:", prompt_content)
     try:
-        finalresponse = client.models.generate_content(
+        finalresponse = llm_gateway.generate_content(
             model="models/gemini-2.0-flash-exp",
             contents=prompt_content,
             config=types.GenerateContentConfig(response_modalities=['Text', 'Image'])
         )
+    except CircuitOpenError:
+        raise
     except Exception as e:
         print("Error:", e)
         return None
@@ -0,0 +1,10 @@
+from flask import Blueprint, jsonify
+from services.llm.gateway import llm_gateway
+from services.llm.response_cache import llm_cache
+
+llm_bp = Blueprint('llm', __name__)
+
+@llm_bp.route("/llm/metrics", methods=["GET"])
+def get_llm_metrics():
+    """Số lần gọi, số lỗi và độ trễ của từng model LLM (Gemini, Llama trên Cloudflare) và thống kê cache kết quả"""
+    return jsonify({**llm_gateway.stats(), "cache": llm_cache.stats()}), 200
@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify
 from flask_cors import cross_origin  # Thêm import cross_origin
 from controllers.script_controller import ScriptController
+from services.content.caption_service import PLATFORM_LIMITS
 import asyncio
 import os
 from werkzeug.utils import secure_filename
@@ -60,7 +61,9 @@ def generate_script():
                 style_value,
                 data["length"],
                 data["language"],
-                update_existing=update_existing
+                update_existing=update_existing,
+                # regenerate=true: tạo kịch bản mới thay vì dùng kết quả đã cache cho cùng chủ đề
+                regenerate=bool(data.get("regenerate", False))
             )
         )
         loop.close()
@@ -227,26 +230,32 @@ def get_scripts_by_workspace():
 @script_bp.route("/caption/<script_id>", methods=["GET", "OPTIONS"])
 @cross_origin(origins=["http://localhost:5173"], methods=["GET", "OPTIONS"], allow_headers=["Content-Type"])
 def create_caption_from_script(script_id):
+    """
+    Tạo caption (title, description và hashtags) cho script.
+    ?platform= để cắt theo giới hạn của một nền tảng, ?regenerate=true để không dùng caption đã cache.
+    """
     if request.method == "OPTIONS":
         return jsonify({}), 200
 
     try:
-        # Lấy title và description
-        title_result, title_status = ScriptController.create_title_from_script(script_id)
-        description_result, desc_status = ScriptController.create_description_from_script(script_id)
-        
-        # Kiểm tra kết quả trả về
-        if title_status != 200:
-            return jsonify({"error": "Lỗi khi tạo tiêu đề", "details": title_result}), title_status
-            
-        if desc_status != 200:
-            return jsonify({"error": "Lỗi khi tạo mô tả", "details": description_result}), desc_status
-        
-        # Nếu thành công, trả về cả title và description trong một JSON response
-        return jsonify({
-            "title": title_result.get("title"),
-            "description": description_result.get("description")
-        }), 200
+        platform = request.args.get("platform") or None
+        if platform and platform not in PLATFORM_LIMITS:
+            return jsonify({"error": f"platform phải là một trong: {', '.join(PLATFORM_LIMITS)}"}), 400
+        regenerate = request.args.get("regenerate", "false").lower() == "true"
+
+        # Title, description và hashtags được tạo trong một lần gọi Gemini
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+
+        result, status = loop.run_until_complete(
+            ScriptController.create_caption_from_script(script_id, platform, regenerate)
+        )
+        loop.close()
+
+        if status != 200:
+            return jsonify({"error": "Lỗi khi tạo caption", "details": result}), status
+
+        return jsonify(result), 200
         
     except Exception as e:
         return jsonify({"error": f"Lỗi khi tạo caption: {str(e)}"}), 500
@@ -254,13 +263,24 @@ def create_caption_from_script(script_id):
 @script_bp.route("/caption-from-clip/<clip_id>", methods=["GET", "OPTIONS"])
 @cross_origin(origins=["http://localhost:5173"], methods=["GET", "OPTIONS"], allow_headers=["Content-Type"])
 def create_caption_from_clip(clip_id):
-    """Tạo caption (title và description) cho video dựa trên clip_id"""
+    """Tạo caption (title, description và hashtags) cho video dựa trên clip_id"""
     if request.method == "OPTIONS":
         return jsonify({}), 200
 
     try:
-        # Sử dụng phương thức mới trong controller
-        result, status = ScriptController.create_caption_from_clip(clip_id)
+        platform = request.args.get("platform") or None
+        if platform and platform not in PLATFORM_LIMITS:
+            return jsonify({"error": f"platform phải là một trong: {', '.join(PLATFORM_LIMITS)}"}), 400
+        regenerate = request.args.get("regenerate", "false").lower() == "true"
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+
+        result, status = loop.run_until_complete(
+            ScriptController.create_caption_from_clip(clip_id, platform, regenerate)
+        )
+        loop.close()
+
         return jsonify(result), status
         
     except Exception as e:
@@ -9,6 +9,7 @@ from dotenv import load_dotenv
 import logging
 import time
 import re
+from services.content.caption_service import count_utf16_runes, TIKTOK_CAPTION_MAX_RUNES
 
 # Load environment variables
 load_dotenv()
@@ -51,14 +52,6 @@ def generate_code_verifier():
 def generate_code_challenge(verifier):
     return hashlib.sha256(verifier.encode('utf-8')).hexdigest()
 
-def count_utf16_runes(text):
-    """Count UTF-16 code units (runes) in a string, accounting for surrogate pairs."""
-    if not text:
-        return 0
-    # Encode to UTF-16 and count code units (2 bytes per unit, including surrogates)
-    encoded = text.encode('utf-16-le')
-    return len(encoded) // 2
-
 # def get_newest_video_id(access_token):
 #     """Retrieve the ID and username for the most recently created video."""
 #     try:
@@ -257,9 +250,9 @@ def upload_video():
         if publish_type not in ["UPLOAD_CONTENT", "DIRECT_POST"]:
             logger.error(f"Invalid publish_type: {publish_type}")
             return jsonify({"error": "Invalid publish_type, must be UPLOAD_CONTENT or DIRECT_POST"}), 400
-        if title and count_utf16_runes(title) > 2200:
-            logger.error(f"Title exceeds 2200 UTF-16 runes: {count_utf16_runes(title)}")
-            return jsonify({"error": "Title must not exceed 2200 UTF-16 runes"}), 400
+        if title and count_utf16_runes(title) > TIKTOK_CAPTION_MAX_RUNES:
+            logger.error(f"Title exceeds {TIKTOK_CAPTION_MAX_RUNES} UTF-16 runes: {count_utf16_runes(title)}")
+            return jsonify({"error": f"Title must not exceed {TIKTOK_CAPTION_MAX_RUNES} UTF-16 runes"}), 400
         if privacy_level not in ["PUBLIC_TO_EVERYONE", "MUTUAL_FOLLOW_FRIENDS", "SELF_ONLY"]:
             logger.error(f"Invalid privacy_level: {privacy_level}")
             return jsonify({"error": "Invalid privacy_level, must be PUBLIC_TO_EVERYONE, MUTUAL_FOLLOW_FRIENDS, or SELF_ONLY"}), 400
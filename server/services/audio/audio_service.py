@@ -2,13 +2,302 @@ import asyncio
 import edge_tts
 from gtts import gTTS
 from pydub import AudioSegment
-from mutagen.mp3 import MP3
 import re
 import io
+import bisect
+import difflib
 import ffmpeg
+import numpy as np
 import json
-import tempfile
 import os
+import subprocess
+import tempfile
+from config.audio import (
+    TTS_MAX_WORKERS, AUDIO_EFFECTS_MODE, AUDIO_TRIM_SILENCE, AUDIO_SILENCE_THRESHOLD_DB,
+    AUDIO_SENTENCE_PAUSE_MS, AUDIO_NORMALIZE_DBFS, AUDIO_OUTPUT_PROFILES, AUDIO_OUTPUT_FORMATS,
+    AUDIO_OUTPUT_SAMPLE_RATE, AUDIO_OUTPUT_CHANNELS, LOCAL_TTS_BINARY, LOCAL_TTS_VOICES_DIR,
+    LOCAL_TTS_BATCH_SIZE, LOCAL_TTS_TIMEOUT
+)
+from services.audio import dsp
+from services.audio.segmenter import segment_script
+from services.audio.tts_cache import tts_cache
+from services.audio.mp3_frames import Mp3FrameWriter, Mp3FrameIndex, iter_frames, mp3_file_duration
+
+# Danh sách ngôn ngữ được gTTS hỗ trợ
+GTTS_LANGUAGES = {
+    "afrikaans": "af", "arabic": "ar", "bengali": "bn", "bulgarian": "bg", "catalan": "ca",
+    "chinese": "zh-cn", "croatian": "hr", "czech": "cs", "danish": "da", "dutch": "nl",
+    "english": "en", "estonian": "et", "finnish": "fi", "french": "fr", "german": "de",
+    "greek": "el", "gujarati": "gu", "hindi": "hi", "hungarian": "hu", "icelandic": "is",
+    "indonesian": "id", "italian": "it", "japanese": "ja", "korean": "ko", "latvian": "lv",
+    "lithuanian": "lt", "malay": "ms", "malayalam": "ml", "norwegian": "no", "polish": "pl",
+    "portuguese": "pt", "romanian": "ro", "russian": "ru", "serbian": "sr", "slovak": "sk",
+    "slovenian": "sl", "spanish": "es", "swahili": "sw", "swedish": "sv", "tamil": "ta",
+    "telugu": "te", "thai": "th", "turkish": "tr", "ukrainian": "uk", "urdu": "ur",
+    "vietnamese": "vi", "welsh": "cy"
+}
+
+# Danh sách giọng nói edge-tts theo ngôn ngữ và giới tính
+EDGE_TTS_VOICES = {
+    "af-za": {"female": "af-ZA-AdriNeural", "male": "af-ZA-WillemNeural"},
+    "sq-al": {"female": "sq-AL-AnilaNeural", "male": "sq-AL-IlirNeural"},
+    "am-et": {"female": "am-ET-MekdesNeural", "male": "am-ET-AmehaNeural"},
+    "ar-dz": {"female": "ar-DZ-AminaNeural", "male": "ar-DZ-IsmaelNeural"},
+    "ar-bh": {"female": "ar-BH-LailaNeural", "male": "ar-BH-AliNeural"},
+    "ar-eg": {"female": "ar-EG-SalmaNeural", "male": "ar-EG-ShakirNeural"},
+    "ar-iq": {"female": "ar-IQ-RanaNeural", "male": "ar-IQ-BasselNeural"},
+    "ar-jo": {"female": "ar-JO-SanaNeural", "male": "ar-JO-TaimNeural"},
+    "ar-kw": {"female": "ar-KW-NouraNeural", "male": "ar-KW-FahedNeural"},
+    "ar-lb": {"female": "ar-LB-LaylaNeural", "male": "ar-LB-RamiNeural"},
+    "ar-ly": {"female": "ar-LY-ImanNeural", "male": "ar-LY-OmarNeural"},
+    "ar-ma": {"female": "ar-MA-MounaNeural", "male": "ar-MA-JamalNeural"},
+    "ar-om": {"female": "ar-OM-AyshaNeural", "male": "ar-OM-AbdullahNeural"},
+    "ar-qa": {"female": "ar-QA-AmalNeural", "male": "ar-QA-MoazNeural"},
+    "ar-sa": {"female": "ar-SA-ZariyahNeural", "male": "ar-SA-HamedNeural"},
+    "ar-sy": {"female": "ar-SY-AmanyNeural", "male": "ar-SY-LaithNeural"},
+    "ar-tn": {"female": "ar-TN-ReemNeural", "male": "ar-TN-HediNeural"},
+    "ar-ae": {"female": "ar-AE-FatimaNeural", "male": "ar-AE-HamdanNeural"},
+    "ar-ye": {"female": "ar-YE-MaryamNeural", "male": "ar-YE-SalehNeural"},
+    "az-az": {"female": "az-AZ-BanuNeural", "male": "az-AZ-BabekNeural"},
+    "bn-bd": {"female": "bn-BD-NabanitaNeural", "male": "bn-BD-PradeepNeural"},
+    "bn-in": {"female": "bn-IN-TanishaaNeural", "male": "bn-IN-BashkarNeural"},
+    "bs-ba": {"female": "bs-BA-VesnaNeural", "male": "bs-BA-GoranNeural"},
+    "bg-bg": {"female": "bg-BG-KalinaNeural", "male": "bg-BG-BorislavNeural"},
+    "my-mm": {"female": "my-MM-NilarNeural", "male": "my-MM-ThihaNeural"},
+    "ca-es": {"female": "ca-ES-JoanaNeural", "male": "ca-ES-EnricNeural"},
+    "zh-hk": {"female": "zh-HK-HiuMaanNeural", "male": "zh-HK-WanLungNeural"},
+    "zh-cn": {"female": "zh-CN-XiaoxiaoNeural", "male": "zh-CN-YunxiNeural"},
+    "zh-cn-liaoning": {"female": "zh-CN-liaoning-XiaobeiNeural"},
+    "zh-tw": {"female": "zh-TW-HsiaoYuNeural", "male": "zh-TW-YunJheNeural"},
+    "zh-cn-shaanxi": {"female": "zh-CN-shaanxi-XiaoniNeural"},
+    "hr-hr": {"female": "hr-HR-GabrijelaNeural", "male": "hr-HR-SreckoNeural"},
+    "cs-cz": {"female": "cs-CZ-VlastaNeural", "male": "cs-CZ-AntoninNeural"},
+    "da-dk": {"female": "da-DK-ChristelNeural", "male": "da-DK-JeppeNeural"},
+    "nl-be": {"female": "nl-BE-DenaNeural", "male": "nl-BE-ArnaudNeural"},
+    "nl-nl": {"female": "nl-NL-ColetteNeural", "male": "nl-NL-MaartenNeural"},
+    "en-au": {"female": "en-AU-NatashaNeural", "male": "en-AU-WilliamNeural"},
+    "en-ca": {"female": "en-CA-ClaraNeural", "male": "en-CA-LiamNeural"},
+    "en-hk": {"female": "en-HK-YanNeural", "male": "en-HK-SamNeural"},
+    "en-in": {"female": "en-IN-NeerjaNeural", "male": "en-IN-PrabhatNeural"},
+    "en-ie": {"female": "en-IE-EmilyNeural", "male": "en-IE-ConnorNeural"},
+    "en-ke": {"female": "en-KE-AsiliaNeural", "male": "en-KE-ChilembaNeural"},
+    "en-nz": {"female": "en-NZ-MollyNeural", "male": "en-NZ-MitchellNeural"},
+    "en-ng": {"female": "en-NG-EzinneNeural", "male": "en-NG-AbeoNeural"},
+    "en-ph": {"female": "en-PH-RosaNeural", "male": "en-PH-JamesNeural"},
+    "en-sg": {"female": "en-SG-LunaNeural", "male": "en-SG-WayneNeural"},
+    "en-za": {"female": "en-ZA-LeahNeural", "male": "en-ZA-LukeNeural"},
+    "en-tz": {"female": "en-TZ-ImaniNeural", "male": "en-TZ-ElimuNeural"},
+    "en-gb": {"female": "en-GB-SoniaNeural", "male": "en-GB-RyanNeural"},
+    "en-us": {"female": "en-US-AriaNeural", "male": "en-US-GuyNeural"},
+    "et-ee": {"female": "et-EE-AnuNeural", "male": "et-EE-KertNeural"},
+    "fil-ph": {"female": "fil-PH-BlessicaNeural", "male": "fil-PH-AngeloNeural"},
+    "fi-fi": {"female": "fi-FI-NooraNeural", "male": "fi-FI-HarriNeural"},
+    "fr-be": {"female": "fr-BE-CharlineNeural", "male": "fr-BE-GerardNeural"},
+    "fr-ca": {"female": "fr-CA-SylvieNeural", "male": "fr-CA-AntoineNeural"},
+    "fr-fr": {"female": "fr-FR-DeniseNeural", "male": "fr-FR-HenriNeural"},
+    "fr-ch": {"female": "fr-CH-ArianeNeural", "male": "fr-CH-FabriceNeural"},
+    "gl-es": {"female": "gl-ES-SabelaNeural", "male": "gl-ES-RoiNeural"},
+    "ka-ge": {"female": "ka-GE-EkaNeural", "male": "ka-GE-GiorgiNeural"},
+    "de-at": {"female": "de-AT-IngridNeural", "male": "de-AT-JonasNeural"},
+    "de-de": {"female": "de-DE-KatjaNeural", "male": "de-DE-ConradNeural"},
+    "de-ch": {"female": "de-CH-LeniNeural", "male": "de-CH-JanNeural"},
+    "el-gr": {"female": "el-GR-AthinaNeural", "male": "el-GR-NestorasNeural"},
+    "gu-in": {"female": "gu-IN-DhwaniNeural", "male": "gu-IN-NiranjanNeural"},
+    "he-il": {"female": "he-IL-HilaNeural", "male": "he-IL-AvriNeural"},
+    "hi-in": {"female": "hi-IN-SwaraNeural", "male": "hi-IN-MadhurNeural"},
+    "hu-hu": {"female": "hu-HU-NoemiNeural", "male": "hu-HU-TamasNeural"},
+    "is-is": {"female": "is-IS-GudrunNeural", "male": "is-IS-GunnarNeural"},
+    "id-id": {"female": "id-ID-GadisNeural", "male": "id-ID-ArdiNeural"},
+    "ga-ie": {"female": "ga-IE-OrlaNeural", "male": "ga-IE-ColmNeural"},
+    "it-it": {"female": "it-IT-IsabellaNeural", "male": "it-IT-DiegoNeural"},
+    "ja-jp": {"female": "ja-JP-NanamiNeural", "male": "ja-JP-KeitaNeural"},
+    "jv-id": {"female": "jv-ID-SitiNeural", "male": "jv-ID-DimasNeural"},
+    "kn-in": {"female": "kn-IN-SapnaNeural", "male": "kn-IN-GaganNeural"},
+    "kk-kz": {"female": "kk-KZ-AigulNeural", "male": "kk-KZ-DauletNeural"},
+    "km-kh": {"female": "km-KH-SreymomNeural", "male": "km-KH-PisethNeural"},
+    "ko-kr": {"female": "ko-KR-SunHiNeural", "male": "ko-KR-InJoonNeural"},
+    "lo-la": {"female": "lo-LA-KeomanyNeural", "male": "lo-LA-ChanthavongNeural"},
+    "lv-lv": {"female": "lv-LV-EveritaNeural", "male": "lv-LV-NilsNeural"},
+    "lt-lt": {"female": "lt-LT-OnaNeural", "male": "lt-LT-LeonasNeural"},
+    "mk-mk": {"female": "mk-MK-MarijaNeural", "male": "mk-MK-AleksandarNeural"},
+    "ms-my": {"female": "ms-MY-YasminNeural", "male": "ms-MY-OsmanNeural"},
+    "ml-in": {"female": "ml-IN-SobhanaNeural", "male": "ml-IN-MidhunNeural"},
+    "mt-mt": {"female": "mt-MT-GraceNeural", "male": "mt-MT-JosephNeural"},
+    "mr-in": {"female": "mr-IN-AarohiNeural", "male": "mr-IN-ManoharNeural"},
+    "mn-mn": {"female": "mn-MN-YesuiNeural", "male": "mn-MN-BataaNeural"},
+    "ne-np": {"female": "ne-NP-HemkalaNeural", "male": "ne-NP-SagarNeural"},
+    "nb-no": {"female": "nb-NO-PernilleNeural", "male": "nb-NO-FinnNeural"},
+    "ps-af": {"female": "ps-AF-LatifaNeural", "male": "ps-AF-GulNawazNeural"},
+    "fa-ir": {"female": "fa-IR-DilaraNeural", "male": "fa-IR-FaridNeural"},
+    "pl-pl": {"female": "pl-PL-ZofiaNeural", "male": "pl-PL-MarekNeural"},
+    "pt-br": {"female": "pt-BR-FranciscaNeural", "male": "pt-BR-AntonioNeural"},
+    "pt-pt": {"female": "pt-PT-RaquelNeural", "male": "pt-PT-DuarteNeural"},
+    "ro-ro": {"female": "ro-RO-AlinaNeural", "male": "ro-RO-EmilNeural"},
+    "ru-ru": {"female": "ru-RU-SvetlanaNeural", "male": "ru-RU-DmitryNeural"},
+    "sr-rs": {"female": "sr-RS-SophieNeural", "male": "sr-RS-NicholasNeural"},
+    "si-lk": {"female": "si-LK-ThiliniNeural", "male": "si-LK-SameeraNeural"},
+    "sk-sk": {"female": "sk-SK-ViktoriaNeural", "male": "sk-SK-LukasNeural"},
+    "sl-si": {"female": "sl-SI-PetraNeural", "male": "sl-SI-RokNeural"},
+    "so-so": {"female": "so-SO-UbaxNeural", "male": "so-SO-MuuseNeural"},
+    "es-ar": {"female": "es-AR-ElenaNeural", "male": "es-AR-TomasNeural"},
+    "es-bo": {"female": "es-BO-SofiaNeural", "male": "es-BO-MarceloNeural"},
+    "es-cl": {"female": "es-CL-CatalinaNeural", "male": "es-CL-LorenzoNeural"},
+    "es-co": {"female": "es-CO-SalomeNeural", "male": "es-CO-GonzaloNeural"},
+    "es-cr": {"female": "es-CR-MariaNeural", "male": "es-CR-JuanNeural"},
+    "es-cu": {"female": "es-CU-BelkysNeural", "male": "es-CU-ManuelNeural"},
+    "es-do": {"female": "es-DO-RamonaNeural", "male": "es-DO-EmilioNeural"},
+    "es-ec": {"female": "es-EC-AndreaNeural", "male": "es-EC-LuisNeural"},
+    "es-sv": {"female": "es-SV-LorenaNeural", "male": "es-SV-RodrigoNeural"},
+    "es-gq": {"female": "es-GQ-TeresaNeural", "male": "es-GQ-JavierNeural"},
+    "es-gt": {"female": "es-GT-MartaNeural", "male": "es-GT-AndresNeural"},
+    "es-hn": {"female": "es-HN-KarlaNeural", "male": "es-HN-CarlosNeural"},
+    "es-mx": {"female": "es-MX-DaliaNeural", "male": "es-MX-JorgeNeural"},
+    "es-ni": {"female": "es-NI-YolandaNeural", "male": "es-NI-FedericoNeural"},
+    "es-pa": {"female": "es-PA-MargaritaNeural", "male": "es-PA-RobertoNeural"},
+    "es-py": {"female": "es-PY-TaniaNeural", "male": "es-PY-MarioNeural"},
+    "es-pe": {"female": "es-PE-CamilaNeural", "male": "es-PE-AlexNeural"},
+    "es-pr": {"female": "es-PR-KarinaNeural", "male": "es-PR-VictorNeural"},
+    "es-es": {"female": "es-ES-ElviraNeural", "male": "es-ES-AlvaroNeural"},
+    "es-us": {"female": "es-US-PalomaNeural", "male": "es-US-AlonsoNeural"},
+    "es-uy": {"female": "es-UY-ValentinaNeural", "male": "es-UY-MateoNeural"},
+    "es-ve": {"female": "es-VE-PaolaNeural", "male": "es-VE-SebastianNeural"},
+    "su-id": {"female": "su-ID-TutiNeural", "male": "su-ID-JajangNeural"},
+    "sw-ke": {"female": "sw-KE-ZuriNeural", "male": "sw-KE-RafikiNeural"},
+    "sw-tz": {"female": "sw-TZ-RehemaNeural", "male": "sw-TZ-DaudiNeural"},
+    "sv-se": {"female": "sv-SE-SofieNeural", "male": "sv-SE-MattiasNeural"},
+    "ta-in": {"female": "ta-IN-PallaviNeural", "male": "ta-IN-ValluvarNeural"},
+    "ta-my": {"female": "ta-MY-KaniNeural", "male": "ta-MY-SuryaNeural"},
+    "ta-sg": {"female": "ta-SG-VenbaNeural", "male": "ta-SG-AnbuNeural"},
+    "ta-lk": {"female": "ta-LK-SaranyaNeural", "male": "ta-LK-KumarNeural"},
+    "te-in": {"female": "te-IN-ShrutiNeural", "male": "te-IN-MohanNeural"},
+    "th-th": {"female": "th-TH-PremwadeeNeural", "male": "th-TH-NiwatNeural"},
+    "tr-tr": {"female": "tr-TR-EmelNeural", "male": "tr-TR-AhmetNeural"},
+    "uk-ua": {"female": "uk-UA-PolinaNeural", "male": "uk-UA-OstapNeural"},
+    "ur-in": {"female": "ur-IN-GulNeural", "male": "ur-IN-SalmanNeural"},
+    "ur-pk": {"female": "ur-PK-UzmaNeural", "male": "ur-PK-AsadNeural"},
+    "uz-uz": {"female": "uz-UZ-MadinaNeural", "male": "uz-UZ-SardorNeural"},
+    "vi-vn": {"female": "vi-VN-HoaiMyNeural", "male": "vi-VN-NamMinhNeural"},
+    "cy-gb": {"female": "cy-GB-NiaNeural", "male": "cy-GB-AledNeural"},
+    "zu-za": {"female": "zu-ZA-ThandoNeural", "male": "zu-ZA-ThembaNeural"}
+}
+
+# Giọng Piper (file <tên>.onnx và <tên>.onnx.json trong LOCAL_TTS_VOICES_DIR) theo ngôn ngữ và giới tính
+LOCAL_TTS_VOICES = {
+    "vietnamese": {"female": "vi_VN-vais1000-medium", "male": "vi_VN-25hours_single-low"},
+    "english": {"female": "en_US-amy-medium", "male": "en_US-ryan-medium"},
+    "chinese": {"female": "zh_CN-huayan-medium"},
+    "french": {"female": "fr_FR-siwis-medium", "male": "fr_FR-tom-medium"},
+    "german": {"female": "de_DE-kerstin-low", "male": "de_DE-thorsten-medium"},
+    "spanish": {"female": "es_MX-claude-high", "male": "es_ES-davefx-medium"},
+    "italian": {"female": "it_IT-paola-medium", "male": "it_IT-riccardo-x_low"},
+    "portuguese": {"male": "pt_BR-faber-medium"},
+    "russian": {"female": "ru_RU-irina-medium", "male": "ru_RU-denis-medium"},
+    "polish": {"female": "pl_PL-gosia-medium", "male": "pl_PL-darkman-medium"},
+    "dutch": {"male": "nl_NL-mls-medium"},
+    "ukrainian": {"female": "uk_UA-lada-x_low", "male": "uk_UA-ukrainian_tts-medium"},
+    "turkish": {"male": "tr_TR-dfki-medium"},
+}
+
+
+def build_audio_filter(sample_rate, speed=1.0, pitch=1.0, volume=0.0):
+    """Tạo chuỗi bộ lọc ffmpeg cho tốc độ, âm điệu, cường độ (None nếu không có hiệu ứng)"""
+    filters = []
+    if pitch != 1.0:
+        filters.append(f"asetrate={sample_rate}*{pitch},aresample={sample_rate}")
+    if speed != 1.0:
+        filters.append(f"atempo={speed}")
+    if volume != 0.0:
+        filters.append(f"volume={volume}dB")
+    return ",".join(filters) if filters else None
+
+def get_tempo_factor(speed=1.0, pitch=1.0):
+    """Hệ số co giãn thời gian của bộ lọc: asetrate nhân tốc độ với pitch, atempo nhân với speed"""
+    return speed * pitch
+
+def get_track_effects(engine, speed=1.0, pitch=1.0, volume=0.0):
+    """
+    Trả về (speed, pitch, volume) cần áp dụng cục bộ; edge-tts đã xử lý speed/pitch phía server,
+    Piper xử lý speed khi tổng hợp (length_scale) nhưng không hỗ trợ pitch.
+    """
+    if engine == "edge_tts":
+        return 1.0, 1.0, volume
+    if engine == "local":
+        return 1.0, pitch, volume
+    return speed, pitch, volume
+
+def get_output_paths(output_file, formats=None):
+    """Đường dẫn file của từng định dạng xuất, cùng tên gốc với output_file; định dạng đầu tiên là bản chính"""
+    base = os.path.splitext(output_file)[0]
+    return {
+        name: f"{base}.{AUDIO_OUTPUT_PROFILES[name]['extension']}"
+        for name in (formats or AUDIO_OUTPUT_FORMATS)
+    }
+
+def _output_args(name):
+    """Tham số ffmpeg của một hồ sơ đầu ra"""
+    profile = AUDIO_OUTPUT_PROFILES[name]
+    args = {
+        "format": profile["format"],
+        "acodec": profile["codec"],
+        "ar": AUDIO_OUTPUT_SAMPLE_RATE,
+        "ac": AUDIO_OUTPUT_CHANNELS,
+    }
+    bitrate = profile["bitrate"] or profile.get("encode_bitrate")
+    if bitrate:
+        # Bitrate để trống: dùng mặc định của encoder
+        args["audio_bitrate"] = bitrate
+    if profile["format"] == "ipod":
+        # Đưa moov atom lên đầu để trình duyệt phát được trước khi tải hết
+        args["movflags"] = "+faststart"
+    return args
+
+def _apply_track_filters(stream, sample_rate, speed=1.0, pitch=1.0):
+    """Gắn bộ lọc tốc độ/âm điệu vào luồng ffmpeg (tương đương build_audio_filter, không có volume)"""
+    if pitch != 1.0:
+        stream = stream.filter("asetrate", f"{sample_rate}*{pitch}").filter("aresample", sample_rate)
+    if speed != 1.0:
+        stream = stream.filter("atempo", speed)
+    return stream
+
+def _encode_outputs(stream, outputs):
+    """Tạo một output cho mỗi định dạng từ cùng một luồng âm thanh, trong một tiến trình ffmpeg"""
+    if len(outputs) > 1:
+        split = stream.filter_multi_output("asplit", len(outputs))
+        sources = [split[i] for i in range(len(outputs))]
+    else:
+        sources = [stream]
+    nodes = [
+        ffmpeg.output(source, path, **_output_args(name))
+        for source, (name, path) in zip(sources, outputs.items())
+    ]
+    return ffmpeg.merge_outputs(*nodes).global_args('-loglevel', 'error')
+
+def transcode_outputs(source_file, outputs):
+    """Xuất file nguồn sang các định dạng trong outputs, chỉ giải mã file nguồn một lần"""
+    if not outputs:
+        return
+    stream = _encode_outputs(ffmpeg.input(source_file).audio, outputs)
+    ffmpeg.run(stream, overwrite_output=True, capture_stdout=True, capture_stderr=True)
+
+def decode_audio_file(source_file, sample_rate, channels=1):
+    """Giải mã file âm thanh bất kỳ thành mảng float32 (frames, channels) trong bộ nhớ bằng một lần gọi ffmpeg"""
+    stream = ffmpeg.input(source_file).audio.output('pipe:', format='f32le', acodec='pcm_f32le', ar=sample_rate, ac=channels)
+    out, _ = ffmpeg.run(stream.global_args('-loglevel', 'error'), capture_stdout=True, capture_stderr=True)
+    return np.frombuffer(out, dtype=np.float32).reshape(-1, channels)
+
+def remove_outputs(output_file, formats=None):
+    """Xóa các file đầu ra (kể cả file dở dang) của mọi định dạng"""
+    for path in get_output_paths(output_file, formats).values():
+        if os.path.exists(path):
+            os.remove(path)
+
+def uses_dsp():
+    """Có bước cắt khoảng lặng/khoảng nghỉ/chuẩn hóa nào cần giải mã PCM hay không"""
+    return AUDIO_TRIM_SILENCE or AUDIO_SENTENCE_PAUSE_MS > 0 or AUDIO_NORMALIZE_DBFS is not None
+
+def can_copy_mp3_frames(engine, speed, pitch, volume, outputs):
+    """Không có hiệu ứng cục bộ hay bước DSP nên track MP3 có thể ghép thẳng từ frame (Piper trả về WAV nên không áp dụng cho engine local)"""
+    return engine != "local" and "mp3" in outputs and get_track_effects(engine, speed, pitch, volume) == (1.0, 1.0, 0.0) and not uses_dsp()
 
 # Hàm áp dụng các hiệu ứng âm thanh (giữ nguyên)
 def apply_audio_effects_to_chunk(chunk, speed=1.0, pitch=1.0, volume=0.0):
@@ -26,10 +315,10 @@ def apply_audio_effects_to_chunk(chunk, speed=1.0, pitch=1.0, volume=0.0):
         mp3_buffer_input.seek(0)
         
         mp3_buffer_output = io.BytesIO()
-        speed_filter = f"atempo={speed}"
-        pitch_filter = f"asetrate=44100*{pitch},aresample=44100"
-        volume_filter = f"volume={volume}dB"
-        audio_filters = ",".join([pitch_filter, speed_filter, volume_filter])
+        # Dùng sample rate thực của chunk (gTTS là 24 kHz), không giả định 44.1 kHz
+        audio_filters = build_audio_filter(chunk.frame_rate, speed, pitch, volume)
+        if audio_filters is None:
+            return chunk
         
         stream = ffmpeg.input('pipe:', format='mp3')
         stream = ffmpeg.output(stream, 'pipe:', af=audio_filters, format="mp3")
@@ -52,293 +341,779 @@ def apply_audio_effects_to_chunk(chunk, speed=1.0, pitch=1.0, volume=0.0):
         print(f"Lỗi giá trị đầu vào: {e}")
         return None
 
-# Hàm tạo các chunk âm thanh
-async def generate_audio_chunks_in_memory(script, language, engine="gtts", gender="female", speed=1.0, pitch=1.0, volume=0.0):
-    # Danh sách ngôn ngữ được gTTS hỗ trợ
-    gtts_languages = {
-        "afrikaans": "af", "arabic": "ar", "bengali": "bn", "bulgarian": "bg", "catalan": "ca",
-        "chinese": "zh-cn", "croatian": "hr", "czech": "cs", "danish": "da", "dutch": "nl",
-        "english": "en", "estonian": "et", "finnish": "fi", "french": "fr", "german": "de",
-        "greek": "el", "gujarati": "gu", "hindi": "hi", "hungarian": "hu", "icelandic": "is",
-        "indonesian": "id", "italian": "it", "japanese": "ja", "korean": "ko", "latvian": "lv",
-        "lithuanian": "lt", "malay": "ms", "malayalam": "ml", "norwegian": "no", "polish": "pl",
-        "portuguese": "pt", "romanian": "ro", "russian": "ru", "serbian": "sr", "slovak": "sk",
-        "slovenian": "sl", "spanish": "es", "swahili": "sw", "swedish": "sv", "tamil": "ta",
-        "telugu": "te", "thai": "th", "turkish": "tr", "ukrainian": "uk", "urdu": "ur",
-        "vietnamese": "vi", "welsh": "cy"
-    }
-
-    # Danh sách giọng nói edge-tts theo ngôn ngữ và giới tính
-    edge_tts_voices = {
-        "af-za": {"female": "af-ZA-AdriNeural", "male": "af-ZA-WillemNeural"},
-        "sq-al": {"female": "sq-AL-AnilaNeural", "male": "sq-AL-IlirNeural"},
-        "am-et": {"female": "am-ET-MekdesNeural", "male": "am-ET-AmehaNeural"},
-        "ar-dz": {"female": "ar-DZ-AminaNeural", "male": "ar-DZ-IsmaelNeural"},
-        "ar-bh": {"female": "ar-BH-LailaNeural", "male": "ar-BH-AliNeural"},
-        "ar-eg": {"female": "ar-EG-SalmaNeural", "male": "ar-EG-ShakirNeural"},
-        "ar-iq": {"female": "ar-IQ-RanaNeural", "male": "ar-IQ-BasselNeural"},
-        "ar-jo": {"female": "ar-JO-SanaNeural", "male": "ar-JO-TaimNeural"},
-        "ar-kw": {"female": "ar-KW-NouraNeural", "male": "ar-KW-FahedNeural"},
-        "ar-lb": {"female": "ar-LB-LaylaNeural", "male": "ar-LB-RamiNeural"},
-        "ar-ly": {"female": "ar-LY-ImanNeural", "male": "ar-LY-OmarNeural"},
-        "ar-ma": {"female": "ar-MA-MounaNeural", "male": "ar-MA-JamalNeural"},
-        "ar-om": {"female": "ar-OM-AyshaNeural", "male": "ar-OM-AbdullahNeural"},
-        "ar-qa": {"female": "ar-QA-AmalNeural", "male": "ar-QA-MoazNeural"},
-        "ar-sa": {"female": "ar-SA-ZariyahNeural", "male": "ar-SA-HamedNeural"},
-        "ar-sy": {"female": "ar-SY-AmanyNeural", "male": "ar-SY-LaithNeural"},
-        "ar-tn": {"female": "ar-TN-ReemNeural", "male": "ar-TN-HediNeural"},
-        "ar-ae": {"female": "ar-AE-FatimaNeural", "male": "ar-AE-HamdanNeural"},
-        "ar-ye": {"female": "ar-YE-MaryamNeural", "male": "ar-YE-SalehNeural"},
-        "az-az": {"female": "az-AZ-BanuNeural", "male": "az-AZ-BabekNeural"},
-        "bn-bd": {"female": "bn-BD-NabanitaNeural", "male": "bn-BD-PradeepNeural"},
-        "bn-in": {"female": "bn-IN-TanishaaNeural", "male": "bn-IN-BashkarNeural"},
-        "bs-ba": {"female": "bs-BA-VesnaNeural", "male": "bs-BA-GoranNeural"},
-        "bg-bg": {"female": "bg-BG-KalinaNeural", "male": "bg-BG-BorislavNeural"},
-        "my-mm": {"female": "my-MM-NilarNeural", "male": "my-MM-ThihaNeural"},
-        "ca-es": {"female": "ca-ES-JoanaNeural", "male": "ca-ES-EnricNeural"},
-        "zh-hk": {"female": "zh-HK-HiuMaanNeural", "male": "zh-HK-WanLungNeural"},
-        "zh-cn": {"female": "zh-CN-XiaoxiaoNeural", "male": "zh-CN-YunxiNeural"},
-        "zh-cn-liaoning": {"female": "zh-CN-liaoning-XiaobeiNeural"},
-        "zh-tw": {"female": "zh-TW-HsiaoYuNeural", "male": "zh-TW-YunJheNeural"},
-        "zh-cn-shaanxi": {"female": "zh-CN-shaanxi-XiaoniNeural"},
-        "hr-hr": {"female": "hr-HR-GabrijelaNeural", "male": "hr-HR-SreckoNeural"},
-        "cs-cz": {"female": "cs-CZ-VlastaNeural", "male": "cs-CZ-AntoninNeural"},
-        "da-dk": {"female": "da-DK-ChristelNeural", "male": "da-DK-JeppeNeural"},
-        "nl-be": {"female": "nl-BE-DenaNeural", "male": "nl-BE-ArnaudNeural"},
-        "nl-nl": {"female": "nl-NL-ColetteNeural", "male": "nl-NL-MaartenNeural"},
-        "en-au": {"female": "en-AU-NatashaNeural", "male": "en-AU-WilliamNeural"},
-        "en-ca": {"female": "en-CA-ClaraNeural", "male": "en-CA-LiamNeural"},
-        "en-hk": {"female": "en-HK-YanNeural", "male": "en-HK-SamNeural"},
-        "en-in": {"female": "en-IN-NeerjaNeural", "male": "en-IN-PrabhatNeural"},
-        "en-ie": {"female": "en-IE-EmilyNeural", "male": "en-IE-ConnorNeural"},
-        "en-ke": {"female": "en-KE-AsiliaNeural", "male": "en-KE-ChilembaNeural"},
-        "en-nz": {"female": "en-NZ-MollyNeural", "male": "en-NZ-MitchellNeural"},
-        "en-ng": {"female": "en-NG-EzinneNeural", "male": "en-NG-AbeoNeural"},
-        "en-ph": {"female": "en-PH-RosaNeural", "male": "en-PH-JamesNeural"},
-        "en-sg": {"female": "en-SG-LunaNeural", "male": "en-SG-WayneNeural"},
-        "en-za": {"female": "en-ZA-LeahNeural", "male": "en-ZA-LukeNeural"},
-        "en-tz": {"female": "en-TZ-ImaniNeural", "male": "en-TZ-ElimuNeural"},
-        "en-gb": {"female": "en-GB-SoniaNeural", "male": "en-GB-RyanNeural"},
-        "en-us": {"female": "en-US-AriaNeural", "male": "en-US-GuyNeural"},
-        "et-ee": {"female": "et-EE-AnuNeural", "male": "et-EE-KertNeural"},
-        "fil-ph": {"female": "fil-PH-BlessicaNeural", "male": "fil-PH-AngeloNeural"},
-        "fi-fi": {"female": "fi-FI-NooraNeural", "male": "fi-FI-HarriNeural"},
-        "fr-be": {"female": "fr-BE-CharlineNeural", "male": "fr-BE-GerardNeural"},
-        "fr-ca": {"female": "fr-CA-SylvieNeural", "male": "fr-CA-AntoineNeural"},
-        "fr-fr": {"female": "fr-FR-DeniseNeural", "male": "fr-FR-HenriNeural"},
-        "fr-ch": {"female": "fr-CH-ArianeNeural", "male": "fr-CH-FabriceNeural"},
-        "gl-es": {"female": "gl-ES-SabelaNeural", "male": "gl-ES-RoiNeural"},
-        "ka-ge": {"female": "ka-GE-EkaNeural", "male": "ka-GE-GiorgiNeural"},
-        "de-at": {"female": "de-AT-IngridNeural", "male": "de-AT-JonasNeural"},
-        "de-de": {"female": "de-DE-KatjaNeural", "male": "de-DE-ConradNeural"},
-        "de-ch": {"female": "de-CH-LeniNeural", "male": "de-CH-JanNeural"},
-        "el-gr": {"female": "el-GR-AthinaNeural", "male": "el-GR-NestorasNeural"},
-        "gu-in": {"female": "gu-IN-DhwaniNeural", "male": "gu-IN-NiranjanNeural"},
-        "he-il": {"female": "he-IL-HilaNeural", "male": "he-IL-AvriNeural"},
-        "hi-in": {"female": "hi-IN-SwaraNeural", "male": "hi-IN-MadhurNeural"},
-        "hu-hu": {"female": "hu-HU-NoemiNeural", "male": "hu-HU-TamasNeural"},
-        "is-is": {"female": "is-IS-GudrunNeural", "male": "is-IS-GunnarNeural"},
-        "id-id": {"female": "id-ID-GadisNeural", "male": "id-ID-ArdiNeural"},
-        "ga-ie": {"female": "ga-IE-OrlaNeural", "male": "ga-IE-ColmNeural"},
-        "it-it": {"female": "it-IT-IsabellaNeural", "male": "it-IT-DiegoNeural"},
-        "ja-jp": {"female": "ja-JP-NanamiNeural", "male": "ja-JP-KeitaNeural"},
-        "jv-id": {"female": "jv-ID-SitiNeural", "male": "jv-ID-DimasNeural"},
-        "kn-in": {"female": "kn-IN-SapnaNeural", "male": "kn-IN-GaganNeural"},
-        "kk-kz": {"female": "kk-KZ-AigulNeural", "male": "kk-KZ-DauletNeural"},
-        "km-kh": {"female": "km-KH-SreymomNeural", "male": "km-KH-PisethNeural"},
-        "ko-kr": {"female": "ko-KR-SunHiNeural", "male": "ko-KR-InJoonNeural"},
-        "lo-la": {"female": "lo-LA-KeomanyNeural", "male": "lo-LA-ChanthavongNeural"},
-        "lv-lv": {"female": "lv-LV-EveritaNeural", "male": "lv-LV-NilsNeural"},
-        "lt-lt": {"female": "lt-LT-OnaNeural", "male": "lt-LT-LeonasNeural"},
-        "mk-mk": {"female": "mk-MK-MarijaNeural", "male": "mk-MK-AleksandarNeural"},
-        "ms-my": {"female": "ms-MY-YasminNeural", "male": "ms-MY-OsmanNeural"},
-        "ml-in": {"female": "ml-IN-SobhanaNeural", "male": "ml-IN-MidhunNeural"},
-        "mt-mt": {"female": "mt-MT-GraceNeural", "male": "mt-MT-JosephNeural"},
-        "mr-in": {"female": "mr-IN-AarohiNeural", "male": "mr-IN-ManoharNeural"},
-        "mn-mn": {"female": "mn-MN-YesuiNeural", "male": "mn-MN-BataaNeural"},
-        "ne-np": {"female": "ne-NP-HemkalaNeural", "male": "ne-NP-SagarNeural"},
-        "nb-no": {"female": "nb-NO-PernilleNeural", "male": "nb-NO-FinnNeural"},
-        "ps-af": {"female": "ps-AF-LatifaNeural", "male": "ps-AF-GulNawazNeural"},
-        "fa-ir": {"female": "fa-IR-DilaraNeural", "male": "fa-IR-FaridNeural"},
-        "pl-pl": {"female": "pl-PL-ZofiaNeural", "male": "pl-PL-MarekNeural"},
-        "pt-br": {"female": "pt-BR-FranciscaNeural", "male": "pt-BR-AntonioNeural"},
-        "pt-pt": {"female": "pt-PT-RaquelNeural", "male": "pt-PT-DuarteNeural"},
-        "ro-ro": {"female": "ro-RO-AlinaNeural", "male": "ro-RO-EmilNeural"},
-        "ru-ru": {"female": "ru-RU-SvetlanaNeural", "male": "ru-RU-DmitryNeural"},
-        "sr-rs": {"female": "sr-RS-SophieNeural", "male": "sr-RS-NicholasNeural"},
-        "si-lk": {"female": "si-LK-ThiliniNeural", "male": "si-LK-SameeraNeural"},
-        "sk-sk": {"female": "sk-SK-ViktoriaNeural", "male": "sk-SK-LukasNeural"},
-        "sl-si": {"female": "sl-SI-PetraNeural", "male": "sl-SI-RokNeural"},
-        "so-so": {"female": "so-SO-UbaxNeural", "male": "so-SO-MuuseNeural"},
-        "es-ar": {"female": "es-AR-ElenaNeural", "male": "es-AR-TomasNeural"},
-        "es-bo": {"female": "es-BO-SofiaNeural", "male": "es-BO-MarceloNeural"},
-        "es-cl": {"female": "es-CL-CatalinaNeural", "male": "es-CL-LorenzoNeural"},
-        "es-co": {"female": "es-CO-SalomeNeural", "male": "es-CO-GonzaloNeural"},
-        "es-cr": {"female": "es-CR-MariaNeural", "male": "es-CR-JuanNeural"},
-        "es-cu": {"female": "es-CU-BelkysNeural", "male": "es-CU-ManuelNeural"},
-        "es-do": {"female": "es-DO-RamonaNeural", "male": "es-DO-EmilioNeural"},
-        "es-ec": {"female": "es-EC-AndreaNeural", "male": "es-EC-LuisNeural"},
-        "es-sv": {"female": "es-SV-LorenaNeural", "male": "es-SV-RodrigoNeural"},
-        "es-gq": {"female": "es-GQ-TeresaNeural", "male": "es-GQ-JavierNeural"},
-        "es-gt": {"female": "es-GT-MartaNeural", "male": "es-GT-AndresNeural"},
-        "es-hn": {"female": "es-HN-KarlaNeural", "male": "es-HN-CarlosNeural"},
-        "es-mx": {"female": "es-MX-DaliaNeural", "male": "es-MX-JorgeNeural"},
-        "es-ni": {"female": "es-NI-YolandaNeural", "male": "es-NI-FedericoNeural"},
-        "es-pa": {"female": "es-PA-MargaritaNeural", "male": "es-PA-RobertoNeural"},
-        "es-py": {"female": "es-PY-TaniaNeural", "male": "es-PY-MarioNeural"},
-        "es-pe": {"female": "es-PE-CamilaNeural", "male": "es-PE-AlexNeural"},
-        "es-pr": {"female": "es-PR-KarinaNeural", "male": "es-PR-VictorNeural"},
-        "es-es": {"female": "es-ES-ElviraNeural", "male": "es-ES-AlvaroNeural"},
-        "es-us": {"female": "es-US-PalomaNeural", "male": "es-US-AlonsoNeural"},
-        "es-uy": {"female": "es-UY-ValentinaNeural", "male": "es-UY-MateoNeural"},
-        "es-ve": {"female": "es-VE-PaolaNeural", "male": "es-VE-SebastianNeural"},
-        "su-id": {"female": "su-ID-TutiNeural", "male": "su-ID-JajangNeural"},
-        "sw-ke": {"female": "sw-KE-ZuriNeural", "male": "sw-KE-RafikiNeural"},
-        "sw-tz": {"female": "sw-TZ-RehemaNeural", "male": "sw-TZ-DaudiNeural"},
-        "sv-se": {"female": "sv-SE-SofieNeural", "male": "sv-SE-MattiasNeural"},
-        "ta-in": {"female": "ta-IN-PallaviNeural", "male": "ta-IN-ValluvarNeural"},
-        "ta-my": {"female": "ta-MY-KaniNeural", "male": "ta-MY-SuryaNeural"},
-        "ta-sg": {"female": "ta-SG-VenbaNeural", "male": "ta-SG-AnbuNeural"},
-        "ta-lk": {"female": "ta-LK-SaranyaNeural", "male": "ta-LK-KumarNeural"},
-        "te-in": {"female": "te-IN-ShrutiNeural", "male": "te-IN-MohanNeural"},
-        "th-th": {"female": "th-TH-PremwadeeNeural", "male": "th-TH-NiwatNeural"},
-        "tr-tr": {"female": "tr-TR-EmelNeural", "male": "tr-TR-AhmetNeural"},
-        "uk-ua": {"female": "uk-UA-PolinaNeural", "male": "uk-UA-OstapNeural"},
-        "ur-in": {"female": "ur-IN-GulNeural", "male": "ur-IN-SalmanNeural"},
-        "ur-pk": {"female": "ur-PK-UzmaNeural", "male": "ur-PK-AsadNeural"},
-        "uz-uz": {"female": "uz-UZ-MadinaNeural", "male": "uz-UZ-SardorNeural"},
-        "vi-vn": {"female": "vi-VN-HoaiMyNeural", "male": "vi-VN-NamMinhNeural"},
-        "cy-gb": {"female": "cy-GB-NiaNeural", "male": "cy-GB-AledNeural"},
-        "zu-za": {"female": "zu-ZA-ThandoNeural", "male": "zu-ZA-ThembaNeural"}
-    }
-
-    # Chọn giọng nói dựa trên engine
+def resolve_voice(engine, language, gender="female"):
+    """Trả về mã ngôn ngữ gTTS hoặc tên giọng edge-tts, None nếu không được hỗ trợ"""
     if engine == "gtts":
-        language_code = gtts_languages.get(language.lower())
+        language_code = GTTS_LANGUAGES.get(language.lower())
         if not language_code:
             print(f"Ngôn ngữ '{language}' không được gTTS hỗ trợ.")
-            return None, None
-    elif engine == "edge_tts":
-        voices = edge_tts_voices.get(language.lower())
+        return language_code
+    if engine == "edge_tts":
+        voices = EDGE_TTS_VOICES.get(language.lower())
         if not voices:
             print(f"Ngôn ngữ '{language}' không được edge-tts hỗ trợ.")
-            return None, None
-        voice = voices.get(gender.lower(), voices.get("female", voices.get("male")))
+            return None
+        return voices.get(gender.lower(), voices.get("female", voices.get("male")))
+    if engine == "local":
+        voices = LOCAL_TTS_VOICES.get(language.lower())
+        if not voices:
+            print(f"Ngôn ngữ '{language}' chưa có giọng Piper cục bộ.")
+            return None
+        return voices.get(gender.lower(), voices.get("female", voices.get("male")))
+    print(f"Engine '{engine}' không được hỗ trợ. Chọn 'gtts', 'edge_tts' hoặc 'local'.")
+    return None
+
+def _fetch_gtts_bytes(index, sentence, language_code):
+    """Gọi gTTS lấy MP3 của một câu (blocking, chạy trong executor)"""
+    tts = gTTS(sentence, lang=language_code, slow=False)
+    mp3_buffer = io.BytesIO()
+    tts.write_to_fp(mp3_buffer)
+    if mp3_buffer.getbuffer().nbytes == 0:
+        raise ValueError(f"Buffer rỗng cho chunk {index + 1}")
+    return mp3_buffer.getvalue()
+
+async def _fetch_edge_tts_bytes(index, sentence, voice, speed=1.0, pitch=1.0):
+    """
+    Stream MP3 của một câu từ edge-tts thẳng vào bộ nhớ (tốc độ và âm điệu được áp dụng phía server).
+    :return: (bytes, words) - words là timings từng từ lấy từ sự kiện WordBoundary.
+    """
+    rate = (speed - 1.0) * 100
+    rate_str = f"{rate:+.0f}%"
+    pitch_hz = (pitch - 1.0) * 100
+    pitch_str = f"{pitch_hz:+.0f}Hz"
+    try:
+        communicate = edge_tts.Communicate(sentence, voice, rate=rate_str, pitch=pitch_str, boundary="WordBoundary")
+    except TypeError:
+        # edge-tts < 7 không có tham số boundary và luôn gửi WordBoundary
+        communicate = edge_tts.Communicate(sentence, voice, rate=rate_str, pitch=pitch_str)
+
+    audio = bytearray()
+    words = []
+    async for message in communicate.stream():
+        if message["type"] == "audio":
+            audio.extend(message["data"])
+        elif message["type"] == "WordBoundary":
+            # offset và duration tính theo đơn vị 100 ns
+            start_time = message["offset"] / 10_000_000
+            words.append({
+                "start_time": start_time,
+                "end_time": start_time + message["duration"] / 10_000_000,
+                "content": message["text"]
+            })
+
+    if not audio:
+        raise ValueError(f"Không nhận được âm thanh cho chunk {index + 1}")
+    return bytes(audio), words
+
+def _fetch_local_batch_bytes(sentences, voice, speed=1.0):
+    """
+    Tổng hợp nhiều câu trong một lần chạy Piper (--json-input, mỗi dòng một câu và file WAV riêng).
+    :return: danh sách bytes WAV hoặc Exception theo thứ tự sentences (blocking, chạy trong executor)
+    """
+    model = os.path.join(LOCAL_TTS_VOICES_DIR, f"{voice}.onnx")
+    if not os.path.exists(model):
+        raise FileNotFoundError(f"Không tìm thấy giọng Piper: {model}")
+
+    with tempfile.TemporaryDirectory(prefix="piper_") as output_dir:
+        paths = [os.path.join(output_dir, f"{i}.wav") for i in range(len(sentences))]
+        lines = [
+            json.dumps({"text": sentence, "output_file": path}, ensure_ascii=False)
+            for sentence, path in zip(sentences, paths)
+        ]
+        args = [
+            LOCAL_TTS_BINARY,
+            "--model", model,
+            "--json-input",
+            # length_scale > 1 là đọc chậm hơn
+            "--length_scale", f"{1.0 / speed:.4f}",
+            "--quiet",
+        ]
+        process = subprocess.run(
+            args,
+            input=("\n".join(lines) + "\n").encode("utf-8"),
+            capture_output=True,
+            timeout=LOCAL_TTS_TIMEOUT
+        )
+        if process.returncode != 0:
+            raise RuntimeError(f"Piper lỗi ({process.returncode}): {process.stderr.decode(errors='replace').strip()}")
+
+        results = []
+        for i, path in enumerate(paths):
+            try:
+                with open(path, "rb") as f:
+                    results.append(f.read())
+            except OSError:
+                results.append(ValueError(f"Piper không tạo được âm thanh cho câu: {sentences[i]}"))
+        return results
+
+async def fetch_local_batch(sentences, voice, speed=1.0):
+    """
+    Lấy WAV của một lô câu cho engine local: câu đã có trong cache được trả ngay,
+    các câu còn lại được tổng hợp trong một lần gọi Piper.
+    :return: danh sách kết quả như fetch_sentence_audio (hoặc Exception) theo thứ tự sentences
+    """
+    loop = asyncio.get_running_loop()
+    # Piper không hỗ trợ pitch (áp dụng cục bộ) nên pitch không nằm trong khóa cache
+    keys = [tts_cache.make_key("local", voice, sentence, speed) for sentence in sentences]
+    results = await loop.run_in_executor(None, lambda: [tts_cache.get(key) for key in keys])
+
+    missing = [i for i, data in enumerate(results) if data is None]
+    if missing:
+        synthesized = await loop.run_in_executor(
+            None, _fetch_local_batch_bytes, [sentences[i] for i in missing], voice, speed
+        )
+        for i, data in zip(missing, synthesized):
+            results[i] = data
+            if not isinstance(data, Exception):
+                await loop.run_in_executor(None, tts_cache.put, keys[i], data)
+
+    return [data if isinstance(data, Exception) else {"data": data, "words": None} for data in results]
+
+def _decode_chunk(index, data, engine, speed=1.0, pitch=1.0, volume=0.0, effects_mode=AUDIO_EFFECTS_MODE):
+    """
+    Giải mã âm thanh của một câu (MP3, hoặc WAV với engine local), áp dụng các hiệu ứng cục bộ
+    và xử lý DSP (blocking).
+    :return: (chunk, số giây khoảng lặng bị cắt ở đầu câu)
+    """
+    chunk = AudioSegment.from_file(io.BytesIO(data), format="wav" if data[:4] == b"RIFF" else "mp3")
+    gain_db = 0.0
+    # Ở chế độ "track", tốc độ/âm điệu/cường độ được áp dụng một lần cho cả track khi ghép
+    if effects_mode != "track":
+        local_speed, local_pitch, _ = get_track_effects(engine, speed, pitch, volume)
+        if local_speed != 1.0 or local_pitch != 1.0:
+            # ffmpeg chỉ còn xử lý tốc độ/âm điệu, cường độ được nhân trên NumPy
+            chunk = apply_audio_effects_to_chunk(chunk, local_speed, local_pitch)
+            if chunk is None:
+                raise ValueError(f"Lỗi áp dụng hiệu ứng cho chunk {index + 1}")
+        gain_db = volume
+
+    if gain_db == 0.0 and not AUDIO_TRIM_SILENCE and AUDIO_NORMALIZE_DBFS is None:
+        return chunk, 0.0
+    samples, offset = dsp.process_chunk(
+        dsp.segment_to_array(chunk),
+        chunk.frame_rate,
+        gain_db=gain_db,
+        trim=AUDIO_TRIM_SILENCE,
+        threshold_db=AUDIO_SILENCE_THRESHOLD_DB,
+        normalize_dbfs=AUDIO_NORMALIZE_DBFS
+    )
+    return dsp.array_to_segment(samples, chunk.frame_rate), offset
+
+async def fetch_sentence_audio(index, sentence, engine, voice, speed=1.0, pitch=1.0):
+    """
+    Lấy MP3 của một câu từ cache, nếu chưa có thì gọi engine TTS và lưu lại.
+    :return: {"data": bytes MP3, "words": timings từng từ (chỉ edge-tts) hoặc None}
+    """
+    loop = asyncio.get_running_loop()
+    if engine == "gtts":
+        # gTTS tạo giọng gốc, tốc độ/âm điệu được áp dụng cục bộ nên không nằm trong khóa cache
+        cache_key = tts_cache.make_key(engine, voice, sentence)
+    else:
+        cache_key = tts_cache.make_key(engine, voice, sentence, speed, pitch)
+
+    cached = await loop.run_in_executor(None, lambda: tts_cache.get(cache_key, with_meta=True))
+    if cached is not None:
+        data, meta = cached
+        return {"data": data, "words": meta.get("words") if meta else None}
+
+    words = None
+    if engine == "gtts":
+        # gTTS là blocking nên chạy trong executor để không chặn event loop
+        data = await loop.run_in_executor(None, _fetch_gtts_bytes, index, sentence, voice)
+    else:
+        data, words = await _fetch_edge_tts_bytes(index, sentence, voice, speed, pitch)
+
+    meta = {"words": words} if words else None
+    await loop.run_in_executor(None, tts_cache.put, cache_key, data, meta)
+    return {"data": data, "words": words}
+
+# Hàm tạo các chunk âm thanh
+async def generate_audio_chunks_in_memory(sentences, engine, voice, speed=1.0, pitch=1.0, max_workers=None):
+    """
+    Tổng hợp song song các câu (tối đa max_workers câu cùng lúc) và yield (index, sentence, result)
+    theo đúng thứ tự câu. result là kết quả của fetch_sentence_audio, hoặc Exception nếu câu đó bị lỗi.
+    """
+    workers = max_workers or TTS_MAX_WORKERS.get(engine, 1)
+    semaphore = asyncio.Semaphore(max(1, workers))
+
+    if engine == "local":
+        tasks, batches = _schedule_local_batches(sentences, voice, speed, semaphore)
     else:
-        print(f"Engine '{engine}' không được hỗ trợ. Chọn 'gtts' hoặc 'edge_tts'.")
-        return None, None
+        async def worker(index, sentence):
+            async with semaphore:
+                return await fetch_sentence_audio(index, sentence, engine, voice, speed, pitch)
 
-    # Chia script thành các câu
-    sentences = [s.strip() + '.' for s in re.split(r'[.!?]+(?=\s)', script) if s.strip()]
-    chunks = []
+        tasks = [asyncio.ensure_future(worker(i, sentence)) for i, sentence in enumerate(sentences)]
+        batches = []
+    try:
+        for i, sentence in enumerate(sentences):
+            try:
+                result = await tasks[i]
+            except Exception as e:
+                result = e
+            # Bỏ tham chiếu tới kết quả đã trả về để không giữ lại toàn bộ âm thanh
+            tasks[i] = None
+            yield i, sentence, result
+    finally:
+        for task in batches + tasks:
+            if task is not None and not task.done():
+                task.cancel()
 
-    for i, sentence in enumerate(sentences, 1):
-        temp_file = None
+def _schedule_local_batches(sentences, voice, speed, semaphore):
+    """
+    Chia câu thành các lô LOCAL_TTS_BATCH_SIZE câu, mỗi lô một lần gọi Piper (tối đa semaphore lô cùng lúc).
+    :return: (future của từng câu, task của từng lô)
+    """
+    loop = asyncio.get_running_loop()
+    futures = [loop.create_future() for _ in sentences]
+    batch_size = max(1, LOCAL_TTS_BATCH_SIZE)
+
+    async def run_batch(start):
+        batch = sentences[start:start + batch_size]
         try:
-            if engine == "gtts":
-                # Tạo giọng nói với gTTS (dùng BytesIO)
-                tts = gTTS(sentence, lang=language_code, slow=False)
-                mp3_buffer = io.BytesIO()
-                tts.write_to_fp(mp3_buffer)
-                mp3_buffer.seek(0)
-                if mp3_buffer.getbuffer().nbytes == 0:
-                    raise ValueError(f"Buffer rỗng cho chunk {i}")
-                chunk = AudioSegment.from_mp3(mp3_buffer)
+            async with semaphore:
+                results = await fetch_local_batch(batch, voice, speed)
+        except Exception as e:
+            results = [e] * len(batch)
+        for offset, result in enumerate(results):
+            future = futures[start + offset]
+            if future is None or future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
             else:
-                # Tạo giọng nói với edge-tts (dùng file tạm)
-                rate = (speed - 1.0) * 100
-                rate_str = f"{rate:+.0f}%"
-                pitch_hz = (pitch - 1.0) * 100
-                pitch_str = f"{pitch_hz:+.0f}Hz"
-                communicate = edge_tts.Communicate(sentence, voice, rate=rate_str, pitch=pitch_str)
-                
-                # Tạo file tạm
-                with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as temp:
-                    temp_file = temp.name
-                    await communicate.save(temp_file)
-                
-                # Kiểm tra xem file có tồn tại và có dữ liệu không
-                if not os.path.exists(temp_file) or os.path.getsize(temp_file) == 0:
-                    raise ValueError(f"File tạm rỗng cho chunk {i}")
-                
-                # Đọc file tạm vào AudioSegment
-                chunk = AudioSegment.from_file(temp_file, format="mp3")
-
-            # Áp dụng hiệu ứng âm thanh
-            if engine == "gtts" and (speed != 1.0 or pitch != 1.0 or volume != 0.0):
-                styled_chunk = apply_audio_effects_to_chunk(chunk, speed, pitch, volume)
-                if styled_chunk is None:
-                    print(f"Bỏ qua chunk {i} do lỗi áp dụng hiệu ứng")
-                    continue
-                chunk = styled_chunk
-            elif engine == "edge_tts" and volume != 0.0:
-                chunk = chunk + volume
+                future.set_result(result)
 
-            chunks.append(chunk)
-            print(f"Chunk {i}: {sentence} - Độ dài: {len(chunk)/1000:.2f}s")
-        except Exception as e:
-            print(f"Lỗi tạo chunk {i}: {e}")
-            continue
-        finally:
-            # Xóa file tạm nếu tồn tại
-            if temp_file and os.path.exists(temp_file):
-                try:
-                    os.remove(temp_file)
-                except Exception as e:
-                    print(f"Lỗi khi xóa file tạm cho chunk {i}: {e}")
-
-    if not chunks:
-        print("Không tạo được chunk nào")
-        return None, None
-    return sentences, chunks
+    batches = [asyncio.ensure_future(run_batch(start)) for start in range(0, len(sentences), batch_size)]
+    return futures, batches
+
+class StreamingAudioAssembler:
+    """
+    Ghép các chunk bằng cách đẩy PCM vào một tiến trình ffmpeg duy nhất, ghi nhận timings trên đường đi.
+    Cường độ và khoảng nghỉ giữa các câu được xử lý trên NumPy, ffmpeg chỉ còn lo tốc độ/âm điệu.
+    Mỗi định dạng trong formats được mã hóa từ cùng luồng PCM; output_file là file của định dạng đầu tiên.
+    """
+
+    def __init__(self, output_file, speed=1.0, pitch=1.0, volume=0.0, pause_ms=AUDIO_SENTENCE_PAUSE_MS, formats=None):
+        self.outputs = get_output_paths(output_file, formats)
+        self.output_file = next(iter(self.outputs.values()))
+        self.speed = speed
+        self.pitch = pitch
+        self.volume = volume
+        self.pause_ms = pause_ms
+        self.tempo_factor = get_tempo_factor(speed, pitch)
+        self.process = None
+        self.sample_rate = None
+        self.channels = None
+        self.sample_width = None
+        self.frames_written = 0
+
+    def _start(self, chunk):
+        """Khởi động ffmpeg theo định dạng của chunk đầu tiên"""
+        self.sample_rate = chunk.frame_rate
+        self.channels = chunk.channels
+        self.sample_width = 2
+        stream = ffmpeg.input(
+            'pipe:',
+            format=f"s{self.sample_width * 8}le",
+            ar=self.sample_rate,
+            ac=self.channels
+        )
+        stream = _apply_track_filters(stream, self.sample_rate, self.speed, self.pitch)
+        args = ffmpeg.compile(_encode_outputs(stream, self.outputs), overwrite_output=True)
+        self.process = subprocess.Popen(args, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    def _time(self, frames):
+        return frames / self.sample_rate / self.tempo_factor
+
+    def add_chunk(self, chunk, pause=True):
+        """
+        Ghi PCM của chunk vào encoder, trả về (start_time, end_time) trên track đầu ra.
+        pause=False khi chunk nối tiếp phần trước của cùng một câu (không chèn khoảng nghỉ).
+        """
+        if self.process is None:
+            self._start(chunk)
+        chunk = chunk.set_frame_rate(self.sample_rate).set_channels(self.channels).set_sample_width(self.sample_width)
+        if self.frames_written and self.pause_ms and pause:
+            # Khoảng nghỉ được kéo giãn trước bộ lọc để trên track đầu ra luôn đúng pause_ms
+            pause = dsp.silence(self.pause_ms * self.tempo_factor, self.sample_rate, self.channels)
+            self.process.stdin.write(pause.tobytes())
+            self.frames_written += len(pause)
+        samples = dsp.apply_gain(dsp.segment_to_array(chunk), self.volume)
+        start_frames = self.frames_written
+        self.process.stdin.write(samples.tobytes())
+        self.frames_written += len(samples)
+        return self._time(start_frames), self._time(self.frames_written)
+
+    def close(self):
+        """Kết thúc encoder và chờ ghi xong file"""
+        if self.process is None:
+            return
+        self.process.stdin.close()
+        err = self.process.stderr.read()
+        if self.process.wait() != 0:
+            raise ffmpeg.Error('ffmpeg', None, err)
+
+    def abort(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+        for path in self.outputs.values():
+            if os.path.exists(path):
+                os.remove(path)
 
 # Hàm ghép các chunk (giữ nguyên)
-def combine_and_time_chunks_in_memory(chunks, output_file="output.mp3"):
+def combine_and_time_chunks_in_memory(chunks, output_file="output.mp3", speed=1.0, pitch=1.0, volume=0.0):
+    """Ghép các chunk qua StreamingAudioAssembler; hiệu ứng (nếu có) áp dụng một lần cho cả track"""
     if chunks is None:
         print("Không có chunks để ghép do lỗi trước đó")
         return None
-    
-    combined_audio = AudioSegment.empty()
+
+    assembler = StreamingAudioAssembler(output_file, speed, pitch, volume)
     timings = []
-    cumulative_start_time = 0.0
-    
-    for i, chunk in enumerate(chunks, 1):
-        duration = len(chunk) / 1000
-        cumulative_end_time = cumulative_start_time + duration
-        timings.append({
-            "start_time": round(cumulative_start_time, 2),
-            "end_time": round(cumulative_end_time, 2),
-            "content": f"Chunk {i}"
-        })
-        combined_audio += chunk
-        cumulative_start_time = cumulative_end_time
-    
-    combined_audio.export(output_file, format="mp3")
-    print(f"Đã tạo file âm thanh: {output_file}")
+    try:
+        for i, chunk in enumerate(chunks, 1):
+            start_time, end_time = assembler.add_chunk(chunk)
+            timings.append({
+                "start_time": round(start_time, 2),
+                "end_time": round(end_time, 2),
+                "content": f"Chunk {i}"
+            })
+        assembler.close()
+    except (ffmpeg.Error, OSError) as e:
+        assembler.abort()
+        print(f"Lỗi khi ghép âm thanh: {e.stderr.decode() if isinstance(e, ffmpeg.Error) and e.stderr else e}")
+        return None
+
+    print(f"Đã tạo file âm thanh: {assembler.output_file}")
     return timings
 
-# Hàm chính (giữ nguyên)
-async def process_script_to_audio_and_timings(script, language, engine="gtts", gender="female", speed=1.0, pitch=1.0, volume=0.0, output_file="output.mp3"):
-    result = await generate_audio_chunks_in_memory(script, language, engine, gender, speed, pitch, volume)
-    if not result:
-        print("Lỗi trong quá trình tạo chunk, không thể tiếp tục")
-        return None, None
-    sentences, chunks = result
-    
-    timings = combine_and_time_chunks_in_memory(chunks, output_file)
-    if timings is None:
-        return None, None
-    
-    for i, timing in enumerate(timings):
-        timing["content"] = sentences[i]
+def _build_timing(sentence, start_time, end_time, words=None, tempo_factor=1.0, offset=0.0):
+    """
+    Tạo mục timing của một câu; words (nếu có) được dời theo vị trí câu trên track.
+    offset là số giây đã bị cắt ở đầu câu trước khi áp dụng tempo_factor.
+    """
+    timing = {
+        "start_time": round(start_time, 2),
+        "end_time": round(end_time, 2),
+        "content": sentence
+    }
+    if words:
+        # Timings từng từ từ WordBoundary, tính tương đối so với đầu câu
+        timing["words"] = [
+            {
+                "start_time": round(start_time + max(0.0, word["start_time"] - offset) / tempo_factor, 2),
+                "end_time": round(start_time + max(0.0, word["end_time"] - offset) / tempo_factor, 2),
+                "content": word["content"]
+            } for word in words
+        ]
+    return timing
+
+def _map_chunk_timings(chunk, start_time, end_time, words=None, tempo_factor=1.0, offset=0.0):
+    """
+    Chia timing của một chunk (có thể gồm nhiều câu hoặc một phần câu) cho từng câu gốc.
+    Ranh giới giữa các câu lấy từ timings từng từ (edge-tts) nếu có, nếu không thì chia theo số ký tự.
+    :return: danh sách (chỉ số câu, timing của phần câu trong chunk)
+    """
+    timing = _build_timing(chunk["text"], start_time, end_time, words, tempo_factor, offset)
+    parts = chunk["parts"]
+    if len(parts) == 1:
+        timing["content"] = parts[0][1]
+        return [(parts[0][0], timing)]
+
+    # Vị trí bắt đầu của từng phần trong văn bản chunk, để gán mỗi từ về đúng câu
+    bounds = []
+    position = 0
+    for _, text in parts:
+        position = chunk["text"].find(text, position)
+        bounds.append(position)
+        position += len(text)
+    part_words = [[] for _ in parts]
+    cursor = 0
+    for word in timing.get("words", []):
+        found = chunk["text"].find(word["content"], cursor)
+        if found != -1:
+            cursor = found
+        part_words[max(0, bisect.bisect_right(bounds, cursor) - 1)].append(word)
+
+    weights = [len(re.sub(r"\s", "", text)) or 1 for _, text in parts]
+    cuts = [start_time]
+    for k in range(len(parts) - 1):
+        cut = start_time + (end_time - start_time) * sum(weights[:k + 1]) / sum(weights)
+        if part_words[k] and part_words[k + 1]:
+            cut = (part_words[k][-1]["end_time"] + part_words[k + 1][0]["start_time"]) / 2
+        cuts.append(cut)
+    cuts.append(end_time)
+
+    mapped = []
+    for k, (index, text) in enumerate(parts):
+        item = {"start_time": round(cuts[k], 2), "end_time": round(cuts[k + 1], 2), "content": text}
+        if part_words[k]:
+            item["words"] = part_words[k]
+        mapped.append((index, item))
+    return mapped
+
+def _add_sentence_timing(timings, sentences, index, item):
+    """Thêm timing của một câu; câu dài bị chia thành nhiều chunk được nối thành một mục"""
+    if timings and timings[-1]["index"] == index:
+        timings[-1]["end_time"] = item["end_time"]
+        if item.get("words"):
+            timings[-1].setdefault("words", []).extend(item["words"])
+        return
+    timings.append({**item, "index": index, "content": sentences[index]})
+
+def _finish_timings(output_file, timings, failed):
+    """In thông tin kiểm tra và trả về (output_file, timings_string, failed)"""
+    print(f"Đã tạo file âm thanh: {', '.join(get_output_paths(output_file).values())}")
     
+    # Chỉ số câu chỉ dùng khi ghép timings, không lưu vào kết quả
+    timings = [{key: value for key, value in timing.items() if key != "index"} for timing in timings]
     timings_string = json.dumps(timings, ensure_ascii=False, indent=4)
     
-    audio = MP3(output_file)
-    duration_seconds = audio.info.length
-    
     print("Timings:\n", timings_string)
     print(f"Tổng thời gian từ timings: {timings[-1]['end_time']:.2f} giây")
-    print(f"Độ dài từ metadata (mutagen): {duration_seconds:.2f} giây")
+    mp3_file = get_output_paths(output_file).get("mp3")
+    if mp3_file:
+        print(f"Độ dài từ header frame MP3: {mp3_file_duration(mp3_file):.2f} giây")
+    if failed:
+        print(f"Các câu bị lỗi (chỉ số): {[item['index'] for item in failed]}")
+    print(f"Cache TTS: {tts_cache.stats()}")
     
-    return output_file, timings_string
\ No newline at end of file
+    return output_file, timings_string, failed
+
+def _bitrate_bps(bitrate):
+    """Bitrate dạng ffmpeg ("64k", "64000") sang bit/giây"""
+    bitrate = bitrate.strip().lower()
+    if bitrate.endswith("k"):
+        return int(float(bitrate[:-1]) * 1000)
+    return int(float(bitrate))
+
+def matches_mp3_profile(data):
+    """
+    Frame MP3 đầu tiên của data có cùng sample rate, số kênh và bitrate với hồ sơ mp3
+    (AUDIO_MP3_BITRATE để trống: chấp nhận bitrate của nguồn), tức là chép nguyên frame vẫn đúng hồ sơ.
+    """
+    header = next((header for _, header in iter_frames(data)), None)
+    if header is None:
+        return False
+    bitrate = AUDIO_OUTPUT_PROFILES["mp3"]["bitrate"]
+    if bitrate and _bitrate_bps(bitrate) != header["bitrate"]:
+        return False
+    return header["sample_rate"] == AUDIO_OUTPUT_SAMPLE_RATE and header["channels"] == AUDIO_OUTPUT_CHANNELS
+
+def _conform_mp3(data):
+    """Mã hóa lại một chunk MP3 theo hồ sơ mp3 để ghép được theo frame"""
+    stream = ffmpeg.output(ffmpeg.input('pipe:', format='mp3'), 'pipe:', **_output_args("mp3"))
+    out, _ = ffmpeg.run(stream, input=data, capture_stdout=True, capture_stderr=True)
+    return out
+
+def _encode_preview(chunk, speed=1.0, pitch=1.0, volume=0.0):
+    """MP3 xem trước của một chunk theo hồ sơ mp3, kèm các hiệu ứng track (tốc độ, âm điệu, cường độ) của bước ghép"""
+    samples = dsp.apply_gain(dsp.segment_to_array(chunk), volume)
+    stream = ffmpeg.input('pipe:', format='s16le', ar=chunk.frame_rate, ac=chunk.channels)
+    stream = _apply_track_filters(stream, chunk.frame_rate, speed, pitch)
+    stream = ffmpeg.output(stream, 'pipe:', **_output_args("mp3")).global_args('-loglevel', 'error')
+    out, _ = ffmpeg.run(stream, input=samples.tobytes(), capture_stdout=True, capture_stderr=True)
+    return out
+
+async def iter_script_audio(script, language, engine="gtts", gender="female", speed=1.0, pitch=1.0, volume=0.0, output_file="output.mp3", max_workers=None, effects_mode=AUDIO_EFFECTS_MODE, previews=False):
+    """
+    Tạo audio cho script và yield sự kiện ngay khi từng chunk được ghi vào track. Script được chia thành
+    câu rồi gom/chia thành chunk (segment_script); timings luôn theo câu gốc.
+      {"type": "chunk", "index", "timings", "audio"}  - timings của các câu (hoặc phần câu) trong chunk,
+                                                         audio là MP3 của chunk nếu previews=True
+      {"type": "failed", "index", "content", "error"} - câu không tạo được âm thanh
+      {"type": "done", "output_file", "timings_string", "failed"} hoặc {"type": "error", "error"} ở cuối
+    output_file trong sự kiện "done" là file của định dạng chính, các định dạng khác nằm cạnh nó (get_output_paths).
+    Khi previews=True, đoạn xem trước được mã hóa theo hồ sơ mp3 kèm các hiệu ứng mà track chỉ áp dụng khi ghép
+    (effects_mode="track"), còn track cuối vẫn được xử lý giống hệt khi không có xem trước.
+    """
+    voice = resolve_voice(engine, language, gender)
+    if not voice:
+        yield {"type": "error", "error": f"Ngôn ngữ '{language}' không được {engine} hỗ trợ"}
+        return
+    sentences, chunks = segment_script(script, language)
+
+    outputs = get_output_paths(output_file)
+    output_file = next(iter(outputs.values()))
+    can_copy = can_copy_mp3_frames(engine, speed, pitch, volume, outputs)
+    if effects_mode == "track":
+        track_speed, track_pitch, track_volume = get_track_effects(engine, speed, pitch, volume)
+    else:
+        track_speed, track_pitch, track_volume = 1.0, 1.0, 0.0
+    # Cách ghi được chọn theo chunk đầu tiên tạo được
+    writer = None
+    lossless = False
+    tempo_factor = 1.0
+
+    def add_chunk(index, data):
+        nonlocal writer, lossless, tempo_factor
+        if writer is None:
+            # Không có hiệu ứng cục bộ và MP3 của engine đã đúng hồ sơ mp3: ghép thẳng các frame,
+            # không giải mã/mã hóa lại; các định dạng khác được xuất từ file MP3 này sau khi ghép xong
+            lossless = can_copy and matches_mp3_profile(data)
+            if lossless:
+                writer = Mp3FrameWriter(outputs["mp3"])
+            else:
+                writer = StreamingAudioAssembler(output_file, track_speed, track_pitch, track_volume)
+                tempo_factor = writer.tempo_factor
+
+        if lossless:
+            if not matches_mp3_profile(data):
+                data = _conform_mp3(data)
+            start_time, end_time = writer.add_chunk(data)
+            return start_time, end_time, data if previews else None, 0.0
+
+        # Giải mã từng chunk khi tới lượt và đẩy ngay vào encoder, không giữ lại AudioSegment nào
+        chunk, offset = _decode_chunk(index, data, engine, speed, pitch, volume, effects_mode)
+        # Khoảng nghỉ chỉ nằm giữa các câu, không chèn vào giữa các phần của một câu dài
+        new_sentence = index == 0 or chunks[index]["parts"][0][0] != chunks[index - 1]["parts"][-1][0]
+        start_time, end_time = writer.add_chunk(chunk, pause=new_sentence)
+        preview = _encode_preview(chunk, track_speed, track_pitch, track_volume) if previews else None
+        return start_time, end_time, preview, offset
+
+    loop = asyncio.get_running_loop()
+    timings = []
+    failed = []
+    results = generate_audio_chunks_in_memory([chunk["text"] for chunk in chunks], engine, voice, speed, pitch, max_workers)
+    try:
+        async for i, text, result in results:
+            try:
+                if isinstance(result, Exception):
+                    raise result
+                start_time, end_time, preview, offset = await loop.run_in_executor(None, add_chunk, i, result["data"])
+            except Exception as e:
+                if not isinstance(result, Exception) and isinstance(e, (ffmpeg.Error, OSError)):
+                    # Lỗi của encoder/file đầu ra, không thể tiếp tục
+                    raise
+                print(f"Lỗi tạo chunk {i + 1}: {e}")
+                # Câu dài có thể nằm trong nhiều chunk, mỗi câu chỉ được báo lỗi một lần
+                for index in dict.fromkeys(index for index, _ in chunks[i]["parts"]):
+                    if failed and failed[-1]["index"] == index:
+                        continue
+                    failed.append({"index": index, "content": sentences[index], "error": str(e)})
+                    yield {"type": "failed", **failed[-1]}
+                continue
+            print(f"Chunk {i + 1}: {text} - Độ dài: {end_time - start_time:.2f}s")
+            mapped = _map_chunk_timings(chunks[i], start_time, end_time, result.get("words"), tempo_factor, offset)
+            for index, item in mapped:
+                _add_sentence_timing(timings, sentences, index, item)
+            yield {
+                "type": "chunk",
+                "index": i,
+                "timings": [{**item, "index": index} for index, item in mapped],
+                "audio": preview
+            }
+
+        if not timings:
+            if writer is not None:
+                writer.abort()
+            print("Không tạo được chunk nào, không thể tiếp tục")
+            yield {"type": "error", "error": "Không tạo được chunk nào", "failed": failed}
+            return
+        await loop.run_in_executor(None, writer.close)
+        if lossless:
+            others = {name: path for name, path in outputs.items() if name != "mp3"}
+            await loop.run_in_executor(None, transcode_outputs, outputs["mp3"], others)
+    except (asyncio.CancelledError, GeneratorExit):
+        # Client ngắt kết nối giữa chừng: dừng encoder và xóa file dở dang
+        if writer is not None:
+            writer.abort()
+        raise
+    except (ffmpeg.Error, OSError) as e:
+        if writer is not None:
+            writer.abort()
+        remove_outputs(output_file)
+        message = e.stderr.decode() if isinstance(e, ffmpeg.Error) and e.stderr else str(e)
+        print(f"Lỗi khi ghép âm thanh: {message}")
+        yield {"type": "error", "error": message, "failed": failed}
+        return
+    finally:
+        await results.aclose()
+
+    output_file, timings_string, failed = _finish_timings(output_file, timings, failed)
+    yield {"type": "done", "output_file": output_file, "timings_string": timings_string, "failed": failed}
+
+# Hàm chính (giữ nguyên)
+async def process_script_to_audio_and_timings(script, language, engine="gtts", gender="female", speed=1.0, pitch=1.0, volume=0.0, output_file="output.mp3", max_workers=None, effects_mode=AUDIO_EFFECTS_MODE):
+    """Trả về (output_file, timings_string, failed) - failed là các câu không tạo được âm thanh"""
+    events = iter_script_audio(
+        script, language, engine, gender, speed, pitch, volume, output_file,
+        max_workers=max_workers, effects_mode=effects_mode
+    )
+    try:
+        async for event in events:
+            if event["type"] == "done":
+                return event["output_file"], event["timings_string"], event["failed"]
+            if event["type"] == "error":
+                return None, None, event.get("failed", [])
+    finally:
+        await events.aclose()
+    return None, None, []
+
+def plan_incremental_update(old_sentences, new_sentences):
+    """
+    Căn chỉnh danh sách câu mới với danh sách câu cũ.
+    :return: danh sách ("old", chỉ số câu cũ) hoặc ("new", chỉ số câu mới) theo thứ tự câu mới
+    """
+    matcher = difflib.SequenceMatcher(None, old_sentences, new_sentences, autojunk=False)
+    plan = []
+    for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+        if tag == "equal":
+            plan.extend(("old", old_start + k) for k in range(old_end - old_start))
+        else:
+            # replace/insert: tổng hợp lại các câu mới; delete: bỏ các câu cũ
+            plan.extend(("new", k) for k in range(new_start, new_end))
+    return plan
+
+async def regenerate_audio_incrementally(script, old_audio_data, old_timings, language, engine="gtts", gender="female", speed=1.0, pitch=1.0, volume=0.0, output_file="output.mp3", max_workers=None):
+    """
+    Chỉ tổng hợp lại các câu đã thay đổi so với old_timings, ghép chúng với các đoạn tương ứng
+    của track cũ và dời timings phía sau. Track cũ phải được tạo với cùng giọng và hiệu ứng.
+    Script được chia chunk giống lần tạo đầy đủ (segment_script) nên câu mới trúng cùng khóa cache TTS;
+    chunk gom cả câu cũ và câu mới được tổng hợp lại toàn bộ. Mỗi dãy câu cũ liền nhau được cắt từ track cũ
+    thành một đoạn nên không bị cắt bên trong chunk cũ.
+    Nếu không có hiệu ứng cục bộ và track cũ là MP3 đúng hồ sơ mp3, các câu cũ được chép nguyên frame
+    (dãy bắt đầu tại frame dùng bit reservoir thì câu đầu dãy được tổng hợp lại); ngược lại track cũ
+    bị giải mã và mã hóa lại (mất thêm chất lượng sau mỗi lần cập nhật).
+    :return: (output_file, timings_string, failed, reencoded) - reencoded: track cũ có bị mã hóa lại hay không
+    """
+    voice = resolve_voice(engine, language, gender)
+    if not voice:
+        return None, None, [], False
+
+    sentences, chunks = segment_script(script, language)
+    plan = plan_incremental_update([timing["content"] for timing in old_timings], sentences)
+    # Chỉ số câu cũ được dùng lại cho từng câu mới (None: tổng hợp lại)
+    reused = [index if kind == "old" else None for kind, index in plan]
+
+    loop = asyncio.get_running_loop()
+    outputs = get_output_paths(output_file)
+    output_file = next(iter(outputs.values()))
+    lossless = can_copy_mp3_frames(engine, speed, pitch, volume, outputs) and matches_mp3_profile(old_audio_data)
+    if lossless:
+        old_track = await loop.run_in_executor(None, Mp3FrameIndex, old_audio_data)
+        writer = Mp3FrameWriter(outputs["mp3"])
+
+        def add_old(start_time, end_time):
+            frames = old_track.slice(start_time, end_time)
+            return writer.add_chunk(frames) if frames else (writer.duration, writer.duration)
+
+        def add_new(position, data, pause):
+            # Chỉ câu mới bị mã hóa lại (một lần) nếu engine trả về MP3 khác hồ sơ
+            if not matches_mp3_profile(data):
+                data = _conform_mp3(data)
+            return (*writer.add_chunk(data), 0.0)
+    else:
+        old_track = await loop.run_in_executor(None, lambda: AudioSegment.from_file(io.BytesIO(old_audio_data)))
+        # Track cũ đã có hiệu ứng nên các câu mới được áp dụng hiệu ứng riêng trước khi ghép
+        writer = StreamingAudioAssembler(output_file)
+
+        def add_old(start_time, end_time):
+            return writer.add_chunk(old_track[int(round(start_time * 1000)):int(round(end_time * 1000))])
+
+        def add_new(position, data, pause):
+            chunk, offset = _decode_chunk(position, data, engine, speed, pitch, volume, "chunk")
+            return (*writer.add_chunk(chunk, pause=pause), offset)
+
+    def continues_run(position):
+        return position > 0 and reused[position - 1] is not None and reused[position - 1] == reused[position] - 1
+
+    # Câu chỉ được chép từ track cũ khi mọi chunk chứa nó đều chỉ gồm câu được dùng lại (nếu không phần
+    # của nó trong chunk tổng hợp lại sẽ bị lặp) và, khi chép frame, dãy chứa nó bắt đầu tại frame giải mã được
+    while True:
+        stale = {
+            index for chunk in chunks if any(reused[i] is None for i, _ in chunk["parts"])
+            for index, _ in chunk["parts"] if reused[index] is not None
+        }
+        if lossless:
+            stale.update(
+                position for position, index in enumerate(reused)
+                if index is not None and not continues_run(position)
+                and not old_track.starts_cleanly(old_timings[index]["start_time"])
+            )
+        if not stale:
+            break
+        for position in stale:
+            reused[position] = None
+    changed = [position for position, chunk in enumerate(chunks) if reused[chunk["parts"][0][0]] is None]
+    print(f"Cập nhật tăng dần: giữ {sum(index is not None for index in reused)} câu, tổng hợp lại {len(changed)} chunk")
+
+    timings = []
+    failed = []
+    results = generate_audio_chunks_in_memory([chunks[position]["text"] for position in changed], engine, voice, speed, pitch, max_workers)
+    try:
+        copied = -1  # chỉ số câu cuối cùng đã chép từ track cũ
+        for position, chunk in enumerate(chunks):
+            first = chunk["parts"][0][0]
+            if reused[first] is not None:
+                # Chép cả dãy câu cũ liền nhau bằng một đoạn cắt; các chunk sau thuộc dãy đã chép thì bỏ qua
+                if first <= copied:
+                    continue
+                copied = first
+                while copied + 1 < len(sentences) and reused[copied + 1] is not None and continues_run(copied + 1):
+                    copied += 1
+                run_start = old_timings[reused[first]]["start_time"]
+                start_time, _ = await loop.run_in_executor(
+                    None, add_old, run_start, old_timings[reused[copied]]["end_time"]
+                )
+                for index in range(first, copied + 1):
+                    old_timing = old_timings[reused[index]]
+                    old_start = old_timing["start_time"]
+                    # Giữ timings (cả từng từ) của câu cũ, dời theo vị trí mới của dãy
+                    shift = start_time - run_start
+                    words = [
+                        {
+                            "start_time": word["start_time"] - old_start,
+                            "end_time": word["end_time"] - old_start,
+                            "content": word["content"]
+                        } for word in old_timing.get("words", [])
+                    ]
+                    timings.append({
+                        **_build_timing(old_timing["content"], old_start + shift, old_timing["end_time"] + shift, words),
+                        "index": index
+                    })
+                continue
+
+            _, text, result = await results.__anext__()
+            # Khoảng nghỉ chỉ nằm giữa các câu, không chèn vào giữa các phần của một câu dài
+            pause = position == 0 or first != chunks[position - 1]["parts"][-1][0]
+            try:
+                if isinstance(result, Exception):
+                    raise result
+                start_time, end_time, offset = await loop.run_in_executor(None, add_new, position, result["data"], pause)
+            except Exception as e:
+                if not isinstance(result, Exception) and isinstance(e, (ffmpeg.Error, OSError)):
+                    # Lỗi của encoder/file đầu ra, không thể tiếp tục
+                    raise
+                print(f"Lỗi tạo chunk {position + 1}: {e}")
+                for index in dict.fromkeys(index for index, _ in chunk["parts"]):
+                    if failed and failed[-1]["index"] == index:
+                        continue
+                    failed.append({"index": index, "content": sentences[index], "error": str(e)})
+                continue
+            print(f"Chunk {position + 1}: {text} - Độ dài: {end_time - start_time:.2f}s")
+            for index, item in _map_chunk_timings(chunk, start_time, end_time, result.get("words"), offset=offset):
+                _add_sentence_timing(timings, sentences, index, item)
+
+        if not timings:
+            writer.abort()
+            print("Không tạo được chunk nào, không thể tiếp tục")
+            return None, None, failed, False
+        await loop.run_in_executor(None, writer.close)
+        if lossless:
+            others = {name: path for name, path in outputs.items() if name != "mp3"}
+            await loop.run_in_executor(None, transcode_outputs, outputs["mp3"], others)
+    except asyncio.CancelledError:
+        # Bị hủy giữa chừng: dừng encoder
+        writer.abort()
+        raise
+    except (ffmpeg.Error, OSError) as e:
+        writer.abort()
+        remove_outputs(output_file)
+        print(f"Lỗi khi ghép âm thanh: {e.stderr.decode() if isinstance(e, ffmpeg.Error) and e.stderr else e}")
+        return None, None, failed, False
+    finally:
+        await results.aclose()
+
+    return (*_finish_timings(output_file, timings, failed), not lossless)
@@ -0,0 +1,127 @@
+import numpy as np
+from pydub import AudioSegment
+
+# Xử lý âm thanh trên mảng NumPy (frames, channels): int16 hoặc float32 trong khoảng [-1, 1]
+
+_INT16_SCALE = 32768.0
+_EPSILON = 1e-10
+
+
+def segment_to_array(segment):
+    """Chuyển AudioSegment sang mảng int16 dạng (frames, channels), không giải mã lại"""
+    if segment.sample_width != 2:
+        segment = segment.set_sample_width(2)
+    return np.frombuffer(segment.raw_data, dtype=np.int16).reshape(-1, segment.channels)
+
+
+def array_to_segment(samples, sample_rate):
+    """Chuyển mảng (frames, channels) về AudioSegment 16-bit"""
+    samples = to_int16(samples)
+    return AudioSegment(
+        data=samples.tobytes(),
+        sample_width=2,
+        frame_rate=sample_rate,
+        channels=samples.shape[1]
+    )
+
+
+def to_float(samples):
+    if samples.dtype == np.int16:
+        return samples.astype(np.float32) / _INT16_SCALE
+    return samples.astype(np.float32, copy=False)
+
+
+def to_int16(samples):
+    if samples.dtype == np.int16:
+        return samples
+    return np.clip(np.rint(samples * _INT16_SCALE), -32768, 32767).astype(np.int16)
+
+
+def db_to_amplitude(db):
+    return 10.0 ** (db / 20.0)
+
+
+def apply_gain(samples, gain_db):
+    """Nhân biên độ theo gain (dB), cắt ngưỡng để không tràn; giữ nguyên kiểu dữ liệu đầu vào"""
+    if gain_db == 0.0:
+        return samples
+    scaled = to_float(samples) * db_to_amplitude(gain_db)
+    if samples.dtype == np.int16:
+        return to_int16(scaled)
+    return np.clip(scaled, -1.0, 1.0)
+
+
+def frame_levels(samples, sample_rate, frame_ms=10):
+    """Mức năng lượng (dBFS) của từng khung frame_ms, tính một lần cho cả mảng"""
+    frame_length = max(1, int(sample_rate * frame_ms / 1000))
+    data = to_float(samples)
+    frame_count = -(-len(data) // frame_length)
+    padded = np.zeros((frame_count * frame_length, data.shape[1]), dtype=np.float32)
+    padded[:len(data)] = data
+    mean_square = np.mean(np.square(padded.reshape(frame_count, -1)), axis=1)
+    return 10.0 * np.log10(mean_square + _EPSILON), frame_length
+
+
+def trim_silence(samples, sample_rate, threshold_db=-45.0, frame_ms=10, keep_ms=30, levels=None):
+    """
+    Cắt khoảng lặng ở đầu và cuối (các khung dưới threshold_db), chừa lại keep_ms mỗi bên.
+    :return: (samples đã cắt, số giây bị cắt ở đầu)
+    """
+    if levels is None:
+        levels = frame_levels(samples, sample_rate, frame_ms)
+    db, frame_length = levels
+    voiced = np.flatnonzero(db > threshold_db)
+    if voiced.size == 0:
+        # Cả đoạn đều im lặng: giữ nguyên thay vì xóa mất câu
+        return samples, 0.0
+    keep = int(sample_rate * keep_ms / 1000)
+    start = max(0, voiced[0] * frame_length - keep)
+    end = min(len(samples), (voiced[-1] + 1) * frame_length + keep)
+    return samples[start:end], start / sample_rate
+
+
+def silence(duration_ms, sample_rate, channels, dtype=np.int16):
+    """Khoảng lặng cố định giữa các câu"""
+    return np.zeros((int(sample_rate * duration_ms / 1000), channels), dtype=dtype)
+
+
+def loudness_dbfs(samples, sample_rate, gate_db=-45.0, levels=None):
+    """Độ to trung bình (dBFS) chỉ tính trên các khung có tiếng, bỏ qua khoảng lặng"""
+    if levels is None:
+        levels = frame_levels(samples, sample_rate)
+    db, _ = levels
+    voiced = db[db > gate_db]
+    if voiced.size == 0:
+        return None
+    return float(10.0 * np.log10(np.mean(10.0 ** (voiced / 10.0))))
+
+
+def normalization_gain(samples, sample_rate, target_dbfs, gate_db=-45.0, levels=None):
+    """Gain (dB) đưa độ to về target_dbfs, giới hạn để đỉnh không vượt 0 dBFS"""
+    loudness = loudness_dbfs(samples, sample_rate, gate_db, levels)
+    if loudness is None:
+        return 0.0
+    peak = float(np.max(np.abs(to_float(samples)))) if len(samples) else 0.0
+    headroom = -20.0 * np.log10(peak + _EPSILON) - 0.1
+    return min(target_dbfs - loudness, headroom)
+
+
+def process_chunk(samples, sample_rate, gain_db=0.0, trim=False, threshold_db=-45.0, normalize_dbfs=None):
+    """
+    Cắt khoảng lặng, chuẩn hóa độ to và áp gain cho một câu; mức năng lượng chỉ tính một lần
+    và gain tổng được nhân một lần duy nhất.
+    :return: (samples, số giây bị cắt ở đầu)
+    """
+    offset = 0.0
+    if not trim and normalize_dbfs is None:
+        return apply_gain(samples, gain_db), offset
+
+    levels = frame_levels(samples, sample_rate)
+    if trim:
+        db, frame_length = levels
+        samples, offset = trim_silence(samples, sample_rate, threshold_db, levels=levels)
+        first_frame = int(offset * sample_rate) // frame_length
+        levels = (db[first_frame:first_frame + -(-len(samples) // frame_length)], frame_length)
+    if normalize_dbfs is not None:
+        gain_db += normalization_gain(samples, sample_rate, normalize_dbfs, threshold_db, levels)
+    return apply_gain(samples, gain_db), offset
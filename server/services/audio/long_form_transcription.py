@@ -0,0 +1,122 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+from config.audio import STT_WINDOW_SECONDS, STT_WORKERS
+from services.audio import dsp
+
+# Nhận dạng bản ghi dài: cắt tại khoảng lặng thành các cửa sổ có độ dài giới hạn,
+# nhận dạng các cửa sổ song song trên nhiều tiến trình rồi ghép lại với mốc thời gian tuyệt đối
+
+_FRAME_MS = 20
+# Làm mượt mức năng lượng ~300 ms để điểm cắt rơi vào khoảng nghỉ giữa câu, không phải khe hở giữa hai âm tiết
+_SMOOTH_FRAMES = 15
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def split_at_silence(samples, sample_rate, max_seconds=STT_WINDOW_SECONDS):
+    """
+    Chia âm thanh thành các cửa sổ <= max_seconds, mỗi điểm cắt là khung yên lặng nhất
+    trong nửa sau của cửa sổ.
+    :return: Danh sách (sample bắt đầu, sample kết thúc)
+    """
+    if samples.ndim == 1:
+        samples = samples.reshape(-1, 1)
+    db, frame_length = dsp.frame_levels(samples, sample_rate, _FRAME_MS)
+    max_frames = max(2, int(max_seconds * 1000 / _FRAME_MS))
+    if len(db) <= max_frames:
+        return [(0, len(samples))]
+
+    smoothed = np.convolve(db, np.ones(_SMOOTH_FRAMES) / _SMOOTH_FRAMES, mode="same")
+    bounds = []
+    start = 0
+    while len(db) - start > max_frames:
+        search_from = start + max_frames // 2
+        cut = search_from + int(np.argmin(smoothed[search_from:start + max_frames]))
+        bounds.append((start, cut))
+        start = cut
+    bounds.append((start, len(db)))
+    return [(begin * frame_length, min(end * frame_length, len(samples))) for begin, end in bounds]
+
+
+def _init_worker(threads):
+    # Chia đều số nhân cho các tiến trình để PyTorch không tranh nhau CPU
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+
+def _transcribe_window(samples, offset, language_code):
+    """Chạy trong tiến trình con: nhận dạng một cửa sổ bằng model dùng chung của tiến trình đó"""
+    from services.audio.whisper_models import whisper_registry
+
+    result = whisper_registry.transcribe(samples, language=language_code, verbose=None)
+    return [
+        {"start": segment["start"] + offset, "end": segment["end"] + offset, "text": segment["text"]}
+        for segment in result["segments"]
+    ]
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn thay vì fork: tiến trình cha đã có luồng và có thể đã nạp PyTorch
+            threads = max(1, (multiprocessing.cpu_count() or 1) // STT_WORKERS)
+            _executor = ProcessPoolExecutor(
+                max_workers=STT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(threads,)
+            )
+        return _executor
+
+
+def _reset_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def iter_long_form(samples, sample_rate, language_code, max_seconds=STT_WINDOW_SECONDS):
+    """
+    Nhận dạng bản ghi dài song song theo từng cửa sổ, trả về các đoạn {"start", "end", "text"}
+    theo thứ tự ngay khi cửa sổ chứa chúng xong (thời gian tính từ đầu bản ghi).
+    """
+    samples = samples.reshape(-1)
+    windows = split_at_silence(samples, sample_rate, max_seconds)
+    print(f"Nhận dạng {len(samples) / sample_rate:.0f}s âm thanh theo {len(windows)} cửa sổ trên {STT_WORKERS} tiến trình")
+
+    executor = _get_executor()
+    futures = [
+        executor.submit(_transcribe_window, samples[start:end], start / sample_rate, language_code)
+        for start, end in windows
+    ]
+    try:
+        for future in futures:
+            yield from future.result()
+    except BrokenProcessPool:
+        # Tiến trình con bị dừng (ví dụ hết bộ nhớ): tạo pool mới cho request sau
+        _reset_executor()
+        raise
+    finally:
+        # Client ngắt job giữa chừng: không nhận dạng tiếp các cửa sổ chưa chạy
+        for future in futures:
+            future.cancel()
+
+
+def transcribe_long_form(samples, sample_rate, language_code, max_seconds=STT_WINDOW_SECONDS):
+    """
+    Nhận dạng bản ghi dài song song theo từng cửa sổ.
+    :return: {"segments": [...]} theo định dạng của model.transcribe, thời gian tính từ đầu bản ghi
+    """
+    return {"segments": list(iter_long_form(samples, sample_rate, language_code, max_seconds))}
@@ -0,0 +1,234 @@
+import bisect
+import os
+
+# Đọc header frame MP3 để tính độ dài và ghép MP3 mà không cần giải mã
+
+# Bitrate (kbps) theo (phiên bản MPEG, layer); MPEG 2 và 2.5 dùng chung bảng
+_BITRATES = {
+    (1, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (1, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (1, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (2, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (2, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (2, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+
+_SAMPLE_RATES = {
+    1: [44100, 48000, 32000],
+    2: [22050, 24000, 16000],
+    2.5: [11025, 12000, 8000],
+}
+
+_VERSIONS = {0b00: 2.5, 0b10: 2, 0b11: 1}
+_LAYERS = {0b01: 3, 0b10: 2, 0b11: 1}
+
+
+class IncompatibleFramesError(ValueError):
+    """Các chunk MP3 có định dạng khác nhau nên không thể ghép trực tiếp"""
+
+
+def skip_id3v2(data):
+    """Trả về vị trí bắt đầu sau tag ID3v2 (0 nếu không có)"""
+    offset = 0
+    while len(data) >= offset + 10 and data[offset:offset + 3] == b"ID3":
+        size = 0
+        for byte in data[offset + 6:offset + 10]:
+            size = (size << 7) | (byte & 0x7F)
+        footer = 10 if data[offset + 5] & 0x10 else 0
+        offset += 10 + size + footer
+    return offset
+
+
+def parse_frame_header(data, offset):
+    """Phân tích header frame tại offset, trả về dict hoặc None nếu không hợp lệ"""
+    if offset + 4 > len(data):
+        return None
+    b1, b2, b3, b4 = data[offset], data[offset + 1], data[offset + 2], data[offset + 3]
+    if b1 != 0xFF or (b2 & 0xE0) != 0xE0:
+        return None
+
+    version = _VERSIONS.get((b2 >> 3) & 0x03)
+    layer = _LAYERS.get((b2 >> 1) & 0x03)
+    bitrate_index = (b3 >> 4) & 0x0F
+    sample_rate_index = (b3 >> 2) & 0x03
+    if version is None or layer is None or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    bitrate = _BITRATES[(1 if version == 1 else 2, layer)][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][sample_rate_index]
+    padding = (b3 >> 1) & 0x01
+    # protection_bit = 0: có 2 byte CRC ngay sau header
+    crc = not (b2 & 0x01)
+    channels = 1 if ((b4 >> 6) & 0x03) == 0b11 else 2
+
+    if layer == 1:
+        samples = 384
+        frame_length = (12 * bitrate // sample_rate + padding) * 4
+    elif layer == 2:
+        samples = 1152
+        frame_length = 144 * bitrate // sample_rate + padding
+    else:
+        samples = 1152 if version == 1 else 576
+        frame_length = (144 if version == 1 else 72) * bitrate // sample_rate + padding
+
+    return {
+        "version": version,
+        "layer": layer,
+        "bitrate": bitrate,
+        "sample_rate": sample_rate,
+        "channels": channels,
+        "samples": samples,
+        "frame_length": frame_length,
+        "crc": crc,
+    }
+
+
+def _is_info_frame(data, offset, header):
+    """Frame Xing/Info/VBRI chỉ chứa metadata của encoder, không phải âm thanh"""
+    if header["layer"] != 3:
+        return False
+    if header["version"] == 1:
+        side_info = 17 if header["channels"] == 1 else 32
+    else:
+        side_info = 9 if header["channels"] == 1 else 17
+    tag = data[offset + 4 + side_info:offset + 8 + side_info]
+    return tag in (b"Xing", b"Info") or data[offset + 36:offset + 40] == b"VBRI"
+
+
+def main_data_begin(data, offset, header):
+    """
+    Số byte dữ liệu âm thanh frame lấy từ các frame đứng trước (bit reservoir của Layer III).
+    Khác 0 thì frame không giải mã đúng nếu bị cắt rời khỏi các frame trước nó.
+    """
+    if header["layer"] != 3:
+        return 0
+    side_info = offset + 4 + (2 if header["crc"] else 0)
+    if header["version"] == 1:
+        # MPEG-1: 9 bit
+        return (data[side_info] << 1) | (data[side_info + 1] >> 7)
+    return data[side_info]
+
+
+def iter_frames(data):
+    """Duyệt các frame âm thanh, yield (offset, header); bỏ qua tag ID3 và frame Xing/Info"""
+    offset = skip_id3v2(data)
+    first = True
+    while offset + 4 <= len(data):
+        header = parse_frame_header(data, offset)
+        if header is None:
+            # Dữ liệu rác hoặc tag ID3v1/APE ở cuối: dò tới sync word tiếp theo
+            offset += 1
+            continue
+        if offset + header["frame_length"] > len(data):
+            break
+        if not (first and _is_info_frame(data, offset, header)):
+            yield offset, header
+        first = False
+        offset += header["frame_length"]
+
+
+def mp3_duration(data):
+    """Độ dài (giây) của MP3 tính từ số sample trong các frame"""
+    duration = 0.0
+    for _, header in iter_frames(data):
+        duration += header["samples"] / header["sample_rate"]
+    return duration
+
+
+def mp3_file_duration(path):
+    with open(path, "rb") as f:
+        return mp3_duration(f.read())
+
+
+def format_of(header):
+    """Các thuộc tính phải giống nhau để ghép frame trực tiếp"""
+    return header["version"], header["layer"], header["sample_rate"], header["channels"]
+
+
+def extract_frames(data, expected_format=None):
+    """
+    Lấy các frame âm thanh của một chunk MP3.
+    :return: (frame_bytes, duration, format)
+    :raises IncompatibleFramesError: nếu định dạng khác expected_format
+    """
+    parts = []
+    samples = 0
+    chunk_format = expected_format
+    sample_rate = None
+    for offset, header in iter_frames(data):
+        frame_format = format_of(header)
+        if chunk_format is None:
+            chunk_format = frame_format
+        elif frame_format != chunk_format:
+            raise IncompatibleFramesError(f"Frame {frame_format} khác định dạng {chunk_format}")
+        sample_rate = header["sample_rate"]
+        samples += header["samples"]
+        parts.append(data[offset:offset + header["frame_length"]])
+    if not parts:
+        raise ValueError("Không tìm thấy frame MP3 hợp lệ")
+    return b"".join(parts), samples / sample_rate, chunk_format
+
+
+class Mp3FrameWriter:
+    """Ghi nối tiếp frame MP3 của các chunk vào một file, không giải mã và mã hóa lại"""
+
+    def __init__(self, output_file):
+        self.output_file = output_file
+        self.format = None
+        self.duration = 0.0
+        self._file = open(output_file, "wb")
+
+    def add_chunk(self, data):
+        """Ghi các frame của chunk, trả về (start_time, end_time) trên track đầu ra"""
+        frames, duration, chunk_format = extract_frames(data, self.format)
+        self.format = chunk_format
+        start_time = self.duration
+        self._file.write(frames)
+        self.duration += duration
+        return start_time, self.duration
+
+    def close(self):
+        self._file.close()
+
+    def abort(self):
+        self._file.close()
+        try:
+            os.remove(self.output_file)
+        except OSError:
+            pass
+
+
+class Mp3FrameIndex:
+    """Chỉ mục frame của một track MP3 để cắt đoạn theo thời gian mà không giải mã"""
+
+    def __init__(self, data):
+        self.data = data
+        self.frames = []  # (offset, frame_length, main_data_begin)
+        self.boundaries = [0.0]  # thời điểm bắt đầu của từng frame, phần tử cuối là độ dài track
+        for offset, header in iter_frames(data):
+            self.frames.append((offset, header["frame_length"], main_data_begin(data, offset, header)))
+            self.boundaries.append(self.boundaries[-1] + header["samples"] / header["sample_rate"])
+
+    def _nearest_boundary(self, seconds):
+        index = bisect.bisect_left(self.boundaries, seconds)
+        if index == len(self.boundaries) or (index > 0 and seconds - self.boundaries[index - 1] < self.boundaries[index] - seconds):
+            index -= 1
+        return index
+
+    def starts_cleanly(self, seconds):
+        """
+        Frame tại ranh giới gần seconds nhất không dùng bit reservoir (main_data_begin = 0),
+        tức là đoạn cắt bắt đầu từ đó giải mã đúng ngay từ frame đầu tiên.
+        Đúng tại đầu mỗi chunk của track được ghép frame (mỗi chunk là một luồng MP3 riêng).
+        """
+        index = self._nearest_boundary(seconds)
+        return index >= len(self.frames) or self.frames[index][2] == 0
+
+    def slice(self, start_time, end_time):
+        """
+        Các frame trong [start_time, end_time), cắt tại ranh giới frame gần nhất nên hai đoạn liền nhau
+        không bị trùng hay hụt frame. Trả về b"" nếu đoạn ngắn hơn nửa frame.
+        Chỉ nên cắt tại start_time mà starts_cleanly(start_time) đúng.
+        """
+        first, last = self._nearest_boundary(start_time), self._nearest_boundary(end_time)
+        return b"".join(self.data[offset:offset + length] for offset, length, _ in self.frames[first:last])
@@ -0,0 +1,136 @@
+import re
+from config.audio import TTS_CHUNK_MIN_CHARS, TTS_CHUNK_MAX_CHARS
+
+# Tách script thành câu theo quy tắc từng ngôn ngữ, rồi gom/chia câu thành các chunk TTS có độ dài cân bằng
+
+_CLOSING = "\"'”’»)]」』"
+
+_DEFAULT_RULES = {
+    "terminators": ".!?…",
+    # Dấu kết câu chỉ có hiệu lực khi theo sau là khoảng trắng (tránh 3.14, v1.2, example.com)
+    "needs_space": True,
+    "clauses": ",;:—–",
+    "joiner": " ",
+    "abbreviations": set(),
+    # Tiếng Thái không dùng dấu chấm, khoảng trắng là ranh giới câu/mệnh đề
+    "space_is_boundary": False,
+}
+
+_CJK_RULES = {
+    "terminators": "。！？!?…",
+    "needs_space": False,
+    "clauses": "，、；：,;:",
+    "joiner": "",
+}
+
+LANGUAGE_RULES = {
+    "en": {"abbreviations": {"mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "vs", "etc", "e.g", "i.e", "no", "fig"}},
+    "vi": {"abbreviations": {"tp", "ts", "ths", "pgs", "gs", "bs", "ks", "th", "tr", "v.v"}},
+    "fr": {"abbreviations": {"m", "mme", "mlle", "dr", "p", "etc"}},
+    "de": {"abbreviations": {"dr", "prof", "bzw", "usw", "z.b", "ca", "nr"}},
+    "zh": _CJK_RULES,
+    "ja": _CJK_RULES,
+    "th": {"terminators": "!?", "clauses": "", "space_is_boundary": True},
+}
+
+# Tên ngôn ngữ (như trong Script.language) sang mã ngôn ngữ
+_LANGUAGE_CODES = {
+    "english": "en", "vietnamese": "vi", "french": "fr", "german": "de",
+    "chinese": "zh", "japanese": "ja", "thai": "th",
+}
+
+
+def get_rules(language=None):
+    """Quy tắc tách câu cho tên ngôn ngữ, mã gTTS (vi, zh-cn) hoặc locale edge-tts (vi-vn)"""
+    code = (language or "").lower()
+    code = _LANGUAGE_CODES.get(code, code.split("-")[0])
+    return {**_DEFAULT_RULES, **LANGUAGE_RULES.get(code, {})}
+
+
+def _is_abbreviation(text, end, rules):
+    """Dấu chấm tại text[end - 1] thuộc một từ viết tắt (Dr., TP., v.v.) thay vì kết câu"""
+    if not rules["abbreviations"] or text[end - 1] != ".":
+        return False
+    match = re.search(r"(\S+)\.$", text[:end])
+    return bool(match) and match.group(1).lower().lstrip("(\"'") in rules["abbreviations"]
+
+
+def _split_paragraph(paragraph, rules):
+    terminators = re.escape(rules["terminators"])
+    closing = re.escape(_CLOSING)
+    pattern = rf"(?:\.{{3}}|[{terminators}])+[{closing}]*"
+    if rules["needs_space"]:
+        pattern += r"(?=\s|$)"
+
+    sentences = []
+    start = 0
+    for match in re.finditer(pattern, paragraph):
+        if _is_abbreviation(paragraph, match.end(), rules):
+            continue
+        sentences.append(paragraph[start:match.end()])
+        start = match.end()
+    sentences.append(paragraph[start:])
+
+    if rules["space_is_boundary"]:
+        sentences = [part for sentence in sentences for part in sentence.split()]
+    return [sentence.strip() for sentence in sentences if sentence.strip()]
+
+
+def split_sentences(script, language=None):
+    """Tách script thành các câu; xuống dòng luôn là ranh giới câu, dấu câu gốc được giữ nguyên"""
+    rules = get_rules(language)
+    sentences = []
+    for paragraph in script.splitlines():
+        for sentence in _split_paragraph(paragraph, rules):
+            # Câu chỉ gồm dấu câu (ví dụ "...") không có gì để đọc
+            if re.search(r"\w", sentence):
+                sentences.append(sentence)
+    return sentences
+
+
+def _split_long(text, max_chars, rules):
+    """Chia câu dài thành các đoạn <= max_chars, ưu tiên ranh giới mệnh đề, rồi khoảng trắng"""
+    parts = []
+    while len(text) > max_chars:
+        window = text[:max_chars + 1]
+        cut = -1
+        if rules["clauses"]:
+            # Không cắt quá sớm để tránh tạo ra các mảnh quá ngắn
+            cut = max(window.rfind(mark) for mark in rules["clauses"])
+            cut = cut + 1 if cut >= max_chars // 3 else -1
+        if cut == -1:
+            cut = window.rfind(" ")
+            if cut < max_chars // 3:
+                # Không có khoảng trắng (CJK): cắt cứng
+                cut = max_chars
+        head, text = text[:cut].strip(), text[cut:].strip()
+        if head:
+            parts.append(head)
+    if text:
+        parts.append(text)
+    return parts
+
+
+def segment_script(script, language=None, min_chars=TTS_CHUNK_MIN_CHARS, max_chars=TTS_CHUNK_MAX_CHARS):
+    """
+    Tách script thành câu rồi chia các câu dài thành chunk TTS <= max_chars; min_chars > 0 thì gom thêm
+    các câu ngắn hơn min_chars (min_chars = 0: mỗi chunk thuộc về đúng một câu).
+    :return: (sentences, chunks) - mỗi chunk là {"text", "parts": [(chỉ số câu, đoạn văn bản), ...]}
+             để timings của chunk có thể chia lại theo từng câu gốc
+    """
+    rules = get_rules(language)
+    joiner = rules["joiner"]
+    sentences = split_sentences(script, language)
+
+    chunks = []
+    for index, sentence in enumerate(sentences):
+        for piece in _split_long(sentence, max_chars, rules):
+            if chunks:
+                last = chunks[-1]
+                merged_length = len(last["text"]) + len(joiner) + len(piece)
+                if (len(last["text"]) < min_chars or len(piece) < min_chars) and merged_length <= max_chars:
+                    last["text"] = f"{last['text']}{joiner}{piece}"
+                    last["parts"].append((index, piece))
+                    continue
+            chunks.append({"text": piece, "parts": [(index, piece)]})
+    return sentences, chunks
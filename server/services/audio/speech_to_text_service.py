@@ -1,8 +1,19 @@
-import whisper
-from pydub import AudioSegment
-import os
-from google import genai
+from services.audio.whisper_models import whisper_registry
+from services.audio.audio_service import decode_audio_file
+from services.audio.long_form_transcription import transcribe_long_form, iter_long_form
+from services.audio.transcription_cache import transcription_cache
+from config.audio import (
+    STT_LONG_FORM_SECONDS, STT_WORKERS, STT_CORRECTION_BATCH_SEGMENTS, STT_CORRECTION_BATCH_CHARS,
+    STT_CORRECTION_CONCURRENCY
+)
+from services.llm.gateway import llm_gateway
+from google.genai import types
+from concurrent.futures import ThreadPoolExecutor
 import json
+import asyncio
+
+# Whisper nhận âm thanh mono 16 kHz float32
+WHISPER_SAMPLE_RATE = 16000
 
 # Ánh xạ từ value trong mảng languages sang mã ISO 639-1 cho Whisper
 language_mapping_whisper = {
@@ -56,13 +67,10 @@ language_mapping_whisper = {
 }
 
 def correct_script(text):
-    client = genai.Client()
-    
     prompt = f"Sửa chính tả (không thêm gì khác): {text}"
 
     try:    
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
+        response = llm_gateway.generate_content(
             contents=[prompt]
         )
         return response.text
@@ -70,47 +78,267 @@ def correct_script(text):
     except Exception as e:
         print(f"Lỗi khi sửa chính tả kịch bản với Gemini: {e}")
         return f"This is a script about (generated without Gemini due to an error)."
-    
 
-def analyze_audio(audio_file, language_value="vietnamese"):
+
+async def correct_script_async(text):
+    """Giống correct_script nhưng không chặn event loop"""
+    prompt = f"Sửa chính tả (không thêm gì khác): {text}"
+
+    try:
+        response = await llm_gateway.agenerate_content(contents=[prompt])
+        return response.text
+
+    except Exception as e:
+        print(f"Lỗi khi sửa chính tả kịch bản với Gemini: {e}")
+        return "This is a script about (generated without Gemini due to an error)."
+
+
+def _correct_segment_fallback(text):
+    """Sửa từng đoạn riêng lẻ; nếu Gemini lỗi thì giữ nguyên văn bản Whisper thay vì thay bằng câu mặc định"""
+    try:
+        response = llm_gateway.generate_content(
+            contents=[f"Sửa chính tả (không thêm gì khác): {text}"]
+        )
+        return response.text.strip() if response.text else text
+    except Exception as e:
+        print(f"Lỗi khi sửa chính tả đoạn với Gemini: {e}")
+        return text
+
+
+async def _correct_segment_fallback_async(text):
+    try:
+        response = await llm_gateway.agenerate_content(
+            contents=[f"Sửa chính tả (không thêm gì khác): {text}"]
+        )
+        return response.text.strip() if response.text else text
+    except Exception as e:
+        print(f"Lỗi khi sửa chính tả đoạn với Gemini: {e}")
+        return text
+
+
+def _correct_segments_request(texts, language_value):
+    """Prompt và cấu hình (mảng JSON ra) cho lần gọi sửa chính tả hàng loạt"""
+    prompt = (
+        f"Dưới đây là một mảng JSON gồm {len(texts)} đoạn văn bản ({language_value}) được nhận diện từ giọng nói. "
+        "Sửa chính tả từng đoạn (không thêm gì khác, không gộp hay tách đoạn) và trả về một mảng JSON "
+        f"gồm đúng {len(texts)} chuỗi theo cùng thứ tự.\n"
+        + json.dumps(texts, ensure_ascii=False)
+    )
+    config = types.GenerateContentConfig(
+        response_mime_type="application/json",
+        response_schema=list[str]
+    )
+    return [prompt], config
+
+
+def _parse_corrections(texts, corrected):
+    """Nội dung đã sửa của từng đoạn, hoặc None cho đoạn cần sửa lại riêng lẻ"""
+    if not isinstance(corrected, list) or len(corrected) != len(texts):
+        # Không giữ được ranh giới đoạn: không thể ghép kết quả với timings nên sửa lại từng đoạn
+        print("Phản hồi sửa chính tả hàng loạt không hợp lệ, chuyển sang sửa từng đoạn")
+        return [None] * len(texts)
+    return [item.strip() if isinstance(item, str) and item.strip() else None for item in corrected]
+
+
+def _correction_batches(texts):
+    """Chia các đoạn (giữ thứ tự) thành lô <= STT_CORRECTION_BATCH_SEGMENTS đoạn và <= STT_CORRECTION_BATCH_CHARS ký tự"""
+    batches = []
+    size = 0
+    for text in texts:
+        if not batches or len(batches[-1]) >= STT_CORRECTION_BATCH_SEGMENTS or size + len(text) > STT_CORRECTION_BATCH_CHARS:
+            batches.append([])
+            size = 0
+        batches[-1].append(text)
+        size += len(text)
+    return batches
+
+
+def _correct_batch(texts, language_value):
+    contents, config = _correct_segments_request(texts, language_value)
+    corrected = None
+    try:
+        response = llm_gateway.generate_content(contents=contents, config=config)
+        corrected = json.loads(response.text)
+    except Exception as e:
+        print(f"Lỗi khi sửa chính tả hàng loạt với Gemini: {e}")
+    return _parse_corrections(texts, corrected)
+
+
+async def _correct_batch_async(texts, language_value):
+    contents, config = _correct_segments_request(texts, language_value)
+    corrected = None
+    try:
+        response = await llm_gateway.agenerate_content(contents=contents, config=config)
+        corrected = json.loads(response.text)
+    except Exception as e:
+        print(f"Lỗi khi sửa chính tả hàng loạt với Gemini: {e}")
+    return _parse_corrections(texts, corrected)
+
+
+def correct_segments(texts, language_value="vietnamese"):
     """
-    Phân tích file âm thanh, trả về mảng timings giống định dạng của bạn.
-    :param audio_file: Đường dẫn tới file âm thanh (mp3, wav, ...).
-    :param language_value: Giá trị từ mảng languages (ví dụ: 'vietnamese', 'english').
-    :return: Mảng timings với các trường start_time, end_time, content.
+    Sửa chính tả các đoạn Whisper theo lô (mảng JSON vào, mảng JSON ra), mỗi lô một lần gọi Gemini.
+    Chỉ các đoạn mà phản hồi không hợp lệ mới được sửa lại riêng lẻ; tối đa STT_CORRECTION_CONCURRENCY lời gọi cùng lúc.
+    :param texts: Danh sách nội dung các đoạn, theo thứ tự.
+    :return: Danh sách đã sửa, cùng độ dài và thứ tự với texts.
+    """
+    if not texts:
+        return []
+
+    with ThreadPoolExecutor(max_workers=max(1, STT_CORRECTION_CONCURRENCY)) as pool:
+        batches = pool.map(lambda batch: _correct_batch(batch, language_value), _correction_batches(texts))
+        items = [item for batch in batches for item in batch]
+        fallbacks = iter(list(pool.map(
+            _correct_segment_fallback, [text for text, item in zip(texts, items) if item is None]
+        )))
+    return [item if item is not None else next(fallbacks) for item in items]
+
+
+async def correct_segments_async(texts, language_value="vietnamese"):
+    """Giống correct_segments nhưng không chặn event loop; các lô và các đoạn sửa lại riêng lẻ dùng chung giới hạn đồng thời"""
+    if not texts:
+        return []
+
+    semaphore = asyncio.Semaphore(max(1, STT_CORRECTION_CONCURRENCY))
+
+    async def bounded(coroutine):
+        async with semaphore:
+            return await coroutine
+
+    batches = await asyncio.gather(*[
+        bounded(_correct_batch_async(batch, language_value)) for batch in _correction_batches(texts)
+    ])
+    items = [item for batch in batches for item in batch]
+    fallbacks = iter(await asyncio.gather(*[
+        bounded(_correct_segment_fallback_async(text)) for text, item in zip(texts, items) if item is None
+    ]))
+    return [item if item is not None else next(fallbacks) for item in items]
+
+
+def decode_for_whisper(audio_file):
+    """Giải mã file upload một lần thành mảng float32 mono 16 kHz cho Whisper (bản lưu trữ được chuyển từ file gốc)"""
+    return decode_audio_file(audio_file, WHISPER_SAMPLE_RATE)
+
+
+def recognize_segments(samples, language_value="vietnamese", on_segment=None):
+    """
+    Nhận dạng âm thanh đã giải mã bằng decode_for_whisper (chưa sửa chính tả).
+    :param on_segment: Hàm on_segment(segment, duration) được gọi với từng đoạn ngay khi nhận dạng xong.
+    :return: Các đoạn có nội dung [{start, end, text}]
     """
     # Lấy mã ngôn ngữ từ ánh xạ
     language_code = language_mapping_whisper.get(language_value)
     if not language_code:
         raise ValueError(f"Ngôn ngữ '{language_value}' không được hỗ trợ bởi Whisper.")
 
-    # Load mô hình Whisper
-    model = whisper.load_model("base")  # Có thể chọn "small", "medium", "large"
-
-    # Đọc file âm thanh
-    audio = AudioSegment.from_file(audio_file)
-    
-    # Chuyển đổi sang định dạng wav cho Whisper
-    temp_file = "temp.wav"
-    audio.export(temp_file, format="wav")
-    
     # Nhận diện giọng nói với ngôn ngữ được chỉ định
-    result = model.transcribe(temp_file, language=language_code, verbose=True)
+    duration = len(samples) / WHISPER_SAMPLE_RATE
+    long_form = STT_LONG_FORM_SECONDS and duration > STT_LONG_FORM_SECONDS and STT_WORKERS > 1
+    if on_segment is not None:
+        # Gửi từng đoạn cho người gọi ngay khi có thay vì chờ cả file
+        if long_form:
+            stream = iter_long_form(samples, WHISPER_SAMPLE_RATE, language_code)
+        else:
+            stream = whisper_registry.iter_transcribe(samples.reshape(-1), language=language_code)
+        result = {"segments": []}
+        for segment in stream:
+            result["segments"].append(segment)
+            if segment["text"].strip():
+                on_segment(segment, duration)
+    elif long_form:
+        # Bản ghi dài: cắt tại khoảng lặng và nhận dạng song song các cửa sổ
+        result = transcribe_long_form(samples, WHISPER_SAMPLE_RATE, language_code)
+    else:
+        # Model được nạp một lần cho cả tiến trình (WHISPER_MODEL) và dùng chung giữa các request
+        result = whisper_registry.transcribe(samples.reshape(-1), language=language_code, verbose=True)
 
-    # Xóa file tạm
-    os.remove(temp_file)
-    
+    return [
+        {"start": segment["start"], "end": segment["end"], "text": segment["text"]}
+        for segment in result["segments"] if segment["text"].strip()
+    ]
+
+
+def _build_transcription(segments, contents):
+    """Ghép các đoạn Whisper với nội dung đã sửa chính tả thành (result_text, timings_string)"""
     # Tạo mảng timings theo định dạng của bạn
     timings = [
         {
             "start_time": round(segment["start"], 2),  # Làm tròn 2 chữ số thập phân
             "end_time": round(segment["end"], 2),      # Làm tròn 2 chữ số thập phân
-            "content": correct_script(segment["text"].strip())         # Nội dung câu
-        } for segment in result["segments"] if segment["text"].strip()
+            "content": content                         # Nội dung câu
+        } for segment, content in zip(segments, contents)
     ]
     
     timings_string = json.dumps(timings, ensure_ascii=False, indent=4)
     
-    result_text = " ".join([segment["text"] for segment in result["segments"] if segment["text"].strip()])
+    result_text = " ".join([segment["text"] for segment in segments])
 
     return result_text, timings_string
+
+
+def transcribe_samples(samples, language_value="vietnamese", on_segment=None):
+    """
+    Nhận dạng và sửa chính tả âm thanh đã giải mã bằng decode_for_whisper (không dùng cache).
+    :return: (result_text, timings_string, các đoạn Whisper gốc [{start, end, text}])
+    """
+    segments = recognize_segments(samples, language_value, on_segment)
+    # Sửa chính tả tất cả các đoạn trong một lần gọi Gemini
+    contents = correct_segments([segment["text"].strip() for segment in segments], language_value)
+    return (*_build_transcription(segments, contents), segments)
+
+
+async def transcribe_samples_async(samples, language_value="vietnamese", on_segment=None):
+    """Giống transcribe_samples; Whisper chạy trong luồng riêng và Gemini qua API async nên không chặn event loop"""
+    segments = await asyncio.to_thread(recognize_segments, samples, language_value, on_segment)
+    contents = await correct_segments_async([segment["text"].strip() for segment in segments], language_value)
+    return (*_build_transcription(segments, contents), segments)
+
+
+def lookup_transcription(audio_file, language_value="vietnamese"):
+    """
+    Tra cache theo nội dung file upload và ngôn ngữ.
+    :return: (khóa cache, (result_text, timings_string) nếu đã có, ngược lại None)
+    """
+    key = transcription_cache.key_for_file(audio_file, language_value)
+    cached = transcription_cache.get(key)
+    if cached is None:
+        return key, None
+    print(f"Dùng kết quả nhận dạng đã cache cho {audio_file}")
+    return key, (cached["result_text"], cached["timings_string"])
+
+
+def transcribe_and_cache(key, samples, language_value="vietnamese", on_segment=None):
+    """Nhận dạng samples rồi lưu kết quả vào cache với khóa từ lookup_transcription"""
+    result_text, timings_string, segments = transcribe_samples(samples, language_value, on_segment)
+    transcription_cache.put(key, language_value, result_text, segments, timings_string)
+    return result_text, timings_string
+
+
+async def lookup_transcription_async(audio_file, language_value="vietnamese"):
+    """Giống lookup_transcription nhưng băm file và truy vấn MongoDB trong luồng khác, không chặn event loop"""
+    return await asyncio.to_thread(lookup_transcription, audio_file, language_value)
+
+
+async def transcribe_and_cache_async(key, samples, language_value="vietnamese", on_segment=None):
+    """Giống transcribe_and_cache nhưng không chặn event loop"""
+    result_text, timings_string, segments = await transcribe_samples_async(samples, language_value, on_segment)
+    await asyncio.to_thread(transcription_cache.put, key, language_value, result_text, segments, timings_string)
+    return result_text, timings_string
+
+
+def analyze_audio(audio_file, language_value="vietnamese", samples=None):
+    """
+    Phân tích file âm thanh, trả về mảng timings giống định dạng của bạn.
+    :param audio_file: Đường dẫn tới file âm thanh (mp3, wav, ...).
+    :param language_value: Giá trị từ mảng languages (ví dụ: 'vietnamese', 'english').
+    :param samples: Âm thanh đã giải mã bằng decode_for_whisper (nếu có) để không giải mã lại audio_file.
+    :return: Mảng timings với các trường start_time, end_time, content.
+    """
+    key, cached = lookup_transcription(audio_file, language_value)
+    if cached is not None:
+        return cached
+
+    # Giải mã trong bộ nhớ, không ghi file tạm (các request đồng thời không ghi đè lên nhau)
+    if samples is None:
+        samples = decode_for_whisper(audio_file)
+    return transcribe_and_cache(key, samples, language_value)
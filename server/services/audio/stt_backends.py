@@ -0,0 +1,77 @@
+from config.audio import STT_BEAM_SIZE, STT_COMPUTE_TYPE, STT_CPU_THREADS, STT_STREAM_WINDOW_SECONDS
+from services.audio.long_form_transcription import split_at_silence
+
+# Các engine nhận dạng giọng nói dùng chung một giao diện: load(model_name, device) và
+# transcribe(model, audio, language) trả về {"text", "segments": [{"start", "end", "text"}]}
+# giống kết quả của openai-whisper, để analyze_audio không phụ thuộc engine nào được chọn.
+# iter_transcribe(model, audio, language) trả về từng đoạn ngay khi nhận dạng xong (cho job nhận dạng trực tuyến).
+# Thư viện của engine chỉ được import khi engine đó được dùng.
+
+
+class WhisperBackend:
+    """openai-whisper (PyTorch, fp32 trên CPU)"""
+
+    name = "whisper"
+
+    def load(self, model_name, device=None):
+        import whisper
+        return whisper.load_model(model_name, device=device)
+
+    def transcribe(self, model, audio, language=None, verbose=None):
+        options = {"beam_size": STT_BEAM_SIZE} if STT_BEAM_SIZE else {}
+        result = model.transcribe(audio, language=language, verbose=verbose, **options)
+        return {
+            "text": result["text"],
+            "segments": [
+                {"start": segment["start"], "end": segment["end"], "text": segment["text"]}
+                for segment in result["segments"]
+            ],
+        }
+
+    def iter_transcribe(self, model, audio, language=None, sample_rate=16000):
+        # openai-whisper chỉ trả kết quả khi xong cả file: nhận dạng lần lượt từng cửa sổ ngắn cắt tại khoảng lặng
+        for start, end in split_at_silence(audio, sample_rate, STT_STREAM_WINDOW_SECONDS):
+            offset = start / sample_rate
+            for segment in self.transcribe(model, audio[start:end], language=language)["segments"]:
+                yield {**segment, "start": segment["start"] + offset, "end": segment["end"] + offset}
+
+
+class FasterWhisperBackend:
+    """faster-whisper (CTranslate2), mặc định lượng tử hóa int8 cho máy chỉ có CPU"""
+
+    name = "faster_whisper"
+
+    def load(self, model_name, device=None):
+        from faster_whisper import WhisperModel
+        return WhisperModel(
+            model_name,
+            device=device or "cpu",
+            compute_type=STT_COMPUTE_TYPE,
+            cpu_threads=STT_CPU_THREADS
+        )
+
+    def transcribe(self, model, audio, language=None, verbose=None):
+        segments = list(self.iter_transcribe(model, audio, language=language))
+        if verbose:
+            for segment in segments:
+                print(f"[{segment['start']:.2f} --> {segment['end']:.2f}] {segment['text']}")
+        return {"text": "".join(segment["text"] for segment in segments), "segments": segments}
+
+    def iter_transcribe(self, model, audio, language=None, sample_rate=16000):
+        options = {"beam_size": STT_BEAM_SIZE} if STT_BEAM_SIZE else {}
+        # segments là generator: việc giải mã thực sự diễn ra khi duyệt qua nó
+        segments, _ = model.transcribe(audio, language=language, **options)
+        for segment in segments:
+            yield {"start": segment.start, "end": segment.end, "text": segment.text}
+
+
+STT_BACKENDS = {
+    backend.name: backend for backend in (WhisperBackend(), FasterWhisperBackend())
+}
+
+
+def get_backend(name):
+    backend = STT_BACKENDS.get(name)
+    if backend is None:
+        raise ValueError(f"Engine nhận dạng '{name}' không được hỗ trợ. Chọn một trong: {', '.join(STT_BACKENDS)}")
+    return backend
@@ -0,0 +1,138 @@
+import hashlib
+import json
+import threading
+from datetime import datetime, timedelta
+
+from config.audio import (
+    STT_CACHE_ENABLED, STT_CACHE_TTL_SECONDS, STT_CACHE_MAX_ENTRIES, STT_CACHE_EVICT_INTERVAL,
+    STT_BACKEND, WHISPER_MODEL, STT_BEAM_SIZE, STT_COMPUTE_TYPE
+)
+from models.models import TranscriptionCache
+
+
+def hash_audio_file(audio_file, block_size=1024 * 1024):
+    """SHA-256 của nội dung file, đọc từng khối để không phải nạp cả file vào bộ nhớ"""
+    digest = hashlib.sha256()
+    with open(audio_file, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class TranscriptionResultCache:
+    """
+    Cache kết quả nhận dạng trong MongoDB: TTL theo expires_at, giới hạn số mục (LRU theo last_used_at).
+    Các mục vượt giới hạn được dọn sau mỗi evict_interval lần ghi, không đếm lại cả collection mỗi lần ghi.
+    """
+
+    def __init__(self, ttl_seconds, max_entries, enabled=True, evict_interval=STT_CACHE_EVICT_INTERVAL):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.evict_interval = max(1, evict_interval)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(file_hash, language):
+        """Khóa gồm nội dung file, ngôn ngữ và các cấu hình model ảnh hưởng tới kết quả nhận dạng"""
+        settings = [file_hash, language, STT_BACKEND, WHISPER_MODEL, STT_BEAM_SIZE]
+        if STT_BACKEND == "faster_whisper":
+            settings.append(STT_COMPUTE_TYPE)
+        return hashlib.sha256(json.dumps(settings).encode("utf-8")).hexdigest()
+
+    def key_for_file(self, audio_file, language):
+        return self.make_key(hash_audio_file(audio_file), language)
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key):
+        """Trả về {"result_text", "timings_string", "segments"} đã cache hoặc None"""
+        if not self.enabled:
+            return None
+        now = datetime.utcnow()
+        try:
+            # MongoDB chỉ dọn mục hết hạn định kỳ nên vẫn kiểm tra expires_at khi đọc
+            entry = TranscriptionCache.objects(key=key, expires_at__gt=now).first()
+            if entry is not None:
+                entry.update(set__last_used_at=now, inc__hits=1)
+        except Exception as e:
+            print(f"Lỗi khi đọc cache nhận dạng: {e}")
+            entry = None
+
+        self._count(entry is not None)
+        if entry is None:
+            return None
+        return {
+            "result_text": entry.result_text,
+            "timings_string": entry.timings,
+            "segments": json.loads(entry.segments or "[]"),
+        }
+
+    def put(self, key, language, result_text, segments, timings_string):
+        """Lưu (hoặc ghi đè) kết quả nhận dạng; cứ evict_interval lần ghi thì xóa các mục ít dùng nhất vượt giới hạn"""
+        if not self.enabled:
+            return
+        now = datetime.utcnow()
+        segments_string = json.dumps(segments, ensure_ascii=False)
+        try:
+            TranscriptionCache.objects(key=key).update_one(
+                upsert=True,
+                set__language=language,
+                set__result_text=result_text,
+                set__segments=segments_string,
+                set__timings=timings_string,
+                set__size=len(segments_string.encode("utf-8")) + len(timings_string.encode("utf-8")),
+                set__created_at=now,
+                set__last_used_at=now,
+                set__expires_at=now + timedelta(seconds=self.ttl_seconds)
+            )
+            with self._lock:
+                self._puts += 1
+                due = self._puts % self.evict_interval == 0
+            if due:
+                self._evict()
+        except Exception as e:
+            print(f"Lỗi khi ghi cache nhận dạng: {e}")
+
+    def _evict(self):
+        # Các mục đứng sau max_entries mục dùng gần nhất (theo index last_used_at); mục hết hạn do TTL index dọn
+        stale = TranscriptionCache.objects.order_by("-last_used_at").skip(self.max_entries).only("id")
+        ids = [entry.id for entry in stale]
+        if not ids:
+            return
+        removed = TranscriptionCache.objects(id__in=ids).delete()
+        with self._lock:
+            self.evictions += removed
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+            }
+        try:
+            stats["entries"] = TranscriptionCache.objects.count() if self.enabled else 0
+        except Exception as e:
+            print(f"Lỗi khi đọc cache nhận dạng: {e}")
+            stats["entries"] = None
+        return stats
+
+
+transcription_cache = TranscriptionResultCache(
+    STT_CACHE_TTL_SECONDS, STT_CACHE_MAX_ENTRIES, enabled=STT_CACHE_ENABLED
+)
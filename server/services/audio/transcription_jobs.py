@@ -0,0 +1,88 @@
+import threading
+import time
+import uuid
+
+from config.audio import STT_JOB_TTL_SECONDS
+
+# Job nhận dạng chạy nền: mỗi job giữ danh sách sự kiện (started, segment, done, error) để client
+# nhận qua SSE hoặc long-poll, kể cả khi kết nối lại giữa chừng. Job chỉ nằm trong bộ nhớ của tiến trình tạo ra nó.
+
+FINAL_EVENTS = ("done", "error")
+
+
+class TranscriptionJob:
+    def __init__(self, job_id):
+        self.id = job_id
+        self.status = "queued"
+        self.events = []
+        self.created_at = time.time()
+        self.finished_at = None
+        self._condition = threading.Condition()
+
+    def emit(self, event):
+        """Thêm một sự kiện; done/error kết thúc job"""
+        with self._condition:
+            self.events.append(event)
+            if event["type"] in FINAL_EVENTS:
+                self.status = "completed" if event["type"] == "done" else "error"
+                self.finished_at = time.time()
+            elif self.status == "queued":
+                self.status = "running"
+            self._condition.notify_all()
+
+    def events_since(self, after=0, timeout=None):
+        """
+        Các sự kiện từ vị trí after; chờ tối đa timeout giây nếu chưa có sự kiện mới và job chưa kết thúc.
+        :return: (danh sách sự kiện, vị trí tiếp theo)
+        """
+        with self._condition:
+            if timeout and len(self.events) <= after and self.finished_at is None:
+                self._condition.wait(timeout)
+            events = self.events[after:]
+            return events, after + len(events)
+
+    @property
+    def finished(self):
+        return self.finished_at is not None
+
+    def snapshot(self):
+        with self._condition:
+            return {
+                "job_id": self.id,
+                "status": self.status,
+                "event_count": len(self.events),
+                "created_at": self.created_at,
+                "finished_at": self.finished_at,
+            }
+
+
+class TranscriptionJobStore:
+    """Các job nhận dạng của tiến trình; job đã kết thúc được xóa sau ttl_seconds"""
+
+    def __init__(self, ttl_seconds):
+        self.ttl_seconds = ttl_seconds
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self):
+        job = TranscriptionJob(uuid.uuid4().hex)
+        with self._lock:
+            self._cleanup()
+            self._jobs[job.id] = job
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _cleanup(self):
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished and now - job.finished_at > self.ttl_seconds
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+transcription_jobs = TranscriptionJobStore(STT_JOB_TTL_SECONDS)
@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from config.audio import TTS_CACHE_DIR, TTS_CACHE_MAX_BYTES, TTS_CACHE_ENABLED
+
+
+class TTSChunkCache:
+    """Cache trên đĩa cho âm thanh TTS của từng câu, khóa theo nội dung, giới hạn dung lượng (LRU)"""
+
+    def __init__(self, cache_dir, max_bytes, enabled=True):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> size, cũ nhất ở đầu
+        self._total_bytes = 0
+        self._loaded = False
+        self._load_lock = threading.Lock()
+
+    @staticmethod
+    def make_key(engine, voice, text, speed=1.0, pitch=1.0):
+        """Tạo khóa từ các tham số ảnh hưởng tới dữ liệu âm thanh được tổng hợp"""
+        payload = json.dumps(
+            [engine, voice, text, round(float(speed), 4), round(float(pitch), 4)],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.bin")
+
+    def _meta_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _ensure_loaded(self):
+        """Tạo thư mục và dựng chỉ mục ở lần dùng đầu tiên thay vì khi import module"""
+        if self._loaded:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with self._lock:
+                self._load_index()
+            self._loaded = True
+
+    def _load_index(self):
+        """Dựng lại chỉ mục LRU từ các file đã có, sắp theo thời gian truy cập (gọi khi đã giữ lock)"""
+        found = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".bin"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                size = stat.st_size
+                meta_path = f"{path[:-4]}.json"
+                if os.path.exists(meta_path):
+                    size += os.path.getsize(meta_path)
+                found.append((stat.st_mtime, name[:-4], size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total_bytes += size
+        self._evict()
+
+    def get(self, key, with_meta=False):
+        """Trả về bytes đã cache (kèm metadata nếu with_meta=True) hoặc None"""
+        if not self.enabled:
+            return None
+        self._ensure_loaded()
+        path = self._path(key)
+        meta = None
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            if with_meta and os.path.exists(self._meta_path(key)):
+                with open(self._meta_path(key), "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+            # Cập nhật mtime để thứ tự LRU còn đúng sau khi khởi động lại
+            os.utime(path, None)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+                size = self._entries.pop(key, None)
+                if size is not None:
+                    self._total_bytes -= size
+            return None
+
+        with self._lock:
+            self.hits += 1
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            else:
+                self._entries[key] = len(data)
+                self._total_bytes += len(data)
+        return (data, meta) if with_meta else data
+
+    def _write(self, path, data):
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def put(self, key, data, meta=None):
+        """Lưu bytes (và metadata JSON nếu có) vào cache, loại bỏ các mục cũ nếu vượt giới hạn"""
+        if not self.enabled or not data:
+            return
+        self._ensure_loaded()
+        meta_bytes = json.dumps(meta, ensure_ascii=False).encode("utf-8") if meta is not None else b""
+        size = len(data) + len(meta_bytes)
+        if size > self.max_bytes:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            # Ghi metadata trước để khi file âm thanh xuất hiện thì metadata đã sẵn sàng
+            if meta_bytes:
+                self._write(self._meta_path(key), meta_bytes)
+            self._write(path, data)
+        except OSError as e:
+            print(f"Lỗi khi ghi cache TTS: {e}")
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._total_bytes -= previous
+            self._entries[key] = size
+            self._total_bytes += size
+            self._evict()
+
+    def _evict(self):
+        """Xóa các mục ít được dùng nhất cho tới khi nằm trong giới hạn (gọi khi đã giữ lock)"""
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            for path in (self._path(key), self._meta_path(key)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def stats(self):
+        if self.enabled:
+            self._ensure_loaded()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "total_bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+tts_cache = TTSChunkCache(TTS_CACHE_DIR, TTS_CACHE_MAX_BYTES, enabled=TTS_CACHE_ENABLED)
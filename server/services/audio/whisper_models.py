@@ -0,0 +1,161 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from config.audio import WHISPER_MODEL, WHISPER_PRELOAD_MODELS, WHISPER_POOL_SIZE, WHISPER_DEVICE, STT_BACKEND
+from services.audio.stt_backends import get_backend
+
+
+class WhisperModelPool:
+    """Tối đa size bản sao của một model Whisper, nạp khi cần và dùng lại giữa các request"""
+
+    def __init__(self, name, size=1, device=None, backend=None):
+        self.name = name
+        self.backend = backend or get_backend(STT_BACKEND)
+        self.size = max(1, size)
+        self.device = device
+        self._idle = []
+        self._created = 0
+        self._in_use = 0
+        self._condition = threading.Condition()
+        self._metrics = {
+            "load_count": 0,
+            "load_seconds_total": 0.0,
+            "last_load_seconds": None,
+            "inference_count": 0,
+            "inference_seconds_total": 0.0,
+            "last_inference_seconds": None,
+            "wait_seconds_total": 0.0,
+        }
+
+    def _load(self):
+        started = time.perf_counter()
+        model = self.backend.load(self.name, self.device)
+        elapsed = time.perf_counter() - started
+        print(f"Đã nạp Whisper '{self.name}' ({self.backend.name}) trong {elapsed:.2f}s")
+        with self._condition:
+            self._metrics["load_count"] += 1
+            self._metrics["load_seconds_total"] += elapsed
+            self._metrics["last_load_seconds"] = elapsed
+        return model
+
+    @contextmanager
+    def acquire(self):
+        """Mượn một bản sao của model; chờ nếu tất cả đang bận và pool đã đủ size bản sao"""
+        wait_started = time.perf_counter()
+        with self._condition:
+            while not self._idle and self._created >= self.size:
+                self._condition.wait()
+            model = self._idle.pop() if self._idle else None
+            if model is None:
+                # Giữ chỗ trước khi nạp để các request khác không nạp thêm bản sao vượt size
+                self._created += 1
+            self._in_use += 1
+
+        try:
+            if model is None:
+                model = self._load()
+        except Exception:
+            with self._condition:
+                self._created -= 1
+                self._in_use -= 1
+                self._condition.notify()
+            raise
+
+        with self._condition:
+            self._metrics["wait_seconds_total"] += time.perf_counter() - wait_started
+        try:
+            yield model
+        finally:
+            with self._condition:
+                self._idle.append(model)
+                self._in_use -= 1
+                self._condition.notify()
+
+    def record_inference(self, seconds):
+        with self._condition:
+            self._metrics["inference_count"] += 1
+            self._metrics["inference_seconds_total"] += seconds
+            self._metrics["last_inference_seconds"] = seconds
+
+    def stats(self):
+        with self._condition:
+            stats = dict(self._metrics)
+            stats.update({
+                "backend": self.backend.name,
+                "size": self.size,
+                "loaded": self._created,
+                "in_use": self._in_use,
+            })
+        count = stats["inference_count"]
+        stats["inference_seconds_avg"] = stats["inference_seconds_total"] / count if count else None
+        return stats
+
+
+class WhisperModelRegistry:
+    """Các pool model Whisper dùng chung trong tiến trình, mỗi tên model (tiny, base, small...) một pool"""
+
+    def __init__(self, default_model, pool_size=1, device=None, backend=STT_BACKEND):
+        self.default_model = default_model
+        self.pool_size = pool_size
+        self.device = device
+        self.backend = get_backend(backend)
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def _pool(self, name=None):
+        name = name or self.default_model
+        with self._lock:
+            if name not in self._pools:
+                self._pools[name] = WhisperModelPool(name, self.pool_size, self.device, self.backend)
+            return self._pools[name]
+
+    def acquire(self, name=None):
+        return self._pool(name).acquire()
+
+    def transcribe(self, audio, model_name=None, language=None, verbose=None):
+        """
+        Nhận dạng trên một bản sao đang rảnh và ghi nhận thời gian suy luận.
+        :return: {"text", "segments": [{"start", "end", "text"}]} với mọi engine
+        """
+        pool = self._pool(model_name)
+        with pool.acquire() as model:
+            started = time.perf_counter()
+            result = self.backend.transcribe(model, audio, language=language, verbose=verbose)
+            pool.record_inference(time.perf_counter() - started)
+        return result
+
+    def iter_transcribe(self, audio, model_name=None, language=None):
+        """Giống transcribe nhưng trả về từng đoạn {"start", "end", "text"} ngay khi có, giữ model tới khi duyệt xong"""
+        pool = self._pool(model_name)
+        with pool.acquire() as model:
+            started = time.perf_counter()
+            yield from self.backend.iter_transcribe(model, audio, language=language)
+            pool.record_inference(time.perf_counter() - started)
+
+    def preload(self, names=None):
+        """Nạp trước các model (mặc định WHISPER_PRELOAD_MODELS) để request đầu tiên không phải chờ"""
+        for name in names or WHISPER_PRELOAD_MODELS:
+            try:
+                with self.acquire(name):
+                    pass
+            except Exception as e:
+                print(f"Không nạp được Whisper '{name}': {e}")
+
+    def preload_in_background(self, names=None):
+        thread = threading.Thread(target=self.preload, args=(names,), name="whisper-preload", daemon=True)
+        thread.start()
+        return thread
+
+    def stats(self):
+        with self._lock:
+            pools = dict(self._pools)
+        return {
+            "backend": self.backend.name,
+            "default_model": self.default_model,
+            "pool_size": self.pool_size,
+            "models": {name: pool.stats() for name, pool in pools.items()},
+        }
+
+
+whisper_registry = WhisperModelRegistry(WHISPER_MODEL, WHISPER_POOL_SIZE, WHISPER_DEVICE)
@@ -0,0 +1,181 @@
+import asyncio
+import json
+import re
+
+from google.genai import types
+
+from services.content.script_service import (
+    STYLES, sanitize_text, create_title_with_llama_async, create_description_with_llama_async
+)
+from services.llm.gateway import llm_gateway
+from services.llm.response_cache import llm_cache
+from config.llm import GEMINI_MODEL
+
+# Tạo caption (tiêu đề, mô tả, hashtag) cho video bằng một lần gọi Gemini có đầu ra JSON,
+# sau đó cắt cho vừa giới hạn của từng nền tảng đăng video.
+
+
+def count_utf16_runes(text):
+    """Count UTF-16 code units (runes) in a string, accounting for surrogate pairs."""
+    if not text:
+        return 0
+    # Encode to UTF-16 and count code units (2 bytes per unit, including surrogates)
+    encoded = text.encode('utf-16-le')
+    return len(encoded) // 2
+
+
+def count_utf8_bytes(text):
+    return len(text.encode("utf-8")) if text else 0
+
+
+TIKTOK_CAPTION_MAX_RUNES = 2200
+
+# Giới hạn theo nền tảng: (độ dài tối đa, hàm đếm) cho title, description và caption.
+# caption là chuỗi "title description" mà client gửi lên TikTok (TikTok chỉ có một trường caption).
+PLATFORM_LIMITS = {
+    "youtube": {"title": (100, len), "description": (5000, count_utf8_bytes)},
+    "tiktok": {"caption": (TIKTOK_CAPTION_MAX_RUNES, count_utf16_runes)},
+    "facebook": {"description": (63206, len)},
+}
+
+CAPTION_SCHEMA = types.Schema(
+    type=types.Type.OBJECT,
+    properties={
+        "title": types.Schema(type=types.Type.STRING),
+        "description": types.Schema(type=types.Type.STRING),
+        "hashtags": types.Schema(type=types.Type.ARRAY, items=types.Schema(type=types.Type.STRING)),
+    },
+    required=["title", "description", "hashtags"]
+)
+
+_HASHTAG_PATTERN = re.compile(r"#\w+")
+
+
+def _caption_prompt(topic, style, lang):
+    style = STYLES.get(style, (style,))[0]
+    return (
+        f"Tạo caption cho một video về {topic} trong ngôn ngữ {lang}, phong cách dành cho {style}. "
+        "Trả về một đối tượng JSON gồm: title là duy nhất 1 tiêu đề video (không thêm gì khác), "
+        "description là mô tả video ngắn cỡ 30 chữ (không kèm hashtag), "
+        "hashtags là danh sách 3 đến 5 hashtag có dấu # để đăng mạng xã hội."
+    )
+
+
+def _normalize_hashtags(hashtags):
+    tags = []
+    for tag in hashtags:
+        tag = "#" + "".join(str(tag).split()).lstrip("#")
+        if len(tag) > 1 and tag not in tags:
+            tags.append(tag)
+    return tags
+
+
+def _join_description(body, hashtags):
+    return " ".join(part for part in (body, " ".join(hashtags)) if part)
+
+
+def _limits_for(platform):
+    if platform is None:
+        # Caption áp dụng cho mọi nền tảng: phải vừa giới hạn chặt nhất của từng trường
+        return [limit for limits in PLATFORM_LIMITS.values() for limit in limits.items()]
+    return list(PLATFORM_LIMITS[platform].items())
+
+
+def _fits(limits, title, description):
+    values = {"title": title, "description": description, "caption": f"{title} {description}"}
+    return all(count(values[field]) <= maximum for field, (maximum, count) in limits)
+
+
+def _truncate(text, fits):
+    """Đoạn đầu dài nhất của text (cắt ở ranh giới từ nếu có thể) mà fits(đoạn đó) vẫn đúng"""
+    if fits(text):
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if fits(text[:middle]):
+            low = middle
+        else:
+            high = middle - 1
+    cut = text[:low]
+    if " " in cut and low < len(text) and not text[low].isspace():
+        cut = cut.rsplit(" ", 1)[0]
+    return cut.rstrip()
+
+
+def fit_caption(title, description, hashtags, platform=None):
+    """
+    Cắt caption cho vừa giới hạn của nền tảng (None: tất cả nền tảng).
+    Bỏ bớt hashtag cuối trước, chỉ cắt mô tả khi không còn hashtag.
+    :return: {"title", "description" (đã kèm hashtag), "hashtags"}
+    """
+    limits = _limits_for(platform)
+    title = (title or "").strip()
+    body = (description or "").strip()
+    hashtags = _normalize_hashtags(hashtags or [])
+
+    title = _truncate(title, lambda text: _fits([limit for limit in limits if limit[0] != "description"], text, ""))
+
+    while hashtags and not _fits(limits, title, _join_description(body, hashtags)):
+        hashtags.pop()
+    body = _truncate(body, lambda text: _fits(limits, title, _join_description(text, hashtags)))
+
+    return {"title": title, "description": _join_description(body, hashtags), "hashtags": hashtags}
+
+
+def _parse_caption(text):
+    caption = json.loads(text)
+    if not isinstance(caption, dict):
+        raise ValueError("Phản hồi caption không phải đối tượng JSON")
+    title = caption.get("title")
+    description = caption.get("description")
+    hashtags = caption.get("hashtags") or []
+    if not isinstance(title, str) or not title.strip() or not isinstance(description, str):
+        raise ValueError("Phản hồi caption thiếu title hoặc description")
+    if not isinstance(hashtags, list):
+        hashtags = _HASHTAG_PATTERN.findall(str(hashtags))
+    # Model có thể vẫn để hashtag trong mô tả: tách ra để không bị lặp
+    hashtags = hashtags + _HASHTAG_PATTERN.findall(description)
+    return sanitize_text(title), " ".join(_HASHTAG_PATTERN.sub("", description).split()), hashtags
+
+
+async def _create_caption_with_llama_async(topic, style, lang):
+    # Ném lỗi nếu Llama lỗi để caption mặc định không thắng câu trả lời Gemini đến chậm khi hedging
+    title, description = await asyncio.gather(
+        create_title_with_llama_async(topic, style, lang, raise_errors=True),
+        create_description_with_llama_async(topic, style, lang, raise_errors=True)
+    )
+    description = description or ""
+    return [title, " ".join(_HASHTAG_PATTERN.sub("", description).split()), _HASHTAG_PATTERN.findall(description)]
+
+
+async def create_caption_with_gemini_async(topic, style, lang, platform=None, regenerate=False):
+    """
+    Tạo tiêu đề, mô tả và hashtag trong một lần gọi Gemini (đầu ra JSON), đã cắt theo giới hạn của platform.
+    Kết quả trước khi cắt được cache nên mọi nền tảng dùng chung; regenerate=True bỏ qua cache.
+    :return: {"title", "description" (đã kèm hashtag), "hashtags"}
+    """
+    async def generate():
+        response = await llm_gateway.agenerate_content(
+            contents=[_caption_prompt(topic, style, lang)],
+            config=types.GenerateContentConfig(
+                response_mime_type="application/json",
+                response_schema=CAPTION_SCHEMA
+            )
+        )
+        return list(_parse_caption(response.text))
+
+    async def gemini():
+        return await llm_cache.acached_call(
+            llm_cache.make_key("caption", GEMINI_MODEL, topic, style, lang), generate, regenerate
+        )
+
+    try:
+        title, description, hashtags = await llm_gateway.with_fallback(
+            gemini, lambda: _create_caption_with_llama_async(topic, style, lang)
+        )
+    except Exception as e:
+        print(f"Lỗi khi tạo caption với Llama: {e}")
+        title, description, hashtags = f"Video about {topic}", f"Video khoa học về chủ đề: {topic}", []
+
+    return fit_caption(title, description, hashtags, platform)
@@ -1,8 +1,10 @@
-from google import genai
 from dotenv import load_dotenv
-import os
 import re
+import aiohttp
 import requests
+from services.llm.gateway import llm_gateway
+from services.llm.response_cache import llm_cache
+from config.llm import GEMINI_MODEL
 
 load_dotenv()
 
@@ -27,72 +29,77 @@ def sanitize_text(text):
 #     text = ' '.join(text.split())
 #     return text
 
-def create_script_with_gemini(topic, style, length,  lang):
-    """Tạo kịch bản với Gemini dựa trên dữ liệu Wiki hoặc khái niệm gốc"""
-    client = genai.Client()
-    if style == 1:
-        style =  "fun voice for kids"
-        target_audience =  "children"
-    elif style == 2:
-        style = "serious voice for educational content"
-        target_audience = "students"
-    elif style == 3:
-        style = "serious voice for scientific documents"
-        target_audience = "scientists"
-
-    prompt = f"Write a {length} words science text in the language {lang} about {topic}. Each sentence should be about 15 words. The text should be {style} and written for reading aloud. Use correct punctuation and grammar, ensuring a clear topic sentence, detailed explanation with definitions, analysis, examples, or comparisons, a concluding summary highlighting its importance or applications. The target audience is {target_audience}. Exclude any references to visuals, sound effects, video elements, calls to subscribe, or future videos. Focus on clear and engaging prose suitable for an audio format. The text should conclude naturally with a summary of the topic.  **Do not include any headers, subheadings, bullet points, numbered lists, or other formatting markers.  The text should be a single, continuous paragraph or a series of short, cohesive paragraphs.**"
+STYLES = {
+    1: ("fun voice for kids", "children"),
+    2: ("serious voice for educational content", "students"),
+    3: ("serious voice for scientific documents", "scientists"),
+}
+
+# Prompt dùng chung cho phiên bản đồng bộ và bất đồng bộ (async) của mỗi hàm tạo nội dung
+
+def _gemini_script_prompt(topic, style, length, lang):
+    style, target_audience = STYLES[style]
+    return f"Write a {length} words science text in the language {lang} about {topic}. Each sentence should be about 15 words. The text should be {style} and written for reading aloud. Use correct punctuation and grammar, ensuring a clear topic sentence, detailed explanation with definitions, analysis, examples, or comparisons, a concluding summary highlighting its importance or applications. The target audience is {target_audience}. Exclude any references to visuals, sound effects, video elements, calls to subscribe, or future videos. Focus on clear and engaging prose suitable for an audio format. The text should conclude naturally with a summary of the topic.  **Do not include any headers, subheadings, bullet points, numbered lists, or other formatting markers.  The text should be a single, continuous paragraph or a series of short, cohesive paragraphs.**"
+
+def _gemini_title_prompt(topic, style, lang):
+    style = STYLES.get(style, (style,))[0]
+    return f"Tạo duy nhất 1 tiêu đề video (không thêm gì khác) trong ngôn ngữ {lang} về {topic}. Tiêu đề có phong cách dành cho {style}."
+
+def _gemini_description_prompt(topic, style, lang):
+    style = STYLES.get(style, (style,))[0]
+    return f"Tạo duy nhất 1 mô tả video ngắn cỡ 30 chữ (không thêm gì khác) trong ngôn ngữ {lang} về {topic}. Mô tả có phong cách dành cho {style} có kèm theo cái hashtag có dấu # để đăng mạng xã hội."
+
+def _llama_script_prompt(topic, style, length, lang):
+    style, target_audience = STYLES[style]
+    return f"Write a {length} words science text in the language {lang} about {topic}. The text should be {style} and written for reading aloud. Use correct punctuation and grammar, ensuring a clear topic sentence, detailed explanation with definitions, analysis, examples, or comparisons, a concluding summary highlighting its importance or applications. The target audience is {target_audience}. Exclude any references to visuals, sound effects, video elements, calls to subscribe, or future videos. Focus on clear and engaging prose suitable for an audio format. The text should conclude naturally with a summary of the topic.  **Do not include any headers, subheadings, bullet points, numbered lists, or other formatting markers.  The text should be a single, continuous paragraph or a series of short, cohesive paragraphs.**"
+
+def _llama_title_prompt(topic, style, lang):
+    style = STYLES.get(style, (style,))[0]
+    return f"Create exactly 1 video title (nothing else) in {lang} language about {topic}. The title should have a style for {style}."
+
+def _llama_description_prompt(topic, style, lang):
+    style = STYLES.get(style, (style,))[0]
+    return f"Create exactly 1 short video description of about 30 words (nothing else) in {lang} language about {topic}. The description should have a style for {style} and include hashtags with # symbol for social media."
+
+def create_script_with_gemini(topic, style, length,  lang, regenerate=False):
+    """Tạo kịch bản với Gemini dựa trên dữ liệu Wiki hoặc khái niệm gốc (regenerate=True: bỏ qua cache)"""
+    prompt = _gemini_script_prompt(topic, style, length, lang)
 
     try:    
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=[prompt]
+        return llm_cache.cached_call(
+            llm_cache.make_key("script", GEMINI_MODEL, topic, style, length, lang),
+            lambda: sanitize_text(llm_gateway.generate_content(contents=[prompt]).text),
+            regenerate
         )
-        return sanitize_text(response.text)
     except Exception as e:
         print(f"Lỗi khi tạo kịch bản với Gemini: {e}")
         print("Đang chuyển sang sử dụng Llama làm mô hình dự phòng...")
         return create_script_with_llama(topic, style, length, lang)
     
-def create_title_with_gemini(topic, style, lang):
-    """Tạo tiêu đề với Gemini dựa trên dữ liệu Wiki hoặc khái niệm gốc"""
-    client = genai.Client()
-    if style == 1:
-        style =  "fun voice for kids"
-    elif style == 2:
-        style = "serious voice for educational content"
-    elif style == 3:
-        style = "serious voice for scientific documents"
-
-    prompt = f"Tạo duy nhất 1 tiêu đề video (không thêm gì khác) trong ngôn ngữ {lang} về {topic}. Tiêu đề có phong cách dành cho {style}."
+def create_title_with_gemini(topic, style, lang, regenerate=False):
+    """Tạo tiêu đề với Gemini dựa trên dữ liệu Wiki hoặc khái niệm gốc (regenerate=True: bỏ qua cache)"""
+    prompt = _gemini_title_prompt(topic, style, lang)
 
     try:    
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=[prompt]
+        return llm_cache.cached_call(
+            llm_cache.make_key("title", GEMINI_MODEL, topic, style, lang),
+            lambda: sanitize_text(llm_gateway.generate_content(contents=[prompt]).text),
+            regenerate
         )
-        return sanitize_text(response.text)
     except Exception as e:
         print(f"Lỗi khi tạo kịch bản với Gemini: {e}")
         print("Đang chuyển sang sử dụng Llama làm mô hình dự phòng...")
         return create_title_with_llama(topic, style, lang)
 
-def create_description_with_gemini(topic, style, lang):
-    client = genai.Client()
-    if style == 1:
-        style =  "fun voice for kids"
-    elif style == 2:
-        style = "serious voice for educational content"
-    elif style == 3:
-        style = "serious voice for scientific documents"
-
-    prompt = f"Tạo duy nhất 1 mô tả video ngắn cỡ 30 chữ (không thêm gì khác) trong ngôn ngữ {lang} về {topic}. Mô tả có phong cách dành cho {style} có kèm theo cái hashtag có dấu # để đăng mạng xã hội."
+def create_description_with_gemini(topic, style, lang, regenerate=False):
+    prompt = _gemini_description_prompt(topic, style, lang)
 
     try:    
-        response = client.models.generate_content(
-            model="gemini-2.0-flash",
-            contents=[prompt]
+        return llm_cache.cached_call(
+            llm_cache.make_key("description", GEMINI_MODEL, topic, style, lang),
+            lambda: llm_gateway.generate_content(contents=[prompt]).text,
+            regenerate
         )
-        return response.text
     except Exception as e:
         print(f"Lỗi khi tạo kịch bản với Gemini: {e}")
         print("Đang chuyển sang sử dụng Llama làm mô hình dự phòng...")
@@ -100,53 +107,11 @@ def create_description_with_gemini(topic, style, lang):
 
 def create_script_with_llama(topic, style, length, lang):
     """Tạo kịch bản với Llama dựa trên dữ liệu Wiki hoặc khái niệm gốc"""
-    # Xác định phong cách dựa trên style
-    if style == 1:
-        style =  "fun voice for kids"
-        target_audience =  "children"
-    elif style == 2:
-        style = "serious voice for educational content"
-        target_audience = "students"
-    elif style == 3:
-        style = "serious voice for scientific documents"
-        target_audience = "scientists"
-
-    prompt = f"Write a {length} words science text in the language {lang} about {topic}. The text should be {style} and written for reading aloud. Use correct punctuation and grammar, ensuring a clear topic sentence, detailed explanation with definitions, analysis, examples, or comparisons, a concluding summary highlighting its importance or applications. The target audience is {target_audience}. Exclude any references to visuals, sound effects, video elements, calls to subscribe, or future videos. Focus on clear and engaging prose suitable for an audio format. The text should conclude naturally with a summary of the topic.  **Do not include any headers, subheadings, bullet points, numbered lists, or other formatting markers.  The text should be a single, continuous paragraph or a series of short, cohesive paragraphs.**"
+    prompt = _llama_script_prompt(topic, style, length, lang)
 
     try:
-        # Lấy thông tin xác thực từ biến môi trường
-        ACCOUNT_ID = os.environ.get("CLOUDFLARE_ACCOUNT_ID")
-        AUTH_TOKEN = os.environ.get("CLOUDFLARE_AUTH_TOKEN")
-        
-        # Kiểm tra xem có đủ thông tin xác thực không
-        if not ACCOUNT_ID or not AUTH_TOKEN:
-            raise ValueError("Missing Cloudflare credentials")
-            
-        # Gửi yêu cầu đến API Cloudflare
-        response = requests.post(
-            f"https://api.cloudflare.com/client/v4/accounts/{ACCOUNT_ID}/ai/run/@cf/meta/llama-4-scout-17b-16e-instruct",
-            headers={"Authorization": f"Bearer {AUTH_TOKEN}"},
-            json={
-                "messages": [
-                    {"role": "system", "content": "You are a friendly assistant"},
-                    {"role": "user", "content": prompt}
-                ]
-            }
-        )
-        
-        # Kiểm tra xem yêu cầu có thành công không
-        response.raise_for_status()
-        
-        # Phân tích kết quả JSON
-        result = response.json()
-        
-        # Truy cập nội dung từ phản hồi JSON
-        # Cloudflare Workers AI thường có cấu trúc phản hồi là: {'result': {'response': 'content'}}
-        if 'result' in result and 'response' in result['result']:
-            content = result['result']['response']
-        else:
-            # Cấu trúc khác có thể là: {'success': true, 'result': 'content'}
-            content = result.get('result', '')
+        # Gửi yêu cầu đến API Cloudflare qua session dùng chung (giữ kết nối)
+        content = llm_gateway.llama_chat(prompt)
             
         return sanitize_text(content)
         
@@ -163,48 +128,11 @@ def create_script_with_llama(topic, style, length, lang):
 
 def create_title_with_llama(topic, style, lang):
     """Tạo tiêu đề với Llama khi Gemini gặp lỗi"""
-    # Xác định phong cách dựa trên style
-    if style == 1:
-        style = "fun voice for kids"
-    elif style == 2:
-        style = "serious voice for educational content"
-    elif style == 3:
-        style = "serious voice for scientific documents"
-
-    prompt = f"Create exactly 1 video title (nothing else) in {lang} language about {topic}. The title should have a style for {style}."
+    prompt = _llama_title_prompt(topic, style, lang)
 
     try:
-        # Lấy thông tin xác thực từ biến môi trường
-        ACCOUNT_ID = os.environ.get("CLOUDFLARE_ACCOUNT_ID")
-        AUTH_TOKEN = os.environ.get("CLOUDFLARE_AUTH_TOKEN")
-        
-        # Kiểm tra xem có đủ thông tin xác thực không
-        if not ACCOUNT_ID or not AUTH_TOKEN:
-            raise ValueError("Missing Cloudflare credentials")
-            
-        # Gửi yêu cầu đến API Cloudflare
-        response = requests.post(
-            f"https://api.cloudflare.com/client/v4/accounts/{ACCOUNT_ID}/ai/run/@cf/meta/llama-4-scout-17b-16e-instruct",
-            headers={"Authorization": f"Bearer {AUTH_TOKEN}"},
-            json={
-                "messages": [
-                    {"role": "system", "content": "You are a friendly assistant"},
-                    {"role": "user", "content": prompt}
-                ]
-            }
-        )
-        
-        # Kiểm tra xem yêu cầu có thành công không
-        response.raise_for_status()
-        
-        # Phân tích kết quả JSON
-        result = response.json()
-        
-        # Truy cập nội dung từ phản hồi JSON
-        if 'result' in result and 'response' in result['result']:
-            content = result['result']['response']
-        else:
-            content = result.get('result', '')
+        # Gửi yêu cầu đến API Cloudflare qua session dùng chung (giữ kết nối)
+        content = llm_gateway.llama_chat(prompt)
             
         return sanitize_text(content)
         
@@ -214,51 +142,130 @@ def create_title_with_llama(topic, style, lang):
     
 def create_description_with_llama(topic, style, lang):
     """Tạo mô tả với Llama khi Gemini gặp lỗi"""
-    # Xác định phong cách dựa trên style
-    if style == 1:
-        style = "fun voice for kids"
-    elif style == 2:
-        style = "serious voice for educational content"
-    elif style == 3:
-        style = "serious voice for scientific documents"
-
-    prompt = f"Create exactly 1 short video description of about 30 words (nothing else) in {lang} language about {topic}. The description should have a style for {style} and include hashtags with # symbol for social media."
+    prompt = _llama_description_prompt(topic, style, lang)
 
     try:
-        # Lấy thông tin xác thực từ biến môi trường
-        ACCOUNT_ID = os.environ.get("CLOUDFLARE_ACCOUNT_ID")
-        AUTH_TOKEN = os.environ.get("CLOUDFLARE_AUTH_TOKEN")
-        
-        # Kiểm tra xem có đủ thông tin xác thực không
-        if not ACCOUNT_ID or not AUTH_TOKEN:
-            raise ValueError("Missing Cloudflare credentials")
-            
-        # Gửi yêu cầu đến API Cloudflare
-        response = requests.post(
-            f"https://api.cloudflare.com/client/v4/accounts/{ACCOUNT_ID}/ai/run/@cf/meta/llama-4-scout-17b-16e-instruct",
-            headers={"Authorization": f"Bearer {AUTH_TOKEN}"},
-            json={
-                "messages": [
-                    {"role": "system", "content": "You are a friendly assistant"},
-                    {"role": "user", "content": prompt}
-                ]
-            }
-        )
-        
-        # Kiểm tra xem yêu cầu có thành công không
-        response.raise_for_status()
-        
-        # Phân tích kết quả JSON
-        result = response.json()
-        
-        # Truy cập nội dung từ phản hồi JSON
-        if 'result' in result and 'response' in result['result']:
-            content = result['result']['response']
-        else:
-            content = result.get('result', '')
+        # Gửi yêu cầu đến API Cloudflare qua session dùng chung (giữ kết nối)
+        content = llm_gateway.llama_chat(prompt)
             
         return content
         
     except Exception as e:
         print(f"Lỗi khi tạo mô tả với Llama: {e}")
-        return f"Khám phá {topic} trong video giáo dục này. #giáodục #{topic.replace(' ', '')}"
\ No newline at end of file
+        return f"Khám phá {topic} trong video giáo dục này. #giáodục #{topic.replace(' ', '')}"
+
+# Phiên bản bất đồng bộ: dùng API async của Gemini và aiohttp cho Llama, không chặn event loop của controller.
+# Gemini và Llama dự phòng chạy qua llm_gateway.with_fallback (ngắt mạch, hedging); Llama được gọi với
+# raise_errors=True để nội dung mặc định không "thắng" một câu trả lời Gemini chỉ đến chậm.
+
+async def create_script_with_gemini_async(topic, style, length, lang, regenerate=False):
+    """Giống create_script_with_gemini nhưng không chặn event loop"""
+    prompt = _gemini_script_prompt(topic, style, length, lang)
+
+    async def generate():
+        response = await llm_gateway.agenerate_content(contents=[prompt])
+        return sanitize_text(response.text)
+
+    async def gemini():
+        return await llm_cache.acached_call(
+            llm_cache.make_key("script", GEMINI_MODEL, topic, style, length, lang), generate, regenerate
+        )
+
+    try:
+        return await llm_gateway.with_fallback(
+            gemini, lambda: create_script_with_llama_async(topic, style, length, lang, raise_errors=True)
+        )
+    except Exception as e:
+        return _script_without_llama(topic, e)
+
+async def create_title_with_gemini_async(topic, style, lang, regenerate=False):
+    """Giống create_title_with_gemini nhưng không chặn event loop"""
+    prompt = _gemini_title_prompt(topic, style, lang)
+
+    async def generate():
+        response = await llm_gateway.agenerate_content(contents=[prompt])
+        return sanitize_text(response.text)
+
+    async def gemini():
+        return await llm_cache.acached_call(
+            llm_cache.make_key("title", GEMINI_MODEL, topic, style, lang), generate, regenerate
+        )
+
+    try:
+        return await llm_gateway.with_fallback(
+            gemini, lambda: create_title_with_llama_async(topic, style, lang, raise_errors=True)
+        )
+    except Exception as e:
+        return _title_without_llama(topic, e)
+
+async def create_description_with_gemini_async(topic, style, lang, regenerate=False):
+    """Giống create_description_with_gemini nhưng không chặn event loop"""
+    prompt = _gemini_description_prompt(topic, style, lang)
+
+    async def generate():
+        response = await llm_gateway.agenerate_content(contents=[prompt])
+        return response.text
+
+    async def gemini():
+        return await llm_cache.acached_call(
+            llm_cache.make_key("description", GEMINI_MODEL, topic, style, lang), generate, regenerate
+        )
+
+    try:
+        return await llm_gateway.with_fallback(
+            gemini, lambda: create_description_with_llama_async(topic, style, lang, raise_errors=True)
+        )
+    except Exception as e:
+        return _description_without_llama(topic, e)
+
+def _script_without_llama(topic, error):
+    """Nội dung mặc định khi Llama lỗi"""
+    if isinstance(error, aiohttp.ClientError):
+        print(f"Lỗi kết nối API Cloudflare: {error}")
+        return f"This is a script about {topic} (generated without Llama due to a connection error)."
+    if isinstance(error, ValueError):
+        print(f"Lỗi cấu hình: {error}")
+        return f"This is a script about {topic} (generated without Llama due to a configuration error)."
+    print(f"Lỗi khi tạo kịch bản với Llama: {error}")
+    return f"This is a script about {topic} (generated without Llama due to an error)."
+
+def _title_without_llama(topic, error):
+    print(f"Lỗi khi tạo tiêu đề với Llama: {error}")
+    return f"Video about {topic}"
+
+def _description_without_llama(topic, error):
+    print(f"Lỗi khi tạo mô tả với Llama: {error}")
+    return f"Khám phá {topic} trong video giáo dục này. #giáodục #{topic.replace(' ', '')}"
+
+async def create_script_with_llama_async(topic, style, length, lang, raise_errors=False):
+    """raise_errors=True: ném lỗi thay vì trả nội dung mặc định"""
+    prompt = _llama_script_prompt(topic, style, length, lang)
+
+    try:
+        content = await llm_gateway.allama_chat(prompt)
+        return sanitize_text(content)
+    except Exception as e:
+        if raise_errors:
+            raise
+        return _script_without_llama(topic, e)
+
+async def create_title_with_llama_async(topic, style, lang, raise_errors=False):
+    prompt = _llama_title_prompt(topic, style, lang)
+
+    try:
+        content = await llm_gateway.allama_chat(prompt)
+        return sanitize_text(content)
+    except Exception as e:
+        if raise_errors:
+            raise
+        return _title_without_llama(topic, e)
+
+async def create_description_with_llama_async(topic, style, lang, raise_errors=False):
+    prompt = _llama_description_prompt(topic, style, lang)
+
+    try:
+        return await llm_gateway.allama_chat(prompt)
+    except Exception as e:
+        if raise_errors:
+            raise
+        return _description_without_llama(topic, e)
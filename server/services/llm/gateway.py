@@ -0,0 +1,327 @@
+import asyncio
+import atexit
+import itertools
+import os
+import threading
+import time
+
+import aiohttp
+import requests
+from google import genai
+from google.genai import types
+from requests.adapters import HTTPAdapter
+
+from config.llm import (
+    GEMINI_MODEL, LLM_GEMINI_POOL_SIZE, LLM_GEMINI_TIMEOUT,
+    CLOUDFLARE_LLAMA_MODEL, LLM_HTTP_POOL_SIZE, LLM_HTTP_TIMEOUT,
+    GEMINI_BASE_URL, CLOUDFLARE_API_BASE_URL, LLM_GEMINI_DEADLINE, LLM_LLAMA_DEADLINE,
+    LLM_BREAKER_WINDOW, LLM_BREAKER_ERROR_RATE, LLM_BREAKER_MIN_CALLS, LLM_BREAKER_COOLDOWN_SECONDS,
+    LLM_HEDGE_ENABLED, LLM_HEDGE_QUANTILE, LLM_HEDGE_MIN_DELAY, LLM_HEDGE_MIN_SAMPLES
+)
+from services.llm.resilience import CircuitBreaker, CircuitOpenError, LatencyWindow, HedgedCall
+
+# Cổng gọi LLM dùng chung cho cả ứng dụng: client Gemini và session HTTP tới Cloudflare được tạo một lần
+# và dùng lại (giữ kết nối TLS), mỗi model có bộ đếm số lần gọi, lỗi và độ trễ.
+# Các route tạo event loop mới cho mỗi request nên lời gọi async chạy trên một loop nền dùng chung,
+# nơi client async của Gemini và session aiohttp sống suốt tiến trình.
+# Mỗi model Gemini có ngắt mạch riêng (ném CircuitOpenError ngay khi model đó đang lỗi nhiều, lỗi của model tạo ảnh
+# không chặn model tạo kịch bản) và thời gian tối đa cho mỗi lời gọi async;
+# with_fallback chạy Gemini kèm Llama dự phòng (hedging theo độ trễ gần đây của GEMINI_MODEL).
+
+
+class LLMMetrics:
+    """Bộ đếm theo model: số lần gọi, số lỗi, tổng/lớn nhất độ trễ"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models = {}
+
+    def record(self, model, seconds, error=None):
+        with self._lock:
+            item = self._models.setdefault(model, {
+                "calls": 0,
+                "errors": 0,
+                "latency_seconds_total": 0.0,
+                "latency_seconds_max": 0.0,
+                "last_error": None,
+            })
+            item["calls"] += 1
+            item["latency_seconds_total"] += seconds
+            item["latency_seconds_max"] = max(item["latency_seconds_max"], seconds)
+            if error is not None:
+                item["errors"] += 1
+                item["last_error"] = f"{type(error).__name__}: {error}"[:300]
+
+    def stats(self):
+        with self._lock:
+            models = {name: dict(item) for name, item in self._models.items()}
+        for item in models.values():
+            item["latency_seconds_avg"] = round(item["latency_seconds_total"] / item["calls"], 4)
+            item["latency_seconds_total"] = round(item["latency_seconds_total"], 4)
+            item["latency_seconds_max"] = round(item["latency_seconds_max"], 4)
+        return models
+
+
+class LLMGateway:
+    def __init__(self, gemini_pool_size=LLM_GEMINI_POOL_SIZE, gemini_timeout=LLM_GEMINI_TIMEOUT,
+                 http_pool_size=LLM_HTTP_POOL_SIZE, http_timeout=LLM_HTTP_TIMEOUT):
+        self.gemini_pool_size = max(1, gemini_pool_size)
+        self.gemini_timeout = gemini_timeout
+        self.http_pool_size = http_pool_size
+        self.http_timeout = http_timeout
+        self.metrics = LLMMetrics()
+        self._lock = threading.Lock()
+        self._gemini_clients = None
+        self._gemini_cycle = None
+        self._session = None
+        # Loop nền cho các lời gọi async và session aiohttp của nó (chỉ dùng trên loop nền)
+        self._loop = None
+        self._aiohttp_session = None
+        self.gemini_deadline = LLM_GEMINI_DEADLINE
+        self.llama_deadline = LLM_LLAMA_DEADLINE
+        # Ngắt mạch và độ trễ theo model, tạo ở lần gọi đầu tiên của model
+        self._breakers = {}
+        self._latencies = {}
+        self.hedged = HedgedCall(self._hedge_delay)
+
+    def _gemini_client(self):
+        """Lấy client Gemini kế tiếp (xoay vòng) trong pool, tạo pool ở lần gọi đầu tiên"""
+        with self._lock:
+            if self._gemini_clients is None:
+                self._gemini_clients = [self._make_gemini_client() for _ in range(self.gemini_pool_size)]
+                self._gemini_cycle = itertools.cycle(self._gemini_clients)
+            return next(self._gemini_cycle)
+
+    def _make_gemini_client(self):
+        return genai.Client(
+            api_key=os.getenv("GOOGLE_API_KEY") or None,
+            # google-genai tính timeout theo mili giây
+            http_options=types.HttpOptions(
+                timeout=int(self.gemini_timeout * 1000),
+                base_url=GEMINI_BASE_URL or None
+            )
+        )
+
+    def _background_loop(self):
+        """Event loop chạy nền cho mọi lời gọi async, khởi động ở lần gọi đầu tiên"""
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="llm-gateway-loop", daemon=True).start()
+                self._loop = loop
+                atexit.register(self.close)
+            return self._loop
+
+    async def _run_in_background(self, make_coroutine):
+        """
+        Chạy make_coroutine() trên loop nền và chờ kết quả từ loop của request.
+        Hủy lời gọi ở đây (hết thời gian tối đa, hedging) thì lời gọi trên loop nền cũng bị hủy.
+        """
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(make_coroutine(), self._background_loop()))
+
+    def _aiohttp(self):
+        """Session aiohttp dùng chung, chỉ gọi trên loop nền"""
+        if self._aiohttp_session is None:
+            self._aiohttp_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.http_pool_size),
+                timeout=aiohttp.ClientTimeout(total=self.http_timeout)
+            )
+        return self._aiohttp_session
+
+    def close(self):
+        """Đóng session aiohttp và dừng loop nền"""
+        loop = self._loop
+        if loop is None or not loop.is_running():
+            return
+
+        async def shutdown():
+            if self._aiohttp_session is not None:
+                await self._aiohttp_session.close()
+
+        try:
+            asyncio.run_coroutine_threadsafe(shutdown(), loop).result(timeout=5)
+        except Exception as e:
+            print(f"Lỗi khi đóng session LLM: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+
+    def _http_session(self):
+        with self._lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.http_pool_size, pool_maxsize=self.http_pool_size)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._session = session
+            return self._session
+
+    def breaker(self, model=GEMINI_MODEL):
+        """Ngắt mạch của một model Gemini"""
+        with self._lock:
+            if model not in self._breakers:
+                self._breakers[model] = CircuitBreaker(
+                    f"gemini:{model}",
+                    window_size=LLM_BREAKER_WINDOW,
+                    error_rate=LLM_BREAKER_ERROR_RATE,
+                    min_calls=LLM_BREAKER_MIN_CALLS,
+                    cooldown_seconds=LLM_BREAKER_COOLDOWN_SECONDS
+                )
+            return self._breakers[model]
+
+    def latency(self, model=GEMINI_MODEL):
+        """Độ trễ các lần gọi thành công gần đây của một model Gemini"""
+        with self._lock:
+            return self._latencies.setdefault(model, LatencyWindow())
+
+    def _record_gemini(self, model, seconds, error=None):
+        self.metrics.record(f"gemini:{model}", seconds, error)
+        self.breaker(model).record(error is None)
+        if error is None:
+            self.latency(model).record(seconds)
+
+    def _check_gemini(self, model):
+        if not self.breaker(model).allow():
+            raise CircuitOpenError(f"Gemini ({model}) đang bị ngắt mạch do lỗi liên tục")
+
+    def generate_content(self, contents, model=GEMINI_MODEL, config=None):
+        """
+        Gọi Gemini generate_content qua client dùng chung, trả về response gốc của google-genai.
+        Ném CircuitOpenError (không gửi request) khi model đang bị ngắt mạch.
+        """
+        self._check_gemini(model)
+        started = time.perf_counter()
+        try:
+            response = self._gemini_client().models.generate_content(model=model, contents=contents, config=config)
+        except Exception as e:
+            self._record_gemini(model, time.perf_counter() - started, e)
+            raise
+        self._record_gemini(model, time.perf_counter() - started)
+        return response
+
+    async def agenerate_content(self, contents, model=GEMINI_MODEL, config=None):
+        """
+        Giống generate_content nhưng dùng API async (client.aio của cùng pool) trên loop nền, không chặn event loop;
+        quá gemini_deadline thì ném TimeoutError.
+        """
+        self._check_gemini(model)
+        started = time.perf_counter()
+        try:
+            client = self._gemini_client()
+            response = await asyncio.wait_for(
+                self._run_in_background(
+                    lambda: client.aio.models.generate_content(model=model, contents=contents, config=config)
+                ),
+                self.gemini_deadline or None
+            )
+        except Exception as e:
+            self._record_gemini(model, time.perf_counter() - started, e)
+            raise
+        self._record_gemini(model, time.perf_counter() - started)
+        return response
+
+    def llama_chat(self, prompt, system="You are a friendly assistant", model=CLOUDFLARE_LLAMA_MODEL):
+        """
+        Gọi Llama trên Cloudflare Workers AI qua session keep-alive, trả về nội dung văn bản.
+        Ném ValueError nếu thiếu thông tin xác thực, requests.exceptions.RequestException nếu lỗi kết nối.
+        """
+        # Lấy thông tin xác thực từ biến môi trường
+        account_id = os.environ.get("CLOUDFLARE_ACCOUNT_ID")
+        auth_token = os.environ.get("CLOUDFLARE_AUTH_TOKEN")
+        if not account_id or not auth_token:
+            raise ValueError("Missing Cloudflare credentials")
+
+        started = time.perf_counter()
+        try:
+            response = self._http_session().post(
+                f"{CLOUDFLARE_API_BASE_URL}/accounts/{account_id}/ai/run/{model}",
+                headers={"Authorization": f"Bearer {auth_token}"},
+                json={
+                    "messages": [
+                        {"role": "system", "content": system},
+                        {"role": "user", "content": prompt}
+                    ]
+                },
+                timeout=self.http_timeout
+            )
+            response.raise_for_status()
+            result = response.json()
+        except Exception as e:
+            self.metrics.record(f"cloudflare:{model}", time.perf_counter() - started, e)
+            raise
+        self.metrics.record(f"cloudflare:{model}", time.perf_counter() - started)
+        return self._llama_content(result)
+
+    async def allama_chat(self, prompt, system="You are a friendly assistant", model=CLOUDFLARE_LLAMA_MODEL):
+        """
+        Giống llama_chat nhưng dùng session aiohttp keep-alive trên loop nền, không chặn event loop.
+        Ném ValueError nếu thiếu thông tin xác thực, aiohttp.ClientError nếu lỗi kết nối, TimeoutError nếu quá llama_deadline.
+        """
+        account_id = os.environ.get("CLOUDFLARE_ACCOUNT_ID")
+        auth_token = os.environ.get("CLOUDFLARE_AUTH_TOKEN")
+        if not account_id or not auth_token:
+            raise ValueError("Missing Cloudflare credentials")
+
+        async def post():
+            async with self._aiohttp().post(
+                f"{CLOUDFLARE_API_BASE_URL}/accounts/{account_id}/ai/run/{model}",
+                headers={"Authorization": f"Bearer {auth_token}"},
+                json={
+                    "messages": [
+                        {"role": "system", "content": system},
+                        {"role": "user", "content": prompt}
+                    ]
+                },
+                timeout=aiohttp.ClientTimeout(total=self.llama_deadline or self.http_timeout)
+            ) as response:
+                response.raise_for_status()
+                return await response.json()
+
+        started = time.perf_counter()
+        try:
+            result = await self._run_in_background(post)
+        except Exception as e:
+            self.metrics.record(f"cloudflare:{model}", time.perf_counter() - started, e)
+            raise
+        self.metrics.record(f"cloudflare:{model}", time.perf_counter() - started)
+        return self._llama_content(result)
+
+    def _hedge_delay(self):
+        """Số giây chờ Gemini trước khi gọi thêm Llama, None nếu không hedging (tắt hoặc chưa đủ mẫu độ trễ)"""
+        if not LLM_HEDGE_ENABLED:
+            return None
+        latency = self.latency(GEMINI_MODEL).quantile(LLM_HEDGE_QUANTILE, LLM_HEDGE_MIN_SAMPLES)
+        if latency is None:
+            return None
+        return max(latency, LLM_HEDGE_MIN_DELAY)
+
+    async def with_fallback(self, primary, fallback):
+        """
+        Chạy primary (lời gọi Gemini), chuyển sang fallback (Llama) khi Gemini lỗi hoặc đang bị ngắt mạch,
+        và khi bật hedging thì gọi thêm fallback nếu Gemini chậm hơn bình thường, lấy kết quả đến trước.
+        primary, fallback: hàm không tham số trả về coroutine; fallback nên ném lỗi thay vì trả nội dung mặc định.
+        """
+        return await self.hedged.run(primary, fallback)
+
+    @staticmethod
+    def _llama_content(result):
+        # Cloudflare Workers AI thường có cấu trúc phản hồi là: {'result': {'response': 'content'}}
+        if isinstance(result.get("result"), dict) and "response" in result["result"]:
+            return result["result"]["response"]
+        # Cấu trúc khác có thể là: {'success': true, 'result': 'content'}
+        return result.get("result", "")
+
+    def stats(self):
+        with self._lock:
+            gemini_clients = len(self._gemini_clients) if self._gemini_clients else 0
+            breakers = dict(self._breakers)
+        return {
+            "gemini_pool_size": self.gemini_pool_size,
+            "gemini_clients": gemini_clients,
+            "http_pool_size": self.http_pool_size,
+            "gemini_breakers": {model: breaker.stats() for model, breaker in breakers.items()},
+            "gemini_latency_p95_seconds": self.latency(GEMINI_MODEL).quantile(0.95),
+            "fallback": {**self.hedged.stats(), "hedge_delay_seconds": self._hedge_delay()},
+            "models": self.metrics.stats(),
+        }
+
+
+llm_gateway = LLMGateway()
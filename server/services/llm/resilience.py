@@ -0,0 +1,173 @@
+import asyncio
+import math
+import threading
+import time
+from collections import deque
+
+# Các thành phần giúp lời gọi LLM chịu lỗi: ngắt mạch khi nhà cung cấp lỗi nhiều,
+# theo dõi độ trễ gần đây để tính mốc gửi yêu cầu dự phòng (hedging), và chạy song song model chính/dự phòng.
+
+
+class CircuitOpenError(Exception):
+    """Nhà cung cấp đang bị ngắt mạch: không gửi request, chuyển ngay sang dự phòng"""
+
+
+class CircuitBreaker:
+    """
+    Ngắt mạch theo tỉ lệ lỗi của window_size lần gọi gần nhất.
+    closed: gọi bình thường; open: từ chối mọi lời gọi trong cooldown_seconds;
+    half_open: cho một lời gọi thử mỗi cooldown_seconds, thành công thì đóng lại, lỗi thì mở tiếp.
+    """
+
+    def __init__(self, name, window_size=20, error_rate=0.5, min_calls=5, cooldown_seconds=30.0):
+        self.name = name
+        self.window_size = window_size
+        self.error_rate = error_rate
+        self.min_calls = min_calls
+        self.cooldown_seconds = cooldown_seconds
+        self.state = "closed"
+        self.opened = 0
+        self.rejected = 0
+        self._results = deque(maxlen=window_size)  # True: thành công
+        self._opened_at = None
+        self._probe_at = None
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            now = time.monotonic()
+            if self.state == "open" and now - self._opened_at >= self.cooldown_seconds:
+                self.state = "half_open"
+                self._probe_at = None
+            # Lời gọi thử có thể không kết thúc (bị hủy, trúng cache): sau cooldown cho thử lại
+            if self.state == "half_open" and (self._probe_at is None or now - self._probe_at >= self.cooldown_seconds):
+                self._probe_at = now
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, success):
+        with self._lock:
+            if self.state == "half_open":
+                if success:
+                    self.state = "closed"
+                    self._results.clear()
+                else:
+                    self._open()
+                return
+            self._results.append(success)
+            failures = self._results.count(False)
+            if (self.state == "closed" and len(self._results) >= self.min_calls
+                    and failures / len(self._results) >= self.error_rate):
+                self._open()
+
+    def _open(self):
+        self.state = "open"
+        self.opened += 1
+        self._opened_at = time.monotonic()
+        self._results.clear()
+
+    def stats(self):
+        with self._lock:
+            calls = len(self._results)
+            return {
+                "state": self.state,
+                "recent_calls": calls,
+                "recent_error_rate": round(self._results.count(False) / calls, 4) if calls else 0.0,
+                "opened": self.opened,
+                "rejected": self.rejected,
+            }
+
+
+class LatencyWindow:
+    """Độ trễ của window_size lần gọi thành công gần nhất"""
+
+    def __init__(self, window_size=100):
+        self._samples = deque(maxlen=window_size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q, min_samples=1):
+        """Phân vị q (0-1) theo phương pháp nearest-rank, None nếu chưa đủ min_samples mẫu"""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples or len(samples) < min_samples:
+            return None
+        return samples[min(len(samples) - 1, max(0, math.ceil(q * len(samples)) - 1))]
+
+
+class HedgedCall:
+    """
+    Chạy primary, nếu sau hedge_delay() giây chưa xong thì chạy thêm fallback và lấy kết quả thành công đến trước.
+    primary lỗi (kể cả bị ngắt mạch) thì chuyển ngay sang fallback. Cả hai đều lỗi thì ném lỗi của fallback.
+    """
+
+    def __init__(self, hedge_delay):
+        self.hedge_delay = hedge_delay
+        self.calls = 0
+        self.fallbacks = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._lock = threading.Lock()
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    async def run(self, primary, fallback):
+        """primary, fallback: hàm không tham số trả về coroutine"""
+        self._count("calls")
+        primary_task = asyncio.ensure_future(primary())
+        try:
+            delay = self.hedge_delay()
+            if delay is not None:
+                done, _ = await asyncio.wait({primary_task}, timeout=delay)
+                if not done:
+                    self._count("hedges")
+                    return await self._first_success(primary_task, asyncio.ensure_future(fallback()))
+            try:
+                return await primary_task
+            except Exception as e:
+                if not isinstance(e, CircuitOpenError):
+                    print(f"Lỗi khi gọi model chính: {e}")
+                print("Đang chuyển sang sử dụng mô hình dự phòng...")
+                self._count("fallbacks")
+                return await fallback()
+        finally:
+            if not primary_task.done():
+                primary_task.cancel()
+
+    async def _first_success(self, primary_task, fallback_task):
+        pending = {primary_task, fallback_task}
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # Nếu cả hai cùng xong thì ưu tiên model chính
+                for task in sorted(done, key=lambda task: task is not primary_task):
+                    if task.exception() is None:
+                        if task is fallback_task:
+                            self._count("hedge_wins")
+                        return task.result()
+                    if task is primary_task and not isinstance(task.exception(), CircuitOpenError):
+                        print(f"Lỗi khi gọi model chính: {task.exception()}")
+                    if task is fallback_task or error is None:
+                        error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "fallbacks": self.fallbacks,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+            }
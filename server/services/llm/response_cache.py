@@ -0,0 +1,134 @@
+import hashlib
+import json
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from config.llm import LLM_CACHE_ENABLED, LLM_CACHE_TTL_SECONDS, LLM_CACHE_MAX_BYTES
+
+
+def _normalize(value):
+    """Chuẩn hóa tham số để các yêu cầu giống nhau về nghĩa dùng chung một khóa ("Quang hợp " và "quang  hợp")"""
+    if isinstance(value, str):
+        text = " ".join(unicodedata.normalize("NFC", value).split()).casefold()
+        # Số gửi lên dưới dạng chuỗi (style="1", length="100") trùng khóa với số
+        return int(text) if text.isdigit() else text
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+class LLMResponseCache:
+    """
+    Cache kết quả LLM trong bộ nhớ của tiến trình: TTL cho mỗi mục, giới hạn tổng dung lượng (LRU).
+    Chỉ lưu kết quả của lần gọi thành công, không lưu nội dung dự phòng khi model lỗi.
+    """
+
+    def __init__(self, ttl_seconds, max_bytes, enabled=True):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.saved_seconds = 0.0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, size, expires_at, seconds), cũ nhất ở đầu
+        self._total_bytes = 0
+
+    @staticmethod
+    def make_key(operation, model, *params):
+        """Khóa từ thao tác, model và các tham số đã chuẩn hóa (nội dung dài chỉ đóng góp qua hash)"""
+        payload = json.dumps([operation, model, *[_normalize(param) for param in params]], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Giá trị đã cache hoặc None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] <= time.time():
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            # Mỗi lần trúng cache tiết kiệm được khoảng thời gian lần gọi model đã tốn
+            self.saved_seconds += entry[3]
+            return entry[0]
+
+    def put(self, key, value, seconds=0.0):
+        """Lưu giá trị (phải chuyển được sang JSON) kèm thời gian đã tốn để tạo ra nó"""
+        if not self.enabled or value is None:
+            return
+        size = len(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, size, time.time() + self.ttl_seconds, seconds)
+            self._total_bytes += size
+            self._evict()
+
+    def cached_call(self, key, generate, regenerate=False):
+        """
+        Giá trị trong cache, hoặc kết quả của generate() (được lưu lại).
+        regenerate=True bỏ qua giá trị đã cache và ghi đè bằng kết quả mới. Lỗi của generate() được ném ra, không cache.
+        """
+        if not regenerate:
+            value = self.get(key)
+            if value is not None:
+                return value
+        started = time.perf_counter()
+        value = generate()
+        self.put(key, value, time.perf_counter() - started)
+        return value
+
+    async def acached_call(self, key, generate, regenerate=False):
+        """Giống cached_call với generate() là coroutine"""
+        if not regenerate:
+            value = self.get(key)
+            if value is not None:
+                return value
+        started = time.perf_counter()
+        value = await generate()
+        self.put(key, value, time.perf_counter() - started)
+        return value
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total_bytes -= entry[1]
+
+    def _evict(self):
+        """Xóa các mục ít được dùng nhất cho tới khi nằm trong giới hạn (gọi khi đã giữ lock)"""
+        while self._total_bytes > self.max_bytes and self._entries:
+            _, entry = self._entries.popitem(last=False)
+            self._total_bytes -= entry[1]
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "latency_saved_seconds": round(self.saved_seconds, 4),
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "entries": len(self._entries),
+                "total_bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+            }
+
+
+llm_cache = LLMResponseCache(LLM_CACHE_TTL_SECONDS, LLM_CACHE_MAX_BYTES, enabled=LLM_CACHE_ENABLED)
@@ -33,13 +33,15 @@ async def upload_blob_to_r2(blob, file_name):
     except Exception as e:
         raise Exception(f"Upload failed: {str(e)}")
 
-async def upload_to_r2(file_path, file_name):
+async def upload_to_r2(file_path, file_name, content_type=None):
     """Upload file to R2 storage and return public URL"""
     loop = asyncio.get_event_loop()
     try:
+        # Content-Type giúp trình duyệt phát trực tiếp các định dạng như Ogg/M4A
+        extra_args = {"ContentType": content_type} if content_type else None
         # Upload file to R2
         await loop.run_in_executor(None, lambda: s3_client.upload_file(
-            file_path, R2_BUCKET, file_name
+            file_path, R2_BUCKET, file_name, ExtraArgs=extra_args
         ))
         
         # Return public URL format
@@ -48,6 +50,24 @@ async def upload_to_r2(file_path, file_name):
     except Exception as e:
         raise Exception(f"Upload failed: {str(e)}")
     
+async def download_from_r2(url):
+    """Download file from R2 storage by its public URL and return bytes"""
+    loop = asyncio.get_event_loop()
+    try:
+        # Public URL format: {R2_PUBLIC_URL}/{file_name}
+        if R2_PUBLIC_URL and url.startswith(f"{R2_PUBLIC_URL}/"):
+            file_name = url[len(R2_PUBLIC_URL) + 1:]
+        else:
+            file_name = url.split("/", 3)[-1]
+
+        response = await loop.run_in_executor(None, lambda: s3_client.get_object(
+            Bucket=R2_BUCKET, Key=file_name
+        ))
+        return await loop.run_in_executor(None, response["Body"].read)
+
+    except Exception as e:
+        raise Exception(f"Download failed: {str(e)}")
+
 async def delete_from_r2(url):
     """Delete file from R2 storage"""
     loop = asyncio.get_event_loop()
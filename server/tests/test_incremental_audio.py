@@ -0,0 +1,91 @@
+"""
+Kiểm tra cập nhật tăng dần (regenerate_audio_incrementally) với engine edge-tts giả lập, không cần mạng.
+
+Chạy từ thư mục server:
+    python -m pytest tests
+"""
+import asyncio
+import json
+
+import pytest
+
+from benchmarks.fake_tts import fake_engines
+from services.audio import audio_service
+from services.audio.mp3_frames import Mp3FrameIndex
+from services.audio.tts_cache import tts_cache
+
+LANGUAGE = "vi-vn"
+OLD_SCRIPT = (
+    "Tế bào là đơn vị cơ bản của sự sống. Năng lượng ánh sáng được cây xanh hấp thụ. "
+    "Phân tử nước gồm hai nguyên tử hydro. Trái đất quay quanh mặt trời."
+)
+EDITED = ("Năng lượng ánh sáng được cây xanh hấp thụ.", "Năng lượng ánh sáng mặt trời được lá cây hấp thụ.")
+NEW_SCRIPT = OLD_SCRIPT.replace(*EDITED)
+
+
+@pytest.fixture
+def engine_calls(monkeypatch):
+    """Các câu được gửi tới engine giả lập (cache TTS bị tắt để mọi câu tổng hợp lại đều gọi engine)"""
+    monkeypatch.setattr(tts_cache, "enabled", False)
+    calls = []
+    with fake_engines():
+        fake = audio_service._fetch_edge_tts_bytes
+
+        async def counting(index, sentence, *args):
+            calls.append(sentence)
+            return await fake(index, sentence, *args)
+
+        audio_service._fetch_edge_tts_bytes = counting
+        yield calls
+
+
+def _generate(script, output_file):
+    output_file, timings_string, failed = asyncio.run(audio_service.process_script_to_audio_and_timings(
+        script, LANGUAGE, engine="edge_tts", output_file=str(output_file)
+    ))
+    assert not failed
+    with open(output_file, "rb") as f:
+        return f.read(), json.loads(timings_string)
+
+
+def _regenerate(old_data, old_timings, output_file):
+    output_file, timings_string, failed, reencoded = asyncio.run(audio_service.regenerate_audio_incrementally(
+        NEW_SCRIPT, old_data, old_timings, LANGUAGE, engine="edge_tts", output_file=str(output_file)
+    ))
+    assert not failed
+    with open(output_file, "rb") as f:
+        return f.read(), json.loads(timings_string), reencoded
+
+
+def test_incremental_update_matches_full_generation(tmp_path, engine_calls):
+    old_data, old_timings = _generate(OLD_SCRIPT, tmp_path / "old.mp3")
+    expected_data, expected_timings = _generate(NEW_SCRIPT, tmp_path / "full.mp3")
+    engine_calls.clear()
+
+    data, timings, reencoded = _regenerate(old_data, old_timings, tmp_path / "incremental.mp3")
+
+    assert engine_calls == [EDITED[1]]
+    assert not reencoded
+    assert data == expected_data
+    assert timings == expected_timings
+
+
+def test_sentence_starting_inside_bit_reservoir_is_resynthesized(tmp_path, engine_calls):
+    old_data, old_timings = _generate(OLD_SCRIPT, tmp_path / "old.mp3")
+    expected_data, expected_timings = _generate(NEW_SCRIPT, tmp_path / "full.mp3")
+    engine_calls.clear()
+
+    # Frame đầu của câu thứ ba lấy dữ liệu từ frame trước (main_data_begin > 0, MPEG-2 mono không CRC)
+    old_track = Mp3FrameIndex(old_data)
+    offset = old_track.frames[old_track._nearest_boundary(old_timings[2]["start_time"])][0]
+    old_data = bytearray(old_data)
+    old_data[offset + 4] = 0x20
+    old_data = bytes(old_data)
+    assert not Mp3FrameIndex(old_data).starts_cleanly(old_timings[2]["start_time"])
+
+    data, timings, reencoded = _regenerate(old_data, old_timings, tmp_path / "incremental.mp3")
+
+    assert engine_calls == [EDITED[1], old_timings[2]["content"]]
+    assert not reencoded
+    assert data == expected_data
+    assert timings == expected_timings
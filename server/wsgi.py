@@ -0,0 +1,4 @@
+from app import create_app
+
+# Điểm vào cho WSGI server, ví dụ: gunicorn wsgi:app
+app = create_app()